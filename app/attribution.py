@@ -0,0 +1,95 @@
+"""
+Who spoke when, from the separate mic ("me") and loopback ("remote") signals.
+
+The recorder labels every writer frame (100ms) as silence, local speech, remote
+speech or overlap from the per-source VAD activity and streams the labels to a
+sidecar next to the recording: meeting_<timestamp>.talk, one uint8 label per
+frame (np.fromfile(path, dtype=np.uint8)). Talk-time ratios derived from it are
+stored with the meeting and handed to the LLM so it does not have to diarize
+local vs. remote speakers itself.
+"""
+
+import os
+from typing import Dict, Optional
+import numpy as np
+
+SILENCE = 0
+LOCAL = 1     # Bit 0: mic speech
+REMOTE = 2    # Bit 1: loopback speech
+OVERLAP = 3   # Both
+LABELS = ("silence", "local", "remote", "overlap")
+
+TIMELINE_EXT = ".talk"
+FRAME_DURATION = 0.1
+MIN_ACTIVITY = 0.4 # Fraction of a frame's VAD sub-frames that must be speech
+
+
+def timeline_path(recording_path: str) -> str:
+    """Sidecar path of a recording (or segment manifest)."""
+    return os.path.splitext(recording_path)[0] + TIMELINE_EXT
+
+
+def label(mic_activity, sys_activity, min_activity: float = MIN_ACTIVITY):
+    """Frame label(s) from per-source speech activity (scalars or arrays of fractions)."""
+    return ((np.asarray(mic_activity) >= min_activity).astype(np.uint8)
+            | ((np.asarray(sys_activity) >= min_activity).astype(np.uint8) << 1))
+
+
+class TalkTimeline:
+    """Streams the labels of one recording to its sidecar file."""
+
+    def __init__(self, path: str, frame_duration: float = FRAME_DURATION):
+        self.path = path
+        self.frame_duration = frame_duration
+        self.counts = np.zeros(len(LABELS), dtype=np.int64)
+        self._file = open(path, "wb")
+
+    def add(self, labels):
+        """Appends one label or an array of labels."""
+        labels = np.atleast_1d(np.asarray(labels, dtype=np.uint8))
+        self.counts += np.bincount(labels, minlength=len(LABELS))[:len(LABELS)]
+        self._file.write(labels.tobytes())
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def load_timeline(recording_path: str) -> Optional[np.ndarray]:
+    """Labels of a recording, or None if it has no sidecar (e.g. uploaded files)."""
+    path = timeline_path(recording_path)
+    if not os.path.exists(path):
+        return None
+    return np.fromfile(path, dtype=np.uint8)
+
+
+def talk_time(recording_path: str) -> Optional[Dict[str, float]]:
+    """
+    Share of the recording spent in each state, e.g.
+    {"silence": 0.2, "local": 0.35, "remote": 0.4, "overlap": 0.05}.
+    """
+    labels = load_timeline(recording_path)
+    if labels is None or len(labels) == 0:
+        return None
+    counts = np.bincount(labels, minlength=len(LABELS))[:len(LABELS)]
+    return {name: float(count) / len(labels) for name, count in zip(LABELS, counts)}
+
+
+def talk_time_note(recording_path: str) -> str:
+    """Prompt text describing talk time, or "" if the recording has no timeline."""
+    ratios = talk_time(recording_path)
+    if not ratios:
+        return ""
+    speech = ratios["local"] + ratios["remote"] + ratios["overlap"]
+    if speech <= 0:
+        return ""
+    return (
+        "\nTalk time measured from the separate audio channels: the local user (the person recording, "
+        f"on the microphone) spoke {ratios['local'] / speech:.0%} of the speaking time, remote participants "
+        f"(heard through the computer's audio) {ratios['remote'] / speech:.0%}, and they overlapped "
+        f"{ratios['overlap'] / speech:.0%}. Use this to tell the local user apart from remote speakers "
+        "in the Speakers section.\n"
+    )
@@ -2,27 +2,96 @@ import sounddevice as sd
 import soundfile as sf
 import numpy as np
 import threading
-import queue
 import time
 import os
 import platform
-import re
 from datetime import datetime
+from app.config import Config
+from app.ring_buffer import RingBuffer
+from app.mixer import TimelineMixer
+from app.segments import new_manifest, write_manifest
+from app.vad import VADEngine
+from app.echo_cancel import EchoCanceller
+from app.attribution import TalkTimeline, label, timeline_path
+from app.devices import DeviceRegistry
+from app.audio_utils import SPLIT_CHANNELS_TAG
+from app.wavfile import WavWriter
 
 class AudioRecorder:
+    # recording_format -> (libsndfile format, subtype, file extension)
+    FORMATS = {
+        "wav": ("WAV", "PCM_16", ".wav"),
+        "flac": ("FLAC", "PCM_16", ".flac"),
+        "opus": ("OGG", "OPUS", ".ogg"),
+    }
+    OPUS_SAMPLERATES = (8000, 12000, 16000, 24000, 48000)
+    # "mixed": mic + loopback summed into one signal; "stereo": mic and loopback as separate channels
+    CHANNEL_LAYOUTS = ("mixed", "stereo")
+    # latency_profile -> (seconds of audio per callback, PortAudio latency), used unless low_power_idle.
+    # Smaller blocks react faster but mean more callbacks; "high" latency gives the host
+    # API larger buffers, which avoids overflows on busy machines.
+    LATENCY_PROFILES = {
+        "low-latency": (0.005, "low"),
+        "balanced": (0.02, "high"),
+        "power-saver": (0.1, "high"),
+    }
+
     def __init__(self, output_dir="recordings", samplerate=16000, channels=1):
         self.output_dir = output_dir
         self.samplerate = samplerate
         self.channels = channels
         self.recording = False
-        self.mic_queue = queue.Queue()
-        self.sys_queue = queue.Queue()
+        self.buffer_seconds = Config.CAPTURE_BUFFER_SECONDS
+        self.frame_duration = 0.1 # Seconds of audio mixed per writer iteration
+        self.mic_ring = None
+        self.sys_ring = None
+        self._mic_status = None # Last non-empty callback status, reported by the writer
+        self._sys_status = None
+        self.mixer = None
         self.mic_stream = None
         self.sys_stream = None
         self.writer_thread = None
         self.filename = None
+        self.recording_format = "wav" # See FORMATS; set by MeetingService from settings
+        self._file_format = self.FORMATS["wav"]
+        self.segment_seconds = 0 # Roll to a new file every N seconds; 0 records a single file
+        self.channel_layout = "mixed" # See CHANNEL_LAYOUTS; set by MeetingService from settings
+        self.echo_cancellation = Config.ECHO_CANCELLATION # Remove loopback echo from the mic before mixing
+        self._split = False # Layout of the current recording (True: mic channels, then loopback channels)
+        self.manifest = None # Segment manifest of the current recording (segmented mode only)
+        self.on_segment_closed = None # Called from the writer thread as fn(segment_path, final)
+        self.preroll_seconds = Config.PREROLL_SECONDS # Audio kept while listening, prepended to auto-started recordings
+        self._include_preroll = False
+        self._out_file = None
+        self._out_frames = 0
+        self._timeline = None # Talk timeline sidecar of the current recording
         self.current_mic_rms = 0.0
         self.current_sys_rms = 0.0
+        self.vad = VADEngine(samplerate) # Fed by the writer thread, consumed by MeetingService
+        self.devices = DeviceRegistry(channels)
+        self.switch_fade = 0.01 # Seconds of cross-fade when the mic is switched live
+        self._next_mic = None # [stream, ring, replaced stream, same device] handed to the writer
+        self._next_sys = None # Same for a reopened loopback stream
+        self._switch_lock = threading.Lock()
+        self._reopen_lock = threading.Lock() # One stream replacement (device or blocksize) at a time
+        self._mic_switched = threading.Event()
+        self._sys_switched = threading.Event()
+        self._reopened = False # Last stream swap kept the device, so the echo path still holds
+        # Low-power mode: streams deliver large blocks, and while only monitoring the writer
+        # only runs the VAD on decimated audio (see _monitor_frame)
+        self.low_power_idle = Config.LOW_POWER_IDLE
+        self.idle_block_seconds = Config.IDLE_BLOCK_SECONDS
+        self.latency_profile = Config.LATENCY_PROFILE # See LATENCY_PROFILES; set by MeetingService from settings
+        self._stream_settings = {"mic": (0, None), "sys": (0, None)} # (blocksize, latency) each stream runs with
+        self._callback_counts = {"mic": [0] * 5, "sys": [0] * 5} # See _capture_callback
+        self.stall_seconds = Config.STREAM_STALL_SECONDS # A stream silent this long is restarted
+        self.watchdog_thread = None
+        self._mic_stalled = False # Set while the watchdog replaces a mic that delivers nothing
+        self._watchdog_counts = {"mic": [0, 0], "sys": [0, 0]} # [stalls, restarts]
+        self._last_frame_time = 0.0 # time.monotonic() of the writer's last processed frame
+        self._closed_bytes = 0 # Bytes in the closed segments of the current recording
+        self.flush_seconds = Config.FLUSH_SECONDS # Audio at risk if the process dies
+        self._unflushed_frames = 0
         self.file_closed_event = threading.Event() # Event to signal file closure
         
         if not os.path.exists(output_dir):
@@ -72,230 +141,697 @@ class AudioRecorder:
             print(f"Error finding loopback device: {e}")
             return None
 
-    def _mic_callback(self, indata, frames, time, status):
-        if status:
-            print(f"Mic Status: {status}")
-        self.mic_queue.put(indata.copy())
-        # Calculate RMS for VAD
-        if len(indata) > 0:
-            self.current_mic_rms = np.sqrt(np.mean(indata**2))
-
-    def _sys_callback(self, indata, frames, time, status):
-        if status:
-            print(f"Sys Status: {status}")
-        self.sys_queue.put(indata.copy())
-        # Calculate RMS for VAD (System audio)
-        if len(indata) > 0:
-            self.current_sys_rms = np.sqrt(np.mean(indata**2))
+    def _open_loopback(self, device, ring, blocksize=0, latency=None):
+        """Opens and starts the WASAPI loopback stream into `ring`. Returns None if it cannot be opened."""
+        try:
+            # Method 1: WasapiSettings(loopback=True)
+            stream = sd.InputStream(
+                device=device,
+                callback=self._capture_callback(ring, "sys"),
+                channels=self.channels,
+                samplerate=self.samplerate, # Must match mic for mixing simplicity in _writer
+                blocksize=blocksize,
+                latency=latency,
+                extra_settings=sd.WasapiSettings(loopback=True)
+            )
+            stream.start()
+            print("Loopback started (Method 1).")
+            return stream
+        except TypeError:
+            print("WasapiSettings(loopback=True) failed. Trying Method 2...")
+            try:
+                # Method 2: InputStream(loopback=True)
+                # Note: loopback=True is not standard in all bindings, but we try it.
+                # If it fails, we catch it.
+                # Actually, for sounddevice, loopback is usually via WasapiSettings.
+                # But some forks support it. If it fails, we just catch.
+                stream = sd.InputStream(
+                    device=device,
+                    callback=self._capture_callback(ring, "sys"),
+                    channels=self.channels,
+                    samplerate=self.samplerate,
+                    blocksize=blocksize,
+                    latency=latency
+                    # loopback=True # Removing this as it causes errors in standard lib
+                )
+                stream.start()
+                print("Loopback started (Method 2).")
+                return stream
+            except Exception as e2:
+                print(f"Loopback Method 2 failed: {e2}")
+        except Exception as e:
+            print(f"Loopback failed: {e}")
+        return None
+
+    def _capture_callback(self, ring, source):
+        """
+        Returns a stream callback that copies into `ring`. Each stream gets its own,
+        so a mic stream that is being replaced never writes into its successor's ring.
+        Counts [callbacks, frames, callbacks with status flags, input overflows,
+        input underflows] per source.
+        """
+        write = ring.write
+        status_attr = f"_{source}_status"
+        counts = self._callback_counts[source]
+
+        def callback(indata, frames, time, status):
+            # Runs on the PortAudio thread: copy into the preallocated ring and return.
+            counts[0] += 1
+            counts[1] += frames
+            if status:
+                setattr(self, status_attr, status)
+                counts[2] += 1
+                if status.input_overflow:
+                    counts[3] += 1
+                if status.input_underflow:
+                    counts[4] += 1
+            write(indata, time.inputBufferAdcTime or time.currentTime)
+        return callback
+
+    def _new_ring(self, samplerate):
+        return RingBuffer(int(samplerate * self.buffer_seconds), self.channels)
+
+    def _stream_params(self, samplerate):
+        """
+        (blocksize, latency) streams are opened with: large blocks in low-power
+        mode, otherwise the latency profile's. They stay the same when a recording
+        starts or stops, so a meeting never begins with a stream swap; the writer
+        mixes 0.1s frames and needs no smaller blocks to record.
+        """
+        if self.low_power_idle:
+            return max(1, int(samplerate * self.idle_block_seconds)), "high"
+        block_seconds, latency = self.LATENCY_PROFILES.get(self.latency_profile, self.LATENCY_PROFILES["balanced"])
+        return max(1, int(samplerate * block_seconds)), latency
+
+    @staticmethod
+    def _rms(block):
+        flat = block.reshape(-1)
+        if flat.size == 0:
+            return 0.0
+        return float(np.sqrt(np.dot(flat, flat) / flat.size))
+
+    def _monitor_frame(self, master, slave, mic_on, mic, sys, decimate):
+        """
+        Consumes one frame while only listening in low-power mode, and computes
+        levels and VAD from every `decimate`-th sample. The loopback is not
+        aligned to the mic: speech detection does not need it. Returns False if
+        no frame is ready.
+        """
+        first = mic if mic_on else sys
+        if master.available < len(first):
+            return False
+        master.read_into(first)
+        if mic_on:
+            if slave is not None:
+                sys[slave.read_into(sys):] = 0
+                if slave.available > len(sys): # Keep the loopback from piling up
+                    slave.discard_until(slave.write_position - len(sys))
+            else:
+                sys.fill(0)
+        self._last_frame_time = time.monotonic()
+
+        sys_on = slave is not None or not mic_on
+        self.current_mic_rms = self._rms(mic[::decimate]) if mic_on else 0.0
+        self.current_sys_rms = self._rms(sys[::decimate]) if sys_on else 0.0
+        self.vad.process(mic[::decimate] if mic_on else None, sys[::decimate] if sys_on else None)
+        return True
+
+    def _replay_preroll(self, master, slave, limit):
+        """
+        Rewinds the capture rings so the pre-roll, at most `limit` frames heard
+        since the last recording, is written at the start of the new one.
+        """
+        frames = master.rewind(min(int(self.samplerate * self.preroll_seconds), max(0, limit)))
+        if frames and slave is not None:
+            self._rewind_slave(master, slave, frames)
+        if frames:
+            print(f"Prepending {frames / self.samplerate:.1f}s of pre-roll audio.")
+
+    def _rewind_slave(self, master, slave, frames):
+        """
+        Makes the loopback audio captured with the master's next frame readable
+        again: while monitoring, the loopback is consumed in whole blocks, so it
+        may be read ahead of the mic. Without usable timestamps it is rewound by
+        `frames`.
+        """
+        target = self.mixer.slave_position(master, slave)
+        slave.rewind(frames if target is None else slave.read_position - int(target))
+
+    def _report_capture_problems(self, reported):
+        """Logs callback status flags and ring overflows from the writer thread."""
+        if self._mic_status is not None:
+            print(f"Mic Status: {self._mic_status}")
+            self._mic_status = None
+        if self._sys_status is not None:
+            print(f"Sys Status: {self._sys_status}")
+            self._sys_status = None
+
+        for name, ring in (("Mic", self.mic_ring), ("Sys", self.sys_ring)):
+            if ring is not None and ring.overflows != reported.get(name, 0):
+                reported[name] = ring.overflows
+                print(f"{name} ring overflow: {ring.dropped_frames} frames dropped so far")
+
+    def _open_output(self):
+        """Opens the file the writer appends to (the next segment in segmented mode)."""
+        fmt, subtype, ext = self._file_format
+        if self.manifest is not None:
+            index = len(self.manifest["segments"]) + 1
+            path = os.path.join(self.output_dir, f"{self.manifest['meeting']}_part{index:03d}{ext}")
+            self.manifest["segments"].append({"file": os.path.basename(path), "frames": 0, "complete": False})
+            write_manifest(self.filename, self.manifest)
+        else:
+            path = self.filename
+
+        if self._timeline is None:
+            self._timeline = TalkTimeline(timeline_path(self.filename), self.frame_duration)
+
+        print(f"Opening file: {path}")
+        channels = 2 * self.channels if self._split else self.channels
+        # Lets readers tell split channels from ordinary stereo
+        comment = SPLIT_CHANNELS_TAG if self._split else None
+        if fmt == "WAV":
+            # Keeps its header valid on flush() and switches to RF64 past 4GB
+            self._out_file = WavWriter(path, self.samplerate, channels, comment=comment)
+        else:
+            self._out_file = sf.SoundFile(path, mode='w', samplerate=self.samplerate,
+                                          channels=channels, format=fmt, subtype=subtype)
+            if comment:
+                self._out_file.comment = comment
+        self._out_frames = 0
+        self._unflushed_frames = 0
+
+    def _close_output(self, final=True):
+        """Closes the current file and, in segmented mode, records it in the manifest."""
+        file, self._out_file = self._out_file, None
+        if file is None:
+            return
+        if final and self._timeline is not None:
+            self._timeline.close()
+            self._timeline = None
+        path = file.name
+        try:
+            file.close()
+            self._closed_bytes += os.path.getsize(path)
+        except Exception as e:
+            print(f"Error closing {path}: {e}")
+
+        if self.manifest is not None:
+            segment = self.manifest["segments"][-1]
+            segment["frames"] = self._out_frames
+            segment["complete"] = True
+            self.manifest["complete"] = final
+            write_manifest(self.filename, self.manifest)
+            if self.on_segment_closed:
+                try:
+                    self.on_segment_closed(path, final)
+                except Exception as e:
+                    print(f"Segment callback failed: {e}")
+
+    def _flush_output(self):
+        """Puts what was recorded so far on disk, so that a crash cannot take it along."""
+        self._unflushed_frames = 0
+        try:
+            self._out_file.flush()
+            if self._timeline is not None:
+                self._timeline.flush()
+        except Exception as e:
+            print(f"Error flushing {self._out_file.name}: {e}")
+
+    def _write_output(self, data):
+        self._out_file.write(data)
+        self._out_frames += len(data)
+        self._unflushed_frames += len(data)
+        if self.flush_seconds > 0 and self._unflushed_frames >= self.flush_seconds * self.samplerate:
+            self._flush_output()
+        if self.manifest is not None and self._out_frames >= self.segment_seconds * self.samplerate:
+            self._close_output(final=False)
+            self._open_output()
+
+    def _splice_mic(self, frame_start, block):
+        """
+        Cross-fades the old mic's frame in `block` (which starts at frame_start in
+        mic_ring) into the same span of the replacement mic, then makes the
+        replacement the mic. Runs on the writer thread; returns False (try again
+        next frame) until the new stream has delivered audio for that span.
+        """
+        with self._switch_lock:
+            if self._next_mic is None:
+                return False
+            stream, ring, _, same_device = self._next_mic
+            n = len(block)
+
+            # Locate the same moment in the new stream via the capture timestamps
+            start = None
+            fit_old = self.mic_ring.clock_fit(self.samplerate)
+            fit_new = ring.clock_fit(self.samplerate)
+            if fit_old is not None and fit_new is not None:
+                when = fit_old[1] + (frame_start - fit_old[0]) * fit_old[2]
+                start = int(round(fit_new[0] + (when - fit_new[1]) / fit_new[2]))
+                if not (ring.write_position - ring.capacity <= start <= ring.write_position + ring.capacity):
+                    start = None # Not on a common clock
+            if start is None:
+                if ring.available < n:
+                    return False
+                start = ring.write_position - n # No usable timestamps: splice onto the newest audio
+            if start < ring.read_position or start + n > ring.write_position:
+                return False
+
+            incoming = np.zeros_like(block)
+            ring.peek_into(incoming, start)
+            fade = min(n, max(1, int(self.samplerate * self.switch_fade)))
+            ramp = (np.arange(fade, dtype=np.float32) / fade).reshape(-1, 1)
+            block[:fade] = block[:fade] * (1.0 - ramp) + incoming[:fade] * ramp
+            block[fade:] = incoming[fade:]
+            ring.discard_until(start + n)
+
+            self._next_mic[2] = self.mic_stream
+            self.mic_ring, self.mic_stream = ring, stream
+            self._next_mic = None
+            self._reopened = same_device
+        self._mic_switched.set()
+        return True
+
+    def _take_mic(self):
+        """
+        Makes a replacement for a stalled mic the mic. There is no audio left in the
+        old ring to cross-fade from, so the new stream simply takes over; the mixer
+        re-locks the loopback onto it. Runs on the writer thread.
+        """
+        with self._switch_lock:
+            if self._next_mic is None or self._next_mic[1].available == 0:
+                return False
+            stream, ring, _, same_device = self._next_mic
+            self._next_mic[2] = self.mic_stream
+            self.mic_ring, self.mic_stream = ring, stream
+            self._next_mic = None
+            self._reopened = same_device
+        self._mic_switched.set()
+        return True
+
+    def _splice_sys(self):
+        """
+        Makes a reopened loopback stream the loopback once it covers the mic's read
+        position. The mixer then re-locks onto it by capture timestamps, so the two
+        streams of the same device meet without a gap. Runs on the writer thread.
+        """
+        with self._switch_lock:
+            if self._next_sys is None:
+                return False
+            stream, ring, _, _ = self._next_sys
+            fit_mic = self.mic_ring.clock_fit(self.samplerate) if self.mic_ring is not None else None
+            fit_new = ring.clock_fit(self.samplerate)
+            if fit_new is None:
+                return False
+            if fit_mic is not None:
+                when = fit_mic[1] + (self.mic_ring.read_position - fit_mic[0]) * fit_mic[2]
+                if when < fit_new[1] - (fit_new[0] - ring.read_position) * fit_new[2]:
+                    return False # The new stream started after the audio the writer is at
+
+            self._next_sys[2] = self.sys_stream
+            self.sys_ring, self.sys_stream = ring, stream
+            self._next_sys = None
+            self._reopened = True
+        self._sys_switched.set()
+        return True
+
+    def _wait_for_writer(self, event, timeout):
+        """Waits for the writer to set `event`; gives up early if the writer has exited."""
+        deadline = time.monotonic() + timeout
+        writer = self.writer_thread
+        while not event.wait(0.05):
+            if time.monotonic() > deadline or not (writer and writer.is_alive()):
+                return False
+        return True
+
+    def _switch_mic(self, device_index, timeout=2.0, same_device=False):
+        """
+        Opens `device_index` next to the running mic stream and waits for the writer
+        to cross-fade into it. The writer thread and the open file are untouched.
+        same_device marks a reopen of the current mic (e.g. with other stream settings).
+        """
+        ring = self._new_ring(self.samplerate)
+        blocksize, latency = self._stream_params(self.samplerate)
+        try:
+            stream = sd.InputStream(
+                device=device_index,
+                callback=self._capture_callback(ring, "mic"),
+                channels=self.channels,
+                samplerate=self.samplerate, # Must match the running timeline and file
+                blocksize=blocksize,
+                latency=latency
+            )
+            stream.start()
+        except Exception as e:
+            print(f"Could not open device {device_index} at {self.samplerate}Hz: {e}")
+            return False
+
+        print(f"Switching mic to device index {device_index}...")
+        self._mic_switched.clear()
+        pending = [stream, ring, None, same_device]
+        with self._switch_lock:
+            self._next_mic = pending
+        switched = self._wait_for_writer(self._mic_switched, timeout)
+        with self._switch_lock:
+            if self._next_mic is pending:
+                self._next_mic = None # Writer never spliced it in (no audio from the new device)
+                switched = False
+
+        retired = pending[2] if switched else stream
+        try:
+            retired.stop()
+            retired.close()
+        except Exception as e:
+            print(f"Error closing mic stream: {e}")
+        if switched:
+            self._stream_settings["mic"] = (blocksize, latency)
+            print(f"Mic switched to device index {device_index}.")
+        else:
+            print(f"Device {device_index} delivered no audio. Keeping the current mic.")
+        return switched
+
+    def _reopen_sys(self, timeout=2.0):
+        """Reopens the loopback device with the current stream settings and waits for the writer to take it over."""
+        ring = self._new_ring(self.samplerate)
+        params = self._stream_params(self.samplerate)
+        stream = self._open_loopback(self.sys_stream.device, ring, *params)
+        if stream is None:
+            return False
+
+        self._sys_switched.clear()
+        pending = [stream, ring, None, True]
+        with self._switch_lock:
+            self._next_sys = pending
+        switched = self._wait_for_writer(self._sys_switched, timeout)
+        with self._switch_lock:
+            if self._next_sys is pending:
+                self._next_sys = None
+                switched = False
+
+        retired = pending[2] if switched else stream
+        try:
+            retired.stop()
+            retired.close()
+        except Exception as e:
+            print(f"Error closing sys stream: {e}")
+        if switched:
+            self._stream_settings["sys"] = params
+        return switched
+
+    def apply_stream_settings(self):
+        """
+        Reopens the running streams with the blocksize and latency the settings call
+        for (see _stream_params), if the latency profile or low-power mode changed.
+        Each stream is swapped in on the shared timeline, so a recording that is
+        already being written continues without a gap. If a device cannot be opened
+        twice, the stream keeps its current settings and the next call tries again.
+        Runs in the background: the swap waits for the writer to reach the new audio.
+        """
+        def apply():
+            with self._reopen_lock:
+                params = self._stream_params(self.samplerate)
+                if not (self.mic_stream and self.mic_stream.active):
+                    return
+                # Each stream records its settings once it was swapped in (see _switch_mic, _reopen_sys)
+                reopen_mic = self._stream_settings["mic"] != params
+                reopen_sys = bool(self.sys_stream and self.sys_stream.active) and self._stream_settings["sys"] != params
+                if not (reopen_mic or reopen_sys):
+                    return
+                print(f"Switching capture to {params[0]}-frame blocks, {params[1]} latency...")
+                ok = True
+                try:
+                    if reopen_mic:
+                        ok = self._switch_mic(getattr(self, 'device_index', None), same_device=True)
+                    if reopen_sys:
+                        ok = self._reopen_sys() and ok
+                except Exception as e:
+                    print(f"Error reopening streams: {e}")
+                    ok = False
+                if not ok:
+                    print("Could not reopen every stream. Continuing with its current settings.")
+
+        threading.Thread(target=apply, name="stream-settings", daemon=True).start()
 
     def _writer(self):
         """Combines streams and writes to file."""
-        file = None
         print("Writer thread started.")
+
+        self.vad.configure(self.samplerate)
+
+        # Mic and loopback are aligned on the mic's timeline in fixed-size frames
+        self.mixer = mixer = TimelineMixer(self.samplerate, self.channels, self.frame_duration)
+        mixed = np.zeros((mixer.frame, self.channels), dtype=np.float32)
+        split = np.zeros((mixer.frame, 2 * self.channels), dtype=np.float32) # Mic channels, then loopback
+        aec = EchoCanceller(self.samplerate, self.channels, block=max(1, mixer.frame // 10))
+        cleaned = np.zeros((mixer.frame, self.channels), dtype=np.float32)
+
+        # Low-power monitoring works on every `decimate`-th sample (about 16kHz)
+        decimate = max(1, self.samplerate // 16000)
+        idle_mic = np.zeros((mixer.frame, self.channels), dtype=np.float32)
+        idle_sys = np.zeros((mixer.frame, self.channels), dtype=np.float32)
+        frame_label = np.zeros((1, 1), dtype=np.uint8)
+        sources = None
+        was_idle = False
+        replay = False # Rewind the rings by the pre-roll once the sources are known
+        listened_from = 0 # Master position after which the rings hold audio heard while not recording
+        reported = {}
+
         try:
             while (self.mic_stream and self.mic_stream.active) or (self.sys_stream and self.sys_stream.active):
-                try:
-                    mic_data = self.mic_queue.get(timeout=0.5)
-                except queue.Empty:
-                    if not self.recording: # If not recording and no data, just continue/break
-                         if not ((self.mic_stream and self.mic_stream.active) or (self.sys_stream and self.sys_stream.active)):
-                             break
-                         continue
-                    mic_data = None # Handle later
+                if self.recording:
+                    if self._out_file is None and self.filename:
+                        self._open_output()
+                        replay = self._include_preroll and self.preroll_seconds > 0
+                elif self._out_file is not None:
+                    # Not recording, close file if open
+                    print("Closing file (recording stopped).")
+                    self._close_output(final=True)
+                    self.file_closed_event.set() # Signal that file is closed
+                    listened_from = master.read_position
 
-                try:
-                    sys_data = self.sys_queue.get(timeout=0.1)
-                except queue.Empty:
-                    sys_data = None
+                self._report_capture_problems(reported)
+                if self._next_sys is not None:
+                    self._splice_sys()
+
+                mic_on = bool(self.mic_stream and self.mic_stream.active)
+                sys_on = bool(self.sys_stream and self.sys_stream.active)
+                if mic_on:
+                    master, slave = self.mic_ring, (self.sys_ring if sys_on else None)
+                else:
+                    master, slave = self.sys_ring, None
+                if (master, slave) != sources:
+                    sources = (master, slave)
+                    mixer.reset()
+                    if not self._reopened:
+                        aec.reset() # New mic or loopback: the echo path has to be learned again
+                    self._reopened = False
+                    listened_from = 0 # Positions of the new ring
 
-                # If we have neither, continue
-                if mic_data is None and sys_data is None:
+                # Low-power monitoring: until a recording starts, frames are only consumed
+                # for levels and VAD; the pre-roll is replayed from the rings afterwards
+                idle = self.low_power_idle and self._out_file is None and self._next_mic is None
+                if idle != was_idle:
+                    was_idle = idle
+                    self.vad.configure(self.samplerate // decimate if idle else self.samplerate)
+                    mixer.reset() # Its position is stale once frames were consumed without it
+                    if not idle and slave is not None:
+                        self._rewind_slave(master, slave, 0)
+                if replay:
+                    replay = False
+                    self._replay_preroll(master, slave, master.read_position - listened_from)
+                    mixer.reset()
+                if idle:
+                    if not self._monitor_frame(master, slave, mic_on, idle_mic, idle_sys, decimate):
+                        time.sleep(max(0.01, 0.5 * self._stream_settings["mic"][0] / self.samplerate))
                     continue
-                    
-                # Handle missing data by creating silence
-                if mic_data is not None and sys_data is None:
-                    sys_data = np.zeros_like(mic_data)
-                elif sys_data is not None and mic_data is None:
-                    mic_data = np.zeros_like(sys_data)
-                
-                # Resize if mismatch
-                if len(mic_data) != len(sys_data):
-                    min_len = min(len(mic_data), len(sys_data))
-                    mic_data = mic_data[:min_len]
-                    sys_data = sys_data[:min_len]
 
-                if self.recording:
-                    if file is None and self.filename:
-                        print(f"Opening file: {self.filename}")
-                        file = sf.SoundFile(self.filename, mode='w', samplerate=self.samplerate, channels=self.channels)
-                    
-                    if file:
-                        # Mix audio: simple addition and clip
-                        mixed = mic_data + sys_data
-                        mixed = np.clip(mixed, -1.0, 1.0)
-                        file.write(mixed)
+                frame_start = master.read_position
+                if not mixer.next_frame(master, slave):
+                    if self._mic_stalled and self._next_mic is not None and self._take_mic():
+                        continue
+                    # Audio arrives a block at a time; waking more often than that finds nothing
+                    time.sleep(max(0.01, 0.5 * self._stream_settings["mic"][0] / self.samplerate))
+                    continue
+
+                self._last_frame_time = time.monotonic()
+                mic_data, sys_data = (mixer.master, mixer.slave) if mic_on else (mixer.slave, mixer.master)
+                if mic_on and self._next_mic is not None:
+                    self._splice_mic(frame_start, mic_data)
+                if self.echo_cancellation and mic_on and sys_on:
+                    mic_data = aec.process(mic_data, sys_data, cleaned)
+
+                # Levels for VAD are computed here rather than on the audio thread
+                self.current_mic_rms = self._rms(mic_data)
+                self.current_sys_rms = self._rms(sys_data)
+                self.vad.process(mic_data if mic_on else None, sys_data if sys_on else None)
+                if self._out_file is None:
+                    continue # Only listening; the pre-roll is replayed from the rings
+
+                frame_label[0, 0] = label(self.vad.activity["mic"], self.vad.activity["sys"])
+                if self._split:
+                    split[:, :self.channels] = mic_data
+                    split[:, self.channels:] = sys_data
+                    self._write_output(split)
                 else:
-                    # Not recording, close file if open
-                    if file:
-                        print("Closing file (recording stopped).")
-                        try:
-                            file.close()
-                        except: pass
-                        file = None
-                        self.file_closed_event.set() # Signal that file is closed
-                        
+                    # Mix audio: simple addition and clip
+                    np.add(mic_data, sys_data, out=mixed)
+                    np.clip(mixed, -1.0, 1.0, out=mixed)
+                    self._write_output(mixed)
+                self._timeline.add(frame_label[0])
+
         except Exception as e:
             print(f"Error in writer: {e}")
         finally:
-            if file:
-                file.close()
+            if self._out_file is not None:
+                self._close_output(final=True)
                 self.file_closed_event.set() # Ensure event is set even on error
             print("Writer thread finished.")
 
-    def _normalize_device_name(self, name):
-        """Cleans up device names to help with de-duplication."""
-        # 1. Fix specific quirks like " )" -> ")"
-        name = name.replace(" )", ")")
-        
-        # 2. Remove generic driver suffixes
-        # Regex explanation:
-        # \s+ : match leading whitespace
-        # \( : match opening paren
-        # ... : match content
-        # \) : match closing paren
-        name = re.sub(r'\s+\(Realtek\(R\) Audio\)', '', name, flags=re.IGNORECASE)
-        name = re.sub(r'\s+\(Realtek HD Audio.*\)', '', name, flags=re.IGNORECASE)
-        # Aggressive Intel regex: remove everything starting with (Intel
-        name = re.sub(r'\s+\(Intel.*', '', name, flags=re.IGNORECASE)
-        name = re.sub(r'\s+\(High Definition Audio.*\)', '', name, flags=re.IGNORECASE)
-        
-        # 3. Remove empty parens "()" which often indicate ghost devices
-        name = name.replace("()", "")
-        
-        # 4. Remove trailing/leading whitespace
-        return name.strip()
+    def _watchdog(self, writer):
+        """
+        Restarts a mic that stopped delivering audio, or a loopback stream that
+        PortAudio stopped (device error or removal), while their writer runs. A
+        WASAPI loopback delivers nothing at all while nothing plays, so its silence
+        alone is not a stall. The replacement is swapped in like a live device
+        switch, so an ongoing recording continues in the same file. Each fruitless
+        restart doubles the wait before the next one (up to a minute).
+        """
+        seen = {} # source -> (ring, write position, time.monotonic() it last moved)
+        wait = {"mic": self.stall_seconds, "sys": self.stall_seconds}
+        while writer.is_alive():
+            time.sleep(0.5)
+            now = time.monotonic()
+            for source, stream, ring in (("mic", self.mic_stream, self.mic_ring), ("sys", self.sys_stream, self.sys_ring)):
+                if stream is None or ring is None:
+                    seen.pop(source, None)
+                    continue
+                position = ring.write_position
+                last = seen.get(source)
+                if last is None or last[0] is not ring: # New stream: start timing it
+                    seen[source] = (ring, position, now)
+                    continue
+                if last[1] != position or (source == "sys" and stream.active):
+                    wait[source] = self.stall_seconds # Audio is flowing, or the loopback is just idle
+                    seen[source] = (ring, position, now)
+                    continue
+                if now - last[2] < wait[source] or not self._reopen_lock.acquire(blocking=False):
+                    continue
+                try:
+                    if stream is not (self.mic_stream if source == "mic" else self.sys_stream):
+                        continue # Stopped or replaced meanwhile
+                    self._restart_stalled(source, now - last[2])
+                finally:
+                    self._reopen_lock.release()
+                wait[source] = min(2 * wait[source], 60.0)
+                ring = self.mic_ring if source == "mic" else self.sys_ring
+                seen[source] = (ring, ring.write_position, time.monotonic())
 
-    def list_input_devices(self):
-        """Lists available input devices, filtering duplicates."""
-        devices = []
+    def _restart_stalled(self, source, silent_for):
+        """Reopens the stalled `source` stream. Called by the watchdog with _reopen_lock held."""
+        print(f"{source.capitalize()} stream delivered no audio for {silent_for:.1f}s. Restarting it...")
+        self._watchdog_counts[source][0] += 1
         try:
-            # Query all devices
-            all_devices = sd.query_devices()
-            host_apis = sd.query_hostapis()
-            
-            unique_devices = {} # normalized_name -> {priority, device_info}
-            
-            # Priority map (lower is better)
-            api_priority = {
-                'Windows WASAPI': 0,
-                'MME': 1,             # MME is often more compatible/stable than DirectSound for names
-                'Windows DirectSound': 2,
-                # 'Windows WDM-KS': 3 # Exclude WDM-KS entirely as it lists ghost/internal pins
-            }
-
-            for i, dev in enumerate(all_devices):
-                # Filter for input devices (max_input_channels > 0)
-                if dev['max_input_channels'] > 0:
-                    api_name = host_apis[dev['hostapi']]['name']
-                    
-                    # Skip WDM-KS entirely
-                    if 'WDM-KS' in api_name:
-                        continue
+            if source == "mic":
+                self._mic_stalled = True
+                try:
+                    ok = self._switch_mic(getattr(self, 'device_index', None), same_device=True)
+                finally:
+                    self._mic_stalled = False
+            else:
+                ok = self._reopen_sys()
+        except Exception as e:
+            print(f"Error restarting {source} stream: {e}")
+            ok = False
+        if ok:
+            self._watchdog_counts[source][1] += 1
+            print(f"{source.capitalize()} stream restarted.")
+        return ok
 
-                    # Skip virtual system mappers to reduce clutter
-                    if "Sound Mapper" in dev['name'] or "Primary Sound Capture" in dev['name']:
-                        continue
-                        
-                    raw_name = dev['name']
-                    norm_name = self._normalize_device_name(raw_name)
-                    
-                    # Skip if normalization resulted in empty name
-                    if not norm_name:
-                        continue
+    def list_input_devices(self):
+        """Lists available input devices, filtering duplicates (cached by the device registry)."""
+        return self.devices.list_input_devices()
 
-                    # Determine priority
-                    priority = api_priority.get(api_name, 99)
-                    
-                    # Logic:
-                    # 1. If we haven't seen this normalized name, add it.
-                    # 2. If we have, but this one has a better priority (lower), replace it.
-                    
-                    if norm_name not in unique_devices or priority < unique_devices[norm_name]['priority']:
-                        unique_devices[norm_name] = {
-                            'priority': priority,
-                            'data': {
-                                "index": i,
-                                "name": norm_name, # Use normalized name for cleaner UI
-                                "channels": dev['max_input_channels']
-                            }
-                        }
-            
-            # Convert to list and sort by name
-            devices = [v['data'] for v in unique_devices.values()]
-            devices.sort(key=lambda x: x['name'])
-            
-        except Exception as e:
-            print(f"Error listing devices: {e}")
-        return devices
+    def refresh_devices(self):
+        """
+        Rescans for attached/removed devices. PortAudio can only be re-initialized with
+        no streams open, so monitoring is restarted around the rescan; while recording
+        only the cached lists are dropped.
+        """
+        if self.recording:
+            self.devices.invalidate()
+            return self.list_input_devices()
 
-    def set_device(self, device_index):
-        """Sets the microphone device index."""
-        self.device_index = device_index
-        # If currently listening, restart to apply change
-        if self.mic_stream and self.mic_stream.active:
+        was_listening = bool((self.mic_stream and self.mic_stream.active) or (self.sys_stream and self.sys_stream.active))
+        if was_listening:
             self.stop_listening()
+        if self.devices.rescan():
+            print("Audio device list changed.")
+        if was_listening:
             self.start_listening()
+        return self.list_input_devices()
+
+    def set_device(self, device_index):
+        """
+        Sets the microphone device index. While listening, the new mic is switched
+        in live so an ongoing recording continues in the same file without a gap.
+        """
+        with self._reopen_lock:
+            previous = getattr(self, 'device_index', None)
+            self.device_index = device_index
+            if not (self.mic_stream and self.mic_stream.active):
+                return True
+            if self._switch_mic(device_index):
+                return True
+
+        if self.recording:
+            # The file's sample rate is fixed; keep the mic that works
+            print("Keeping the current mic for the rest of this recording.")
+            self.device_index = previous
+            return False
+        # Not recording: a full restart may settle on a different sample rate
+        self.stop_listening()
+        return self.start_listening()
 
     def start_listening(self):
         """Starts the audio streams for monitoring (VAD) without recording to file."""
         if (self.mic_stream and self.mic_stream.active) or (self.sys_stream and self.sys_stream.active):
             return True
 
-        self.mic_queue = queue.Queue()
-        self.sys_queue = queue.Queue()
         self.current_mic_rms = 0.0
         self.current_sys_rms = 0.0
+        self._callback_counts = {"mic": [0] * 5, "sys": [0] * 5}
+        self._watchdog_counts = {"mic": [0, 0], "sys": [0, 0]}
 
         try:
             # Mic Stream
             device_idx = getattr(self, 'device_index', None)
             print(f"Starting Mic Stream on device index: {device_idx}")
             
-            # Try requested samplerate first, then fallback
-            rates_to_try = [self.samplerate]
-            
-            # Get device default if possible
-            if device_idx is not None:
-                try:
-                    dev_info = sd.query_devices(device_idx)
-                    default_rate = int(dev_info['default_samplerate'])
-                    if default_rate not in rates_to_try:
-                        rates_to_try.append(default_rate)
-                except:
-                    pass
-            
-            # Add common rates
-            for r in [44100, 48000, 16000]:
-                if r not in rates_to_try:
-                    rates_to_try.append(r)
-            
+            # Rates the registry confirmed for this device come first
+            rates_to_try = self.devices.preferred_rates(device_idx, self.samplerate)
+
             mic_stream_started = False
             for rate in rates_to_try:
                 try:
                     print(f"Trying sample rate: {rate}")
+                    self.mic_ring = self._new_ring(rate)
+                    blocksize, latency = self._stream_params(rate)
                     self.mic_stream = sd.InputStream(
                         device=device_idx,
-                        callback=self._mic_callback,
+                        callback=self._capture_callback(self.mic_ring, "mic"),
                         channels=self.channels,
-                        samplerate=rate
+                        samplerate=rate,
+                        blocksize=blocksize,
+                        latency=latency
                     )
                     self.mic_stream.start()
                     self.samplerate = rate # Update to the working rate
+                    self._stream_settings["mic"] = (blocksize, latency)
                     mic_stream_started = True
                     print(f"Mic stream started with rate {rate}")
                     break
                 except Exception as e:
                     print(f"Failed to start mic with rate {rate}: {e}")
+                    self.devices.invalidate(device_idx) # Cached capabilities are stale (device changed or gone)
             
             if not mic_stream_started:
                 raise Exception("Could not start microphone with any common sample rate.")
@@ -304,46 +840,22 @@ class AudioRecorder:
             wasapi_dev = self._get_wasapi_loopback_device()
             if wasapi_dev is not None:
                 print(f"Attempting to open Loopback on device {wasapi_dev}...")
-                try:
-                    # Method 1: WasapiSettings(loopback=True)
-                    self.sys_stream = sd.InputStream(
-                        device=wasapi_dev,
-                        callback=self._sys_callback,
-                        channels=self.channels,
-                        samplerate=self.samplerate, # Must match mic for mixing simplicity in _writer
-                        extra_settings=sd.WasapiSettings(loopback=True)
-                    )
-                    self.sys_stream.start()
-                    print("Loopback started (Method 1).")
-                except TypeError:
-                    print("WasapiSettings(loopback=True) failed. Trying Method 2...")
-                    try:
-                        # Method 2: InputStream(loopback=True)
-                        # Note: loopback=True is not standard in all bindings, but we try it.
-                        # If it fails, we catch it.
-                        # Actually, for sounddevice, loopback is usually via WasapiSettings.
-                        # But some forks support it. If it fails, we just catch.
-                        self.sys_stream = sd.InputStream(
-                            device=wasapi_dev,
-                            callback=self._sys_callback,
-                            channels=self.channels,
-                            samplerate=self.samplerate
-                            # loopback=True # Removing this as it causes errors in standard lib
-                        )
-                        self.sys_stream.start()
-                        print("Loopback started (Method 2).")
-                    except Exception as e2:
-                        print(f"Loopback Method 2 failed: {e2}")
-                        print("Continuing with Microphone only.")
-                except Exception as e:
-                    print(f"Loopback failed: {e}")
+                self.sys_ring = self._new_ring(self.samplerate)
+                params = self._stream_params(self.samplerate)
+                self.sys_stream = self._open_loopback(wasapi_dev, self.sys_ring, *params)
+                if self.sys_stream is None:
                     print("Continuing with Microphone only.")
+                else:
+                    self._stream_settings["sys"] = params
             else:
                 print("No WASAPI device found. Monitoring Mic only.")
 
             # Start writer thread
             self.writer_thread = threading.Thread(target=self._writer)
             self.writer_thread.start()
+            self.watchdog_thread = threading.Thread(target=self._watchdog, args=(self.writer_thread,),
+                                                    name="stream-watchdog", daemon=True)
+            self.watchdog_thread.start()
             print("Started listening (monitoring)...")
             return True
 
@@ -353,8 +865,25 @@ class AudioRecorder:
             self.stop_listening()
             return False
 
-    def start_recording(self):
-        """Enables writing to file."""
+    def _resolve_format(self, name):
+        """Picks the FORMATS entry to encode to, falling back when the codec cannot be used."""
+        if name == "opus" and self.samplerate not in self.OPUS_SAMPLERATES:
+            print(f"Opus does not support {self.samplerate}Hz. Recording FLAC instead.")
+            name = "flac"
+
+        for candidate in (name, "flac", "wav"):
+            candidate = candidate if candidate in self.FORMATS else "wav"
+            fmt, subtype, _ = self.FORMATS[candidate]
+            if sf.check_format(fmt, subtype):
+                return candidate
+            print(f"libsndfile cannot write {fmt}/{subtype}. Trying next format.")
+        return "wav"
+
+    def start_recording(self, include_preroll=False):
+        """
+        Enables writing to file.
+        With include_preroll, the audio buffered while listening is written first.
+        """
         if self.recording:
             return
 
@@ -365,14 +894,32 @@ class AudioRecorder:
                 print("Cannot start recording: Failed to start listening.")
                 return
 
+        file_format = self._resolve_format(self.recording_format)
+        self._file_format = self.FORMATS[file_format]
+        self._split = self.channel_layout == "stereo"
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.filename = os.path.join(self.output_dir, f"meeting_{timestamp}.wav")
-        self.recording = True
+        if self.segment_seconds > 0:
+            # Segments are named meeting_<timestamp>_partNNN and listed in meeting_<timestamp>.json
+            self.manifest = new_manifest(f"meeting_{timestamp}", self.samplerate,
+                                         2 * self.channels if self._split else self.channels,
+                                         file_format, self.segment_seconds,
+                                         layout="stereo" if self._split else "mixed")
+            self.filename = os.path.join(self.output_dir, f"meeting_{timestamp}.json")
+            write_manifest(self.filename, self.manifest)
+        else:
+            self.manifest = None
+            self.filename = os.path.join(self.output_dir, f"meeting_{timestamp}{self._file_format[2]}")
+        self._include_preroll = include_preroll
+        self._closed_bytes = 0
         self.file_closed_event.clear() # Reset event
+        self.recording = True
         print(f"Started recording to {self.filename}")
 
     def stop_recording(self):
-        """Stops writing to file but keeps listening."""
+        """
+        Stops writing to file but keeps listening.
+        Returns the recording path (the segment manifest in segmented mode).
+        """
         if not self.recording:
             return
 
@@ -385,23 +932,76 @@ class AudioRecorder:
     def stop_listening(self):
         """Stops streams and writer thread."""
         self.recording = False
-        
-        if self.mic_stream:
-            try:
-                self.mic_stream.stop()
-                self.mic_stream.close()
-            except Exception as e:
-                print(f"Error closing mic stream: {e}")
-            self.mic_stream = None
-        
-        if self.sys_stream:
+        with self._reopen_lock: # Not while the watchdog replaces a stream
+            if self.mic_stream:
+                try:
+                    self.mic_stream.stop()
+                    self.mic_stream.close()
+                except Exception as e:
+                    print(f"Error closing mic stream: {e}")
+                self.mic_stream = None
+
+            if self.sys_stream:
+                try:
+                    self.sys_stream.stop()
+                    self.sys_stream.close()
+                except Exception as e:
+                    print(f"Error closing sys stream: {e}")
+                self.sys_stream = None
+
+    def get_capture_stats(self):
+        """Stream settings, callback xrun counters and overflow counters of the capture ring buffers."""
+        stats = {
+            "stream": {
+                "latency_profile": self.latency_profile,
+                "blocksize": self._stream_settings["mic"][0],
+                "latency": self._stream_settings["mic"][1],
+            }
+        }
+        for name, ring, stream in (("mic", self.mic_ring, self.mic_stream), ("sys", self.sys_ring, self.sys_stream)):
+            if ring is not None:
+                callbacks, frames, xruns, input_overflows, input_underflows = self._callback_counts[name]
+                stalls, restarts = self._watchdog_counts[name]
+                stats[name] = {
+                    "blocksize": self._stream_settings[name][0], # As this stream was last opened
+                    "latency": self._stream_settings[name][1],
+                    "buffered_frames": ring.available,
+                    "capacity_frames": ring.capacity,
+                    "overflows": ring.overflows,
+                    "dropped_frames": ring.dropped_frames,
+                    "callbacks": callbacks,
+                    "mean_block_frames": round(frames / callbacks, 1) if callbacks else 0,
+                    "xruns": xruns, # Callbacks PortAudio flagged (overflow, underflow, ...)
+                    "input_overflows": input_overflows, # Audio lost before it reached us
+                    "input_underflows": input_underflows,
+                    "stalls": stalls, # Times the watchdog found the stream silent
+                    "restarts": restarts, # Successful watchdog restarts
+                    "stream_latency": getattr(stream, "latency", None), # Seconds, as reported by the host API
+                }
+        writer_alive = bool(self.writer_thread and self.writer_thread.is_alive())
+        master = self.mic_ring if self.mic_stream is not None else self.sys_ring
+        out_file = self._out_file
+        current_bytes = 0
+        if out_file is not None:
             try:
-                self.sys_stream.stop()
-                self.sys_stream.close()
-            except Exception as e:
-                print(f"Error closing sys stream: {e}")
-            self.sys_stream = None
-            
+                current_bytes = os.path.getsize(out_file.name)
+            except OSError:
+                pass
+        stats["writer"] = {
+            "running": writer_alive,
+            # Audio captured but not yet mixed and written
+            "lag_seconds": round(master.available / self.samplerate, 3) if master is not None else 0.0,
+            "seconds_since_frame": round(time.monotonic() - self._last_frame_time, 3) if writer_alive and self._last_frame_time else None,
+            "recording": self.recording,
+            "bytes_written": self._closed_bytes + current_bytes if self.recording or out_file is not None else 0,
+        }
+        if self.mixer is not None:
+            stats["alignment"] = {
+                "drift_ppm": round(self.mixer.drift_ppm, 1),
+                "resyncs": self.mixer.resyncs,
+            }
+        return stats
+
     def get_rms(self):
         # Return the maximum activity from either mic or system
         return max(self.current_mic_rms, self.current_sys_rms)
@@ -1,6 +1,19 @@
 import os
 import subprocess
 import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from app.segments import is_manifest, load_manifest, segment_paths
+
+SPLIT_CHANNELS_TAG = "nabu:channels=mic,sys" # File comment of recordings with mic and loopback on separate channels
+DOWNMIX_BLOCK_FRAMES = 65536
+HASH_CHUNK_BYTES = 1024 * 1024
+HASH_CACHE_SIZE = 256 # Hashes remembered by audio_sha256
+
+_hashes = OrderedDict() # ((path, mtime_ns, size), ...) of the hashed files -> hex digest
+_hashes_lock = threading.Lock()
 
 
 def get_audio_duration(filepath: str) -> float:
@@ -8,6 +21,8 @@ def get_audio_duration(filepath: str) -> float:
     Get the duration of an audio file in seconds.
     Supports M4A, WAV, MP3, and other formats.
     
+    For a segment manifest, returns the total duration of all segments.
+    
     Uses multiple fallback methods:
     1. ffprobe (most reliable, supports all formats)
     2. pydub (if available)
@@ -23,6 +38,9 @@ def get_audio_duration(filepath: str) -> float:
         print(f"Audio file not found: {filepath}")
         return 0.0
     
+    if is_manifest(filepath):
+        return _get_duration_manifest(filepath)
+    
     # Method 1: Try ffprobe (most reliable)
     duration = _get_duration_ffprobe(filepath)
     if duration > 0:
@@ -108,3 +126,92 @@ def _get_duration_soundfile(filepath: str) -> float:
         pass
     
     return 0.0
+
+
+def _get_duration_manifest(filepath: str) -> float:
+    """Sum segment durations, trusting frame counts of segments that closed cleanly."""
+    try:
+        manifest = load_manifest(filepath)
+    except Exception as e:
+        print(f"Could not read manifest {filepath}: {e}")
+        return 0.0
+    
+    samplerate = manifest.get("samplerate") or 1
+    folder = os.path.dirname(filepath)
+    duration = 0.0
+    for segment in manifest.get("segments", []):
+        if segment.get("complete"):
+            duration += segment.get("frames", 0) / samplerate
+        else:
+            # Segment was still open (e.g. after a crash); probe the file itself
+            duration += get_audio_duration(os.path.join(folder, segment["file"]))
+    return duration
+
+
+def audio_sha256(filepath: str) -> str:
+    """
+    SHA-256 of a recording's audio bytes, read in chunks. A segmented recording
+    hashes its parts in order, as if they were one file. Hashes are remembered
+    per path, modification time and size, so asking again about an unchanged
+    recording (retries, windows, cached uploads) does not read it again.
+    """
+    paths = segment_paths(filepath)
+    files = []
+    for path in paths:
+        st = os.stat(path)
+        files.append((os.path.abspath(path), st.st_mtime_ns, st.st_size))
+    key = tuple(files)
+    with _hashes_lock:
+        if key in _hashes:
+            _hashes.move_to_end(key)
+            return _hashes[key]
+
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+    with _hashes_lock:
+        _hashes[key] = digest.hexdigest()
+        while len(_hashes) > HASH_CACHE_SIZE:
+            _hashes.popitem(last=False)
+    return digest.hexdigest()
+
+
+def is_split_recording(filepath: str) -> bool:
+    """True for recordings written with the "stereo" channel layout (mic left, loopback right)."""
+    try:
+        import soundfile as sf
+        with sf.SoundFile(filepath) as f:
+            return f.channels > 1 and f.comment == SPLIT_CHANNELS_TAG
+    except Exception:
+        return False
+
+
+def downmix_to_mono(filepath: str, output_path: str = None) -> str:
+    """
+    Write a mono version of a multi-channel file, block by block.
+
+    Split recordings are summed (and clipped) exactly like the live "mixed" layout;
+    other multi-channel files are averaged. Returns the path of the mono FLAC file
+    (a new temporary file unless output_path is given); the caller deletes it.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    split = is_split_recording(filepath)
+    if output_path is None:
+        fd, output_path = tempfile.mkstemp(suffix="_mono.flac")
+        os.close(fd)
+
+    with sf.SoundFile(filepath) as src, \
+            sf.SoundFile(output_path, mode='w', samplerate=src.samplerate, channels=1,
+                         format='FLAC', subtype='PCM_16') as dst:
+        scale = 1.0 if split else 1.0 / src.channels
+        for block in src.blocks(blocksize=DOWNMIX_BLOCK_FRAMES, dtype='float32', always_2d=True):
+            mono = block.sum(axis=1)
+            if scale != 1.0:
+                mono *= scale
+            np.clip(mono, -1.0, 1.0, out=mono)
+            dst.write(mono)
+    return output_path
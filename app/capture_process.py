@@ -0,0 +1,283 @@
+"""
+Optional out-of-process audio capture (CAPTURE_PROCESS=true).
+
+The AudioRecorder (stream callbacks, writer thread, VAD) runs in a dedicated
+process so request handlers, compression and LLM response parsing in the server
+process never compete with it for the GIL. The capture process publishes its
+levels into a small shared-memory array; RemoteRecorder, a proxy with the
+AudioRecorder interface, forwards commands over a Pipe and receives VAD and
+segment events over a second one. The audio itself only goes to disk.
+"""
+
+import collections
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Slots of the shared levels array (float64)
+MIC_RMS = 0
+SYS_RMS = 1
+LAST_VOICE = 2   # VADEngine.last_voice_time
+SAMPLERATE = 3   # Rate the streams actually run at
+LEVELS_SIZE = 8
+
+LEVELS_INTERVAL = 0.02 # Seconds between level publishes
+
+
+def _capture_main(conn, events, levels_name, output_dir, samplerate, channels):
+    """Entry point of the capture process."""
+    from app.audio_recorder import AudioRecorder
+
+    levels_shm = shared_memory.SharedMemory(name=levels_name)
+    levels = np.ndarray((LEVELS_SIZE,), dtype=np.float64, buffer=levels_shm.buf)
+
+    recorder = AudioRecorder(output_dir=output_dir, samplerate=samplerate, channels=channels)
+
+    send_lock = threading.Lock() # The publisher and the writer thread both send events
+    def send_event(*event):
+        with send_lock:
+            events.send(event)
+
+    recorder.on_segment_closed = lambda path, final: send_event("segment", path, final)
+    running = threading.Event()
+    running.set()
+
+    def publish():
+        while running.is_set():
+            event = recorder.vad.wait_event(timeout=LEVELS_INTERVAL)
+            levels[MIC_RMS] = recorder.current_mic_rms
+            levels[SYS_RMS] = recorder.current_sys_rms
+            levels[LAST_VOICE] = recorder.vad.last_voice_time
+            levels[SAMPLERATE] = recorder.samplerate
+            if event:
+                send_event("vad", *event)
+
+    publisher = threading.Thread(target=publish, daemon=True)
+    publisher.start()
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break # Server process went away
+            if message is None:
+                break
+            seq, target, name, args, kwargs = message
+            obj = recorder.vad if target == "vad" else recorder
+            try:
+                if name == "setattr":
+                    setattr(obj, *args)
+                    result = None
+                elif name == "getattr":
+                    result = getattr(obj, args[0])
+                else:
+                    result = getattr(obj, name)(*args, **kwargs)
+                conn.send((seq, True, result))
+            except Exception as e:
+                conn.send((seq, False, f"{type(e).__name__}: {e}"))
+    finally:
+        recorder.stop_listening()
+        if recorder.writer_thread:
+            recorder.writer_thread.join(timeout=5)
+        running.clear()
+        publisher.join(timeout=1)
+        # Views must be released before the shared memory can be closed
+        del levels
+        levels_shm.close()
+
+
+class RemoteVAD:
+    """Stands in for AudioRecorder.vad when the VAD runs in the capture process."""
+
+    def __init__(self, recorder):
+        self._recorder = recorder
+        self._events = collections.deque(maxlen=16)
+        self._cond = threading.Condition()
+
+    @property
+    def last_voice_time(self) -> float:
+        return float(self._recorder._levels[LAST_VOICE])
+
+    @property
+    def silence_duration(self):
+        return self._recorder._call("vad", "getattr", "silence_duration")
+
+    @silence_duration.setter
+    def silence_duration(self, value):
+        self._recorder._call("vad", "setattr", "silence_duration", value)
+
+    def set_threshold(self, threshold):
+        self._recorder._call("vad", "set_threshold", threshold)
+
+    def noise_floors(self):
+        return self._recorder._call("vad", "noise_floors")
+
+    def set_noise_floors(self, floors):
+        self._recorder._call("vad", "set_noise_floors", floors)
+
+    def _publish(self, kind, ts):
+        with self._cond:
+            self._events.append((kind, ts))
+            self._cond.notify_all()
+
+    def wait_event(self, timeout=None):
+        """Returns the next (kind, timestamp) event, or None on timeout."""
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+
+def _remote_attribute(name, doc):
+    def fget(self):
+        return self._call("recorder", "getattr", name)
+
+    def fset(self, value):
+        self._call("recorder", "setattr", name, value)
+    return property(fget, fset, doc=doc)
+
+
+class RemoteRecorder:
+    """
+    AudioRecorder proxy for the server process. Capture runs in a child process
+    and levels are read from shared memory.
+    """
+
+    CALL_TIMEOUT = 30
+
+    preroll_seconds = _remote_attribute("preroll_seconds", "Pre-roll kept while listening (seconds)")
+    recording_format = _remote_attribute("recording_format", "See AudioRecorder.FORMATS")
+    segment_seconds = _remote_attribute("segment_seconds", "Segment length; 0 records a single file")
+    channel_layout = _remote_attribute("channel_layout", "See AudioRecorder.CHANNEL_LAYOUTS")
+    echo_cancellation = _remote_attribute("echo_cancellation", "Remove loopback echo from the mic")
+    latency_profile = _remote_attribute("latency_profile", "See AudioRecorder.LATENCY_PROFILES")
+
+    def __init__(self, output_dir="recordings", samplerate=16000, channels=1):
+        self.output_dir = output_dir
+        self.channels = channels
+        self.on_segment_closed = None # Called from the event thread as fn(segment_path, final)
+
+        self._levels_shm = shared_memory.SharedMemory(create=True, size=LEVELS_SIZE * 8)
+        self._levels = np.ndarray((LEVELS_SIZE,), dtype=np.float64, buffer=self._levels_shm.buf)
+        self._levels[:] = 0.0
+        self._levels[SAMPLERATE] = samplerate
+
+        # spawn everywhere: forking a process that already runs threads is unsafe
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self._event_conn, child_events = ctx.Pipe(duplex=False)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.vad = RemoteVAD(self)
+
+        self.process = ctx.Process(
+            target=_capture_main,
+            args=(child_conn, child_events, self._levels_shm.name, output_dir, samplerate, channels),
+            name="nabu-capture",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        child_events.close()
+
+        self._event_thread = threading.Thread(target=self._event_loop, daemon=True)
+        self._event_thread.start()
+        logger.info(f"Capture process started (pid {self.process.pid})")
+
+    def _call(self, target, name, *args, **kwargs):
+        """Runs `name` on the recorder (or its VAD) in the capture process and returns the result."""
+        with self._lock:
+            if not self.process.is_alive():
+                raise RuntimeError("Capture process is not running")
+            self._seq += 1
+            seq = self._seq
+            self._conn.send((seq, target, name, args, kwargs))
+            deadline = time.monotonic() + self.CALL_TIMEOUT
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._conn.poll(remaining):
+                    raise TimeoutError(f"Capture process did not answer {name}()")
+                try:
+                    reply_seq, ok, result = self._conn.recv()
+                except (EOFError, OSError):
+                    raise RuntimeError("Capture process exited")
+                if reply_seq == seq: # Older replies belong to calls that timed out
+                    break
+        if not ok:
+            raise RuntimeError(f"Capture process error in {name}(): {result}")
+        return result
+
+    def _event_loop(self):
+        while True:
+            try:
+                event = self._event_conn.recv()
+            except (EOFError, OSError):
+                return
+            if event[0] == "vad":
+                self.vad._publish(event[1], event[2])
+            elif event[0] == "segment" and self.on_segment_closed:
+                try:
+                    self.on_segment_closed(event[1], event[2])
+                except Exception as e:
+                    logger.error(f"Segment callback failed: {e}")
+
+    @property
+    def samplerate(self) -> int:
+        return int(self._levels[SAMPLERATE])
+
+    def get_rms(self):
+        # Return the maximum activity from either mic or system
+        return max(float(self._levels[MIC_RMS]), float(self._levels[SYS_RMS]))
+
+    def start_listening(self):
+        return self._call("recorder", "start_listening")
+
+    def stop_listening(self):
+        return self._call("recorder", "stop_listening")
+
+    def start_recording(self, include_preroll=False):
+        return self._call("recorder", "start_recording", include_preroll=include_preroll)
+
+    def stop_recording(self):
+        return self._call("recorder", "stop_recording")
+
+    def list_input_devices(self):
+        return self._call("recorder", "list_input_devices")
+
+    def refresh_devices(self):
+        return self._call("recorder", "refresh_devices")
+
+    def set_device(self, device_index):
+        return self._call("recorder", "set_device", device_index)
+
+    def apply_stream_settings(self):
+        return self._call("recorder", "apply_stream_settings")
+
+    def get_capture_stats(self):
+        return self._call("recorder", "get_capture_stats")
+
+    def close(self):
+        """Stops the capture process and releases the shared memory."""
+        try:
+            with self._lock:
+                self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            logger.warning("Capture process did not exit. Terminating it.")
+            self.process.terminate()
+            self.process.join(timeout=5)
+        self._event_conn.close()
+
+        # Views must be released before the shared memory can be closed
+        self._levels = None
+        self._levels_shm.close()
+        self._levels_shm.unlink()
+        logger.info("Capture process stopped")
@@ -0,0 +1,80 @@
+"""
+Overlapping windows of long recordings for map-reduce summarization.
+
+A three-hour meeting sent as one request often outlasts LLM_TIMEOUT, and each
+retry starts over. Audio longer than CHUNK_MINUTES is instead cut into windows
+of about CHUNK_MINUTES that overlap by CHUNK_OVERLAP_SECONDS, so nothing said
+at a boundary is lost. The provider summarizes the windows concurrently and
+merges the results (see GeminiProvider.process_audio), so latency follows the
+window length rather than the meeting length.
+
+Windows are cut from the audio that would have been uploaded (the speech
+rendition, or the trimmed copy), by stream copy with ffmpeg or with soundfile.
+"""
+
+import math
+import os
+import subprocess
+from typing import List, Tuple
+import soundfile as sf
+from app.config import Config
+from app.logger import get_logger
+from app.transcode import ffmpeg_available, TIMEOUT_SECONDS
+
+logger = get_logger(__name__)
+
+BLOCK_FRAMES = 65536
+MIN_LAST_WINDOW = 0.5 # A recording this much longer than one window is still sent whole
+
+
+def plan_windows(duration: float, minutes: float = None, overlap: float = None) -> List[Tuple[float, float]]:
+    """
+    (start, end) seconds of the windows covering `duration`, all the same
+    length and overlapping by `overlap` seconds. A single window means the
+    audio is short enough to be summarized in one request.
+    """
+    length = (Config.CHUNK_MINUTES if minutes is None else minutes) * 60
+    overlap = Config.CHUNK_OVERLAP_SECONDS if overlap is None else overlap
+    if length <= 0 or duration <= length * (1 + MIN_LAST_WINDOW):
+        return [(0.0, duration)]
+    overlap = min(overlap, length / 2)
+    count = math.ceil((duration - overlap) / (length - overlap))
+    # Spread evenly instead of leaving a short last window
+    step = (duration - overlap) / count
+    return [(i * step, min(duration, i * step + step + overlap)) for i in range(count)]
+
+
+def cut_window(path: str, start: float, end: float, output_path: str) -> str:
+    """
+    Writes seconds `start` to `end` of `path` to `output_path`. ffmpeg copies
+    the encoded stream (its extension should match `path`); without it the
+    window is decoded with soundfile and written as FLAC.
+    """
+    if ffmpeg_available():
+        command = ["ffmpeg", "-nostdin", "-v", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+                   "-i", path, "-map", "0:a:0", "-c", "copy",
+                   "-fflags", "+bitexact", output_path] # Same bytes every time, for the window cache
+        result = subprocess.run(command, capture_output=True, text=True, timeout=TIMEOUT_SECONDS)
+        if result.returncode != 0:
+            raise RuntimeError(f"Could not cut {path}: {result.stderr.strip()}")
+        return output_path
+
+    with sf.SoundFile(path) as src, \
+            sf.SoundFile(output_path, mode='w', samplerate=src.samplerate, channels=src.channels,
+                         format='FLAC', subtype='PCM_16') as dst:
+        if src.comment:
+            dst.comment = src.comment
+        src.seek(int(round(start * src.samplerate)))
+        remaining = int(round(end * src.samplerate)) - src.tell()
+        while remaining > 0:
+            block = src.read(min(remaining, BLOCK_FRAMES), dtype='float32', always_2d=True)
+            if len(block) == 0:
+                break
+            dst.write(block)
+            remaining -= len(block)
+    return output_path
+
+
+def window_extension(path: str) -> str:
+    """Extension of windows cut from `path` by cut_window."""
+    return os.path.splitext(path)[1] if ffmpeg_available() else ".flac"
@@ -4,7 +4,6 @@ Handles conversion of audio files to more efficient formats to save disk space.
 """
 
 import os
-from pydub import AudioSegment
 from app.logger import get_logger
 from app.settings import get_settings_manager
 
@@ -29,6 +28,8 @@ def compress_audio_file(input_path: str, output_path: str = None, format: str =
             logger.error(f"Input file not found: {input_path}")
             return input_path
         
+        from pydub import AudioSegment
+
         # Load audio file
         logger.info(f"Compressing {input_path}...")
         audio = AudioSegment.from_file(input_path)
@@ -73,3 +74,23 @@ def should_compress() -> bool:
         return compress_setting == "true"
     except:
         return True  # Default to true if settings not available
+
+
+def get_recording_format() -> str:
+    """
+    Format the recorder should encode to while recording.
+
+    The compress_recordings setting accepts "false" (WAV), "true" or "flac" (FLAC)
+    and "opus" (Ogg/Opus).
+    """
+    try:
+        settings_manager = get_settings_manager()
+        compress_setting = (settings_manager.get("compress_recordings") or "true").lower()
+    except:
+        compress_setting = "true"
+
+    if compress_setting == "false":
+        return "wav"
+    if compress_setting == "opus":
+        return "opus"
+    return "flac"
@@ -26,6 +26,23 @@ class Config:
     VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.03"))
     SILENCE_DURATION = int(os.getenv("SILENCE_DURATION", "10"))
     MIN_RECORDING_DURATION = int(os.getenv("MIN_RECORDING_DURATION", "3"))
+    CAPTURE_BUFFER_SECONDS = float(os.getenv("CAPTURE_BUFFER_SECONDS", "10"))
+    SEGMENT_MINUTES = float(os.getenv("SEGMENT_MINUTES", "0"))
+    PREROLL_SECONDS = float(os.getenv("PREROLL_SECONDS", "5"))
+    ECHO_CANCELLATION = os.getenv("ECHO_CANCELLATION", "true").lower() == "true"
+    CHANNEL_LAYOUT = os.getenv("CHANNEL_LAYOUT", "mixed")
+    CAPTURE_PROCESS = os.getenv("CAPTURE_PROCESS", "false").lower() == "true"
+    LOW_POWER_IDLE = os.getenv("LOW_POWER_IDLE", "true").lower() == "true"
+    IDLE_BLOCK_SECONDS = float(os.getenv("IDLE_BLOCK_SECONDS", "0.25"))
+    LATENCY_PROFILE = os.getenv("LATENCY_PROFILE", "balanced")
+    STREAM_STALL_SECONDS = float(os.getenv("STREAM_STALL_SECONDS", "3"))
+    FLUSH_SECONDS = float(os.getenv("FLUSH_SECONDS", "5"))
+    
+    # Processing Queue
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+    WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
     
     # LLM Settings
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -33,6 +50,15 @@ class Config:
     LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", "600"))
     LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
     LLM_RETRY_DELAY = int(os.getenv("LLM_RETRY_DELAY", "2"))
+    SPEECH_RENDITION = os.getenv("SPEECH_RENDITION", "true").lower() == "true"
+    SPEECH_BITRATE = os.getenv("SPEECH_BITRATE", "24k")
+    TRIM_SILENCE = os.getenv("TRIM_SILENCE", "true").lower() == "true"
+    TRIM_MIN_SILENCE = float(os.getenv("TRIM_MIN_SILENCE", "2"))
+    CHUNK_MINUTES = float(os.getenv("CHUNK_MINUTES", "20"))
+    CHUNK_OVERLAP_SECONDS = float(os.getenv("CHUNK_OVERLAP_SECONDS", "30"))
+    CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "4"))
+    LIVE_SUMMARY = os.getenv("LIVE_SUMMARY", "true").lower() == "true"
+    LIVE_SEGMENT_MINUTES = float(os.getenv("LIVE_SEGMENT_MINUTES", "5"))
     
     # File Upload Settings
     MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "500"))
@@ -5,6 +5,14 @@ from app.config import Config
 
 DB_PATH = Config.DB_PATH
 
+# Columns added after the first release: name -> type. init_db() adds missing ones.
+MEETING_COLUMNS = {
+    "local_talk_ratio": "REAL",    # Share of the recording with only the mic speaking
+    "remote_talk_ratio": "REAL",   # Share with only the loopback (remote participants) speaking
+    "overlap_talk_ratio": "REAL",  # Share with both speaking
+    "audio_hash": "TEXT",          # SHA-256 of the audio (audio_utils.audio_sha256), key of llm_cache
+}
+
 def init_db():
     """Initialize the database with tables."""
     conn = sqlite3.connect(DB_PATH)
@@ -41,6 +49,42 @@ def init_db():
         )
     ''')
     
+    # Processing queue (see app/jobs.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            path TEXT NOT NULL,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            lease_owner TEXT,
+            lease_expires REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (kind, state)")
+    
+    # LLM responses by audio content, so duplicates are not sent to the model again
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            audio_hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            response_text TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (audio_hash, model, prompt_version)
+        )
+    ''')
+    
+    # Bring databases created by older versions up to date
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(meetings)")}
+    for column, column_type in MEETING_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE meetings ADD COLUMN {column} {column_type}")
+    
     conn.commit()
     conn.close()
 
@@ -101,6 +145,52 @@ def update_meeting(filename, title=None, summary_text=None, duration=None):
     finally:
         conn.close()
 
+def set_talk_time(filename, ratios):
+    """Stores talk-time ratios (see attribution.talk_time) for a meeting."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            "UPDATE meetings SET local_talk_ratio = ?, remote_talk_ratio = ?, overlap_talk_ratio = ? WHERE filename = ?",
+            (ratios["local"], ratios["remote"], ratios["overlap"], filename)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+def set_audio_hash(filename, audio_hash):
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute("UPDATE meetings SET audio_hash = ? WHERE filename = ?", (audio_hash, filename))
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+def get_cached_response(audio_hash, model, prompt_version):
+    """LLM response stored for this audio, model and prompt, or None."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT response_text FROM llm_cache WHERE audio_hash = ? AND model = ? AND prompt_version = ?",
+            (audio_hash, model, prompt_version)
+        ).fetchone()
+        return row["response_text"] if row else None
+    finally:
+        conn.close()
+
+def store_cached_response(audio_hash, model, prompt_version, response_text):
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (audio_hash, model, prompt_version, response_text, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (audio_hash, model, prompt_version, response_text, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
 def get_all_meetings():
     conn = get_db_connection()
     meetings = conn.execute("SELECT * FROM meetings ORDER BY created_at DESC").fetchall()
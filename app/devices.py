@@ -0,0 +1,238 @@
+"""
+Input device discovery and capability cache.
+
+Querying PortAudio and opening test streams is slow, so DeviceRegistry lists the
+input devices and probes the sample rates they accept once, caches the results
+keyed by device identity (name, host API, channel count) and only rescans when
+asked to, e.g. after a device was plugged in or removed.
+"""
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import sounddevice as sd
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+COMMON_RATES = (16000, 44100, 48000)
+
+# Priority map (lower is better) used when the same device shows up on several host APIs
+API_PRIORITY = {
+    'Windows WASAPI': 0,
+    'MME': 1,             # MME is often more compatible/stable than DirectSound for names
+    'Windows DirectSound': 2,
+    # 'Windows WDM-KS': 3 # Exclude WDM-KS entirely as it lists ghost/internal pins
+}
+
+# Host APIs whose format checks are safe to run from several threads at once
+PARALLEL_PROBE_APIS = ('Windows WASAPI', 'Core Audio')
+
+
+def normalize_device_name(name: str) -> str:
+    """Cleans up device names to help with de-duplication."""
+    # 1. Fix specific quirks like " )" -> ")"
+    name = name.replace(" )", ")")
+
+    # 2. Remove generic driver suffixes
+    name = re.sub(r'\s+\(Realtek\(R\) Audio\)', '', name, flags=re.IGNORECASE)
+    name = re.sub(r'\s+\(Realtek HD Audio.*\)', '', name, flags=re.IGNORECASE)
+    # Aggressive Intel regex: remove everything starting with (Intel
+    name = re.sub(r'\s+\(Intel.*', '', name, flags=re.IGNORECASE)
+    name = re.sub(r'\s+\(High Definition Audio.*\)', '', name, flags=re.IGNORECASE)
+
+    # 3. Remove empty parens "()" which often indicate ghost devices
+    name = name.replace("()", "")
+
+    # 4. Remove trailing/leading whitespace
+    return name.strip()
+
+
+class DeviceRegistry:
+    """
+    In-memory view of the input devices and the sample rates each one supports.
+
+    Device indices change whenever PortAudio is re-initialized, so capabilities
+    are cached by identity and survive a rescan for devices that are still present.
+    """
+
+    def __init__(self, channels=1, max_workers=4):
+        self.channels = channels
+        self.max_workers = max_workers
+        self._lock = threading.RLock()
+        self._devices = None # Cached list served by list_input_devices()
+        self._capabilities: Dict[Tuple, Dict] = {} # identity -> {"rates", "default_rate"}
+        self._signature = None
+
+    @staticmethod
+    def _identity(dev, api_name) -> Tuple:
+        return (dev['name'], api_name, dev['max_input_channels'])
+
+    def _query(self):
+        """Returns [(index, device info, host API name)] for every device PortAudio knows."""
+        host_apis = sd.query_hostapis()
+        return [(i, dev, host_apis[dev['hostapi']]['name']) for i, dev in enumerate(sd.query_devices())]
+
+    def _build_list(self, entries) -> List[Dict]:
+        unique_devices = {} # normalized_name -> {priority, device_info}
+        for i, dev, api_name in entries:
+            if dev['max_input_channels'] <= 0:
+                continue
+            # Skip WDM-KS entirely
+            if 'WDM-KS' in api_name:
+                continue
+            # Skip virtual system mappers to reduce clutter
+            if "Sound Mapper" in dev['name'] or "Primary Sound Capture" in dev['name']:
+                continue
+
+            norm_name = normalize_device_name(dev['name'])
+            if not norm_name:
+                continue
+
+            # Keep the entry from the best host API for each normalized name
+            priority = API_PRIORITY.get(api_name, 99)
+            if norm_name not in unique_devices or priority < unique_devices[norm_name]['priority']:
+                unique_devices[norm_name] = {
+                    'priority': priority,
+                    'data': {
+                        "index": i,
+                        "name": norm_name, # Use normalized name for cleaner UI
+                        "channels": dev['max_input_channels'],
+                    }
+                }
+
+        devices = [v['data'] for v in unique_devices.values()]
+        devices.sort(key=lambda x: x['name'])
+        return devices
+
+    def _probe(self, index, dev) -> Dict:
+        """Checks which common rates the device accepts without opening a stream."""
+        default_rate = int(dev['default_samplerate'])
+        channels = min(self.channels, dev['max_input_channels'])
+        rates = []
+        for rate in sorted({default_rate, *COMMON_RATES}):
+            try:
+                sd.check_input_settings(device=index, channels=channels, samplerate=rate)
+                rates.append(rate)
+            except Exception:
+                pass
+        return {"rates": rates, "default_rate": default_rate}
+
+    def _probe_entries(self, entries):
+        """Probes every uncached input device, in parallel on host APIs that allow it."""
+        pending = [(i, dev, api) for i, dev, api in entries
+                   if dev['max_input_channels'] > 0 and self._identity(dev, api) not in self._capabilities]
+        if not pending:
+            return
+
+        parallel = [e for e in pending if e[2] in PARALLEL_PROBE_APIS]
+        serial = [e for e in pending if e[2] not in PARALLEL_PROBE_APIS]
+        results = []
+        if parallel:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results += zip(parallel, pool.map(lambda e: self._probe(e[0], e[1]), parallel))
+        results += [(e, self._probe(e[0], e[1])) for e in serial]
+
+        for (i, dev, api), caps in results:
+            self._capabilities[self._identity(dev, api)] = caps
+        logger.info(f"Probed {len(pending)} input device(s) ({len(parallel)} in parallel)")
+
+    def _load(self):
+        """Fills the caches from the current PortAudio device list (caller holds the lock)."""
+        entries = self._query()
+        self._signature = tuple(self._identity(dev, api) for _, dev, api in entries)
+        self._devices = self._build_list(entries)
+        self._probe_entries(entries)
+
+    def list_input_devices(self) -> List[Dict]:
+        """Input devices for the UI, de-duplicated across host APIs. Served from memory after the first call."""
+        with self._lock:
+            if self._devices is None:
+                try:
+                    self._load()
+                except Exception as e:
+                    logger.error(f"Error listing devices: {e}")
+                    return []
+            return list(self._devices)
+
+    def capabilities(self, index: Optional[int]) -> Optional[Dict]:
+        """Cached capabilities of the device at `index` (None means the default input)."""
+        try:
+            if index is None:
+                index = sd.default.device[0]
+                if index is None or index < 0:
+                    return None
+            dev = sd.query_devices(index)
+            api_name = sd.query_hostapis()[dev['hostapi']]['name']
+        except Exception:
+            return None
+
+        with self._lock:
+            identity = self._identity(dev, api_name)
+            if identity not in self._capabilities:
+                self._probe_entries([(index, dev, api_name)])
+            return self._capabilities.get(identity)
+
+    def preferred_rates(self, index: Optional[int], requested: int) -> List[int]:
+        """
+        Sample rates to try when opening the device, best first.
+        Rates the probe confirmed come first so the first open normally succeeds;
+        unconfirmed rates are kept as a fallback because some drivers under-report.
+        """
+        caps = self.capabilities(index)
+        candidates = [requested]
+        if caps:
+            candidates.append(caps["default_rate"])
+        candidates += [44100, 48000, 16000]
+        candidates = list(dict.fromkeys(candidates))
+        if not caps:
+            return candidates
+        supported = [r for r in candidates if r in caps["rates"]]
+        return supported + [r for r in candidates if r not in supported]
+
+    def invalidate(self, index: Optional[int] = None):
+        """Drops cached data, for one device (e.g. after it failed to open) or all of them."""
+        with self._lock:
+            if index is None:
+                self._devices = None
+                self._capabilities.clear()
+                return
+            try:
+                dev = sd.query_devices(index)
+                api_name = sd.query_hostapis()[dev['hostapi']]['name']
+                self._capabilities.pop(self._identity(dev, api_name), None)
+            except Exception:
+                self._devices = None
+
+    def rescan(self) -> bool:
+        """
+        Re-initializes PortAudio so newly attached or removed devices become visible.
+        All streams must be closed first. Returns True if the device set changed.
+        """
+        with self._lock:
+            if hasattr(sd, "_terminate") and hasattr(sd, "_initialize"):
+                try:
+                    sd._terminate()
+                    sd._initialize()
+                except Exception as e:
+                    logger.error(f"Error re-initializing PortAudio: {e}")
+
+            old_signature = self._signature
+            try:
+                entries = self._query()
+            except Exception as e:
+                logger.error(f"Error listing devices: {e}")
+                return False
+            signature = tuple(self._identity(dev, api) for _, dev, api in entries)
+            if signature == old_signature and self._devices is not None:
+                return False
+
+            # Keep capabilities of devices that are still attached
+            present = set(signature)
+            self._capabilities = {k: v for k, v in self._capabilities.items() if k in present}
+            self._signature = signature
+            self._devices = self._build_list(entries)
+            self._probe_entries(entries)
+            logger.info(f"Audio devices changed: {len(self._devices)} input device(s) available")
+            return True
@@ -0,0 +1,115 @@
+"""
+Acoustic echo cancellation for the microphone stream.
+
+Remote participants' audio plays through the speakers and leaks back into the
+mic. The loopback stream is exactly that far-end signal, already aligned to the
+mic's timeline by the TimelineMixer, so it is used as the reference of a
+partitioned-block frequency-domain NLMS filter (overlap-save) whose output, the
+mic minus the estimated echo, replaces the mic before mixing.
+"""
+
+import numpy as np
+
+EPS = 1e-10
+
+
+class EchoCanceller:
+    """
+    Partitioned-block frequency-domain adaptive filter.
+
+    The echo path is modelled by `filter_seconds` of taps split into partitions of
+    one block each, so the cost per block is a few FFTs of 2 x block samples plus
+    elementwise products over (channels, partitions, bins), independent of the
+    filter length in taps.
+    """
+
+    def __init__(self, samplerate, channels=1, block=None, filter_seconds=0.2, step=0.5,
+                 min_step_scale=0.1, smoothing=0.1, doubletalk=0.5, min_reference=1e-4):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.block = block or max(16, int(samplerate * 0.01)) # 10ms blocks
+        self.partitions = max(1, int(np.ceil(filter_seconds * samplerate / self.block)))
+        self.step = step                    # NLMS step size (0..1)
+        self.min_step_scale = min_step_scale  # Lower bound of the echo-to-error step scaling
+        self.smoothing = smoothing          # Smoothing of the per-bin reference power
+        self.doubletalk = doubletalk        # Geigel ratio: mic peaks above this x reference peak freeze adaptation
+        self.min_reference = min_reference  # Reference RMS below which there is nothing to cancel or learn
+        self.bins = self.block + 1
+        self.reset()
+
+    def reset(self):
+        """Forget the learned echo path, e.g. after the mic or speakers changed."""
+        C, P, K, B = self.channels, self.partitions, self.bins, self.block
+        self._W = np.zeros((C, P, K), dtype=np.complex128)   # Filter, one spectrum per partition
+        self._X = np.zeros((C, P, K), dtype=np.complex128)   # Reference spectra, newest at _head
+        self._head = 0
+        self._power = np.full((C, K), EPS)
+        self._prev_ref = np.zeros((C, B))
+        self._ref_peaks = np.zeros((C, P)) # Recent reference block peaks, for double-talk detection
+        self._constrain = 0
+        self._err = np.zeros((C, 2 * B))
+
+    def process(self, mic: np.ndarray, ref: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Removes the echo of `ref` from `mic` (both (frames, channels), frames a
+        multiple of the block size) and returns the cleaned mic in `out`.
+        """
+        if out is None:
+            out = np.empty_like(mic)
+        B = self.block
+        for start in range(0, len(mic) - B + 1, B):
+            self._process_block(mic[start:start + B].T, ref[start:start + B].T, out[start:start + B].T)
+        tail = len(mic) % B
+        if tail:
+            out[len(mic) - tail:] = mic[len(mic) - tail:] # Not expected with 100ms frames of 10ms blocks
+        return out
+
+    def _process_block(self, d, x, out):
+        B, P = self.block, self.partitions
+
+        # Newest reference spectrum over [previous block, this block]
+        self._head = (self._head - 1) % P
+        Xf = np.fft.rfft(np.concatenate((self._prev_ref, x), axis=1), axis=1)
+        self._X[:, self._head] = Xf
+        self._prev_ref[:] = x
+        self._ref_peaks[:, self._head] = np.abs(x).max(axis=1)
+
+        # Echo estimate: sum over partitions of W[p] * X[delayed p] (overlap-save, keep the last B)
+        order = (self._head + np.arange(P)) % P
+        X = self._X[:, order]
+        y = np.fft.irfft(np.einsum("cpk,cpk->ck", self._W, X), axis=1)[:, B:]
+        e = d - y
+
+        # A filter that has clearly diverged must not make the mic worse: pass it through
+        # (the filter still learns from the error)
+        y_energy = np.einsum("cb,cb->c", y, y)
+        e_energy = np.einsum("cb,cb->c", e, e)
+        diverged = e_energy > 4.0 * np.einsum("cb,cb->c", d, d)
+        out[:] = np.where(diverged[:, None], d, e)
+
+        # Adapt only while the far end is active and the near end is not (audibly) talking over it
+        ref_rms = np.sqrt(np.mean(x * x, axis=1))
+        near_peak = np.abs(d).max(axis=1)
+        adapt = (ref_rms > self.min_reference) & (near_peak < self.doubletalk * self._ref_peaks.max(axis=1) + EPS)
+        power = np.abs(Xf) ** 2
+        self._power += self.smoothing * (power - self._power)
+        if not adapt.any():
+            return
+
+        self._err[:, B:] = e
+        E = np.fft.rfft(self._err, axis=1)
+        norm = self.step / (P * self._power + EPS)
+        # Variable step: an error much louder than the echo estimate is mostly near-end
+        # speech the Geigel test missed, so learn from it proportionally less
+        scale = np.clip(y_energy / (e_energy + EPS), self.min_step_scale, 1.0)
+        norm *= scale[:, None]
+        gradient = np.conj(X) * (E * norm)[:, None, :]
+        gradient[~adapt] = 0
+        self._W += gradient
+
+        # Gradient constraint (keep each partition a causal B-tap filter), one partition per block
+        j = self._constrain
+        w = np.fft.irfft(self._W[:, j], axis=1)
+        w[:, B:] = 0
+        self._W[:, j] = np.fft.rfft(w, axis=1)
+        self._constrain = (j + 1) % P
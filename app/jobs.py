@@ -0,0 +1,307 @@
+"""
+Durable queue for meeting processing.
+
+Every recording or upload to process is a row in the `jobs` table (created by
+database.init_db). A worker claims a job by taking a lease on it: the job moves
+to "running" and belongs to that worker until `lease_expires`. The worker keeps
+renewing the lease while it processes; a job whose lease ran out (the process
+was killed or restarted) is claimed again by the next free worker. Each claim
+counts as an attempt, and a job that failed `max_attempts` times is left
+"failed" instead of being retried forever.
+
+JobWorkerPool runs a fixed number of workers, so a bulk upload is processed
+`workers` meetings at a time, and resumes whatever was left over on startup.
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from app.config import Config
+from app.database import get_db_connection
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATES = (QUEUED, RUNNING, DONE, FAILED)
+
+POLL_INTERVAL = 2.0 # Seconds between looks for work from other processes
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def enqueue_job(path: str, kind: str = "meeting", max_attempts: Optional[int] = None) -> int:
+    """
+    Adds a job for `path` and returns its id. A path that already has a queued
+    or running job of the same kind is not queued twice; its job id is returned.
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE kind = ? AND path = ? AND state IN (?, ?)",
+            (kind, path, QUEUED, RUNNING)
+        ).fetchone()
+        if row:
+            conn.commit()
+            return row["id"]
+        cursor = conn.execute(
+            "INSERT INTO jobs (kind, path, state, attempts, max_attempts, created_at, updated_at) "
+            "VALUES (?, ?, ?, 0, ?, ?, ?)",
+            (kind, path, QUEUED, max_attempts or Config.JOB_MAX_ATTEMPTS, _now(), _now())
+        )
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+
+def fail_expired_jobs(kind: str = "meeting") -> List[Dict]:
+    """
+    Marks failed the jobs whose lease expired on their last attempt (the worker
+    died) and returns them, so the caller can report the failure.
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE kind = ? AND state = ? AND lease_expires < ? AND attempts >= max_attempts",
+            (kind, RUNNING, now)
+        ).fetchall()
+        jobs = []
+        for row in rows:
+            conn.execute(
+                "UPDATE jobs SET state = ?, last_error = COALESCE(last_error, 'Interrupted'), lease_owner = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (FAILED, _now(), row["id"])
+            )
+            job = dict(row)
+            job.update(state=FAILED, last_error=row["last_error"] or "Interrupted", lease_owner=None)
+            jobs.append(job)
+        conn.commit()
+        return jobs
+    finally:
+        conn.close()
+
+
+def claim_job(worker: str, lease_seconds: float, kind: str = "meeting") -> Optional[Dict]:
+    """
+    Leases the oldest job that is queued or whose lease expired with attempts
+    left, or returns None. See fail_expired_jobs for the others.
+    """
+    conn = get_db_connection()
+    try:
+        # IMMEDIATE takes the write lock up front, so two workers cannot claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        now = time.time()
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE kind = ? AND (state = ? OR (state = ? AND lease_expires < ? "
+            "AND attempts < max_attempts)) ORDER BY id LIMIT 1",
+            (kind, QUEUED, RUNNING, now)
+        ).fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        conn.execute(
+            "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, "
+            "updated_at = ? WHERE id = ?",
+            (RUNNING, worker, now + lease_seconds, _now(), row["id"])
+        )
+        conn.commit()
+        job = dict(row)
+        job.update(state=RUNNING, attempts=row["attempts"] + 1, lease_owner=worker)
+        return job
+    finally:
+        conn.close()
+
+
+def renew_lease(job_id: int, worker: str, lease_seconds: float) -> bool:
+    """Extends a lease; False if the job is no longer leased by `worker`."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+            (time.time() + lease_seconds, job_id, RUNNING, worker)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def complete_job(job_id: int, worker: str):
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            "UPDATE jobs SET state = ?, lease_owner = NULL, last_error = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (DONE, _now(), job_id, worker)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fail_job(job_id: int, worker: str, error: str) -> bool:
+    """Records a failed attempt. Returns True if the job will be retried."""
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+            "lease_owner = NULL, last_error = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+            (QUEUED, FAILED, error, _now(), job_id, worker)
+        )
+        conn.commit()
+        row = conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row["state"] == QUEUED
+    finally:
+        conn.close()
+
+
+def get_job(job_id: int) -> Optional[Dict]:
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def job_counts() -> Dict[str, int]:
+    """Number of jobs in each state."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+    finally:
+        conn.close()
+    counts = dict.fromkeys(STATES, 0)
+    counts.update({row["state"]: row["n"] for row in rows})
+    return counts
+
+
+class JobWorkerPool:
+    """
+    Runs `handler(path)` for queued jobs on `workers` threads. A handler that
+    raises fails the attempt; `on_failed(path, error)` is called once a job has
+    no attempts left.
+    """
+
+    def __init__(self, handler: Callable[[str], None], workers: Optional[int] = None,
+                 lease_seconds: Optional[float] = None, kind: str = "meeting",
+                 on_failed: Optional[Callable[[str, str], None]] = None):
+        self.handler = handler
+        self.workers = max(1, workers or Config.JOB_WORKERS)
+        self.lease_seconds = lease_seconds or Config.JOB_LEASE_SECONDS
+        self.kind = kind
+        self.on_failed = on_failed
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running = threading.Event()
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._active = {} # job id -> worker name, leases the heartbeat renews
+        self._active_lock = threading.Lock()
+
+    @property
+    def active_jobs(self) -> int:
+        with self._active_lock:
+            return len(self._active)
+
+    def start(self):
+        if self._running.is_set():
+            return
+        self._running.set()
+        self._stopped.clear()
+        counts = job_counts()
+        if counts[QUEUED] or counts[RUNNING]:
+            logger.info(f"Resuming {counts[QUEUED]} queued and {counts[RUNNING]} interrupted job(s)")
+        self._threads = [threading.Thread(target=self._work, args=(f"{self.worker_id}:{i}",),
+                                          name=f"job-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Job workers started ({self.workers})")
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Stops taking new jobs. Jobs still running after `timeout` keep their
+        lease and are picked up again once it expires.
+        """
+        self._running.clear()
+        self._stopped.set()
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, path: str) -> int:
+        """Queues `path` and wakes a worker."""
+        job_id = enqueue_job(path, self.kind)
+        self._wakeup.set()
+        return job_id
+
+    def _work(self, worker):
+        while self._running.is_set():
+            try:
+                for expired in fail_expired_jobs(self.kind):
+                    logger.error(f"Job {expired['id']} ({expired['path']}) was interrupted on its last attempt")
+                    self._failed(expired["path"], expired["last_error"])
+                job = claim_job(worker, self.lease_seconds, self.kind)
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                # Jobs queued by other processes or with expired leases are found by polling
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(job, worker)
+
+    def _run(self, job, worker):
+        path = job["path"]
+        if job["attempts"] > 1:
+            logger.info(f"Retrying job {job['id']} ({path}), attempt {job['attempts']}/{job['max_attempts']}")
+        with self._active_lock:
+            self._active[job["id"]] = worker
+        try:
+            self.handler(path)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.error(f"Job {job['id']} ({path}) failed: {error}")
+            if not fail_job(job["id"], worker, error):
+                self._failed(path, error)
+        else:
+            complete_job(job["id"], worker)
+        finally:
+            with self._active_lock:
+                self._active.pop(job["id"], None)
+
+    def _failed(self, path, error):
+        """Reports a job that has no attempts left."""
+        if self.on_failed:
+            try:
+                self.on_failed(path, error)
+            except Exception as callback_error:
+                logger.error(f"Job failure callback failed: {callback_error}")
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._active_lock:
+                active = list(self._active.items())
+            for job_id, worker in active:
+                try:
+                    if not renew_lease(job_id, worker, self.lease_seconds):
+                        logger.warning(f"Lost the lease on job {job_id}")
+                except Exception as e:
+                    logger.warning(f"Could not renew the lease on job {job_id}: {e}")
@@ -0,0 +1,106 @@
+"""
+Summaries that grow while a meeting is still being recorded.
+
+With LIVE_SUMMARY on, recordings are written in segments (of the "Segment
+Length" setting, or of LIVE_SEGMENT_MINUTES when it is 0; see
+MeetingService._apply_recording_settings) and every segment is handed to the
+provider as soon as the recorder closes it (on_segment_closed). The notes make
+up a rolling partial summary, shown by /status and /meeting/{filename}.
+
+Notes are numbered and timed exactly like the windows of the finished
+recording's map-reduce summary (GeminiProvider.summarize_part), and are stored
+in llm_cache under the same keys. After stop, processing only has to take notes
+on the final segment and merge.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from app.segments import manifest_for_segment
+from app.trim import format_timestamp, remap_timestamps
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LiveSummarizer:
+    def __init__(self, llm_provider):
+        self.llm_provider = llm_provider
+        # One segment at a time, in order: each part is placed after the ones before it
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nabu-live")
+        self._lock = threading.Lock()
+        self._recordings = {} # Recording filename -> state, see _summarize
+        self._latest = None
+
+    def segment_closed(self, segment_path: str, final: bool):
+        """on_segment_closed callback of the recorder; returns at once."""
+        if final:
+            return # Summarized with the finished recording, which is queued right after
+        self._executor.submit(self._summarize, manifest_for_segment(segment_path), segment_path)
+
+    def _summarize(self, recording: str, segment_path: str):
+        name = os.path.basename(recording)
+        with self._lock:
+            state = self._recordings.setdefault(name, {
+                "path": recording, "index": 0, "offset": 0.0, "sections": [], "failed": False,
+                "summary": "", "updated_at": None,
+            })
+            self._latest = name
+            if state["failed"]:
+                return
+            index, offset = state["index"], state["offset"]
+
+        logger.info(f"Summarizing {os.path.basename(segment_path)} while recording...")
+        try:
+            notes, duration = self.llm_provider.summarize_part(segment_path, index, offset)
+        except Exception as e:
+            # Later segments could not be placed on the timeline; the full summary still runs after stop
+            logger.error(f"Live summary of {name} stopped: {e}")
+            with self._lock:
+                state["failed"] = True
+            return
+
+        with self._lock:
+            state["index"] += len(notes)
+            state["offset"] += duration
+            state["sections"].append((offset, duration, [n for n in notes if not n.startswith("Error")]))
+            sections = list(state["sections"])
+        # Rendered here, once per segment, so that polling the partial summary costs nothing
+        summary = self._render(recording, sections)
+        with self._lock:
+            state["summary"] = summary
+            state["updated_at"] = time.time()
+
+    @staticmethod
+    def _render(recording: str, sections) -> str:
+        text = "\n\n".join(f"## [{format_timestamp(offset)}] - [{format_timestamp(offset + duration)}]\n" + "\n\n".join(notes)
+                           for offset, duration, notes in sections if notes)
+        try:
+            return remap_timestamps(text, recording) # Positions in the recording rather than in the trimmed upload
+        except Exception:
+            return text # The open segment may not be readable yet
+
+    def partial_summary(self, filename: Optional[str] = None) -> Optional[Dict]:
+        """
+        Notes taken so far on a recording (the latest one by default), as
+        {"filename", "summary", "segments", "updated_at"}, or None if there are none.
+        """
+        with self._lock:
+            name = filename or self._latest
+            state = self._recordings.get(name)
+            if not state or state["updated_at"] is None:
+                return None
+            return {"filename": name, "summary": state["summary"], "segments": len(state["sections"]),
+                    "updated_at": state["updated_at"]}
+
+    def discard(self, filename: str):
+        """Forgets a recording once its full summary is saved."""
+        with self._lock:
+            self._recordings.pop(os.path.basename(filename), None)
+            if self._latest == os.path.basename(filename):
+                self._latest = None
+
+    def stop(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
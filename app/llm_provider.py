@@ -1,18 +1,43 @@
 import os
 import time
+import hashlib
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
+from typing import Optional
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from dotenv import load_dotenv
 from app.config import Config
 from app.logger import get_logger
+from app.segments import segment_paths
+from app.audio_utils import is_split_recording, downmix_to_mono, audio_sha256, get_audio_duration
+from app.attribution import talk_time_note
+from app.transcode import speech_rendition
+from app.trim import trim_silence, shift_timestamps, format_timestamp
+from app.chunks import plan_windows, cut_window, window_extension
+from app.database import get_cached_response, store_cached_response
 
 logger = get_logger(__name__)
 
 load_dotenv()
 
+FILE_TTL_SECONDS = 48 * 3600 # How long Gemini keeps uploaded files
+FILE_EXPIRY_MARGIN = 3600    # Stop reusing a file this long before it expires
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
 class LLMProvider(ABC):
     @abstractmethod
-    def process_audio(self, audio_path: str) -> str:
+    def process_audio(self, audio_path: str, prompt: Optional[str] = None) -> str:
         pass
 
 class GeminiProvider(LLMProvider):
@@ -28,6 +53,9 @@ class GeminiProvider(LLMProvider):
             logger.info("Gemini API configured")
             
         self.model_name = Config.GEMINI_MODEL
+        self._model = None
+        self._files = {} # (audio hash, uploaded form) -> (uploaded file, expires at), see _uploaded_file
+        self._files_lock = threading.Lock() # Job workers share one provider
         
         self.system_prompt = """
         You are an expert Meeting Secretary. Your task is to listen to the audio recording and create a professional, structured meeting summary.
@@ -49,7 +77,7 @@ class GeminiProvider(LLMProvider):
         [Concise, high-level overview of the meeting's purpose and key outcomes. Keep it professional and direct.]
         
         ## Key Discussion Points
-        *   **[Topic 1]**: [Detail] (Ref: "Direct quote or timestamp if available")
+        *   **[Topic 1]**: [Detail] (Ref: "Direct quote or [MM:SS] timestamp if available")
         *   **[Topic 2]**: [Detail]
         
         ## Action Items
@@ -64,37 +92,132 @@ class GeminiProvider(LLMProvider):
         5.  **Speakers**: Identify speakers by name if mentioned, otherwise use "Speaker 1", "Speaker 2", etc.
         6.  **Quality**: Focus on substance over fluff. Capture the core decisions and insights.
         7.  **Tone and Style**: Use a professional, informational tone. Do NOT use emojis or casual language. The summary should be suitable for business documentation.
+        8.  **Timestamps**: Write positions in the recording in square brackets, as [MM:SS] or [H:MM:SS]. Write times of day without brackets.
         """
         
-    def process_audio(self, audio_path: str) -> str:
-        """Process audio with retry logic."""
-        if not self.api_key:
-            return "Error: API Key missing."
-            
-        if not os.path.exists(audio_path):
-            return "Error: Audio file not found."
+        # Map step of long meetings (see _summarize_windows); the reduce step uses system_prompt.
+        # No part count: live notes (summarize_part) are taken before it is known
+        self.window_prompt = """
+        You are an expert Meeting Secretary. This audio is part {index} of a long meeting recording, covering {start} to {end} of the meeting. Consecutive parts may overlap slightly.
+        
+        Write detailed notes on this part only, in Markdown:
+        *   **Speakers**: Everyone heard, by name if mentioned, otherwise "Speaker 1", "Speaker 2", etc., with a short description (role, voice) so they can be matched across parts.
+        *   **Discussion**: Each topic with its key points, decisions and open questions. Quote important statements and give timestamps in square brackets ([MM:SS]) counted from the start of this audio part. Write times of day without brackets.
+        *   **Action Items**: Only tasks that are explicitly stated, with their owner.
+        
+        Do NOT add an introduction, a conclusion or emojis. Do NOT return JSON.
+        """
+        
+    def _build_prompt(self, audio_path: str, parts) -> str:
+        prompt = self.system_prompt
+        if len(parts) > 1:
+            prompt += f"\nThe recording is split into {len(parts)} consecutive audio parts, in order. Treat them as one continuous meeting.\n"
+        prompt += talk_time_note(audio_path)
+        return prompt
+    
+    def cache_key(self, audio_path: str):
+        """
+        (model, prompt_version) a response for this recording depends on besides
+        its audio. The prompt version is a hash of the full prompt, so editing
+        the prompt invalidates cached responses.
+        """
+        prompt = self._build_prompt(audio_path, segment_paths(audio_path))
+        return self.model_name, hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+        
+    def _get_model(self):
+        """The model client, built once and shared by all requests."""
+        if self._model is None:
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+    
+    def _uploaded_file(self, part: str):
+        """
+        Gemini file handle for an audio part. A part is uploaded once and its
+        handle reused (by content hash) until Gemini expires it, so retries and
+        further questions about the same recording only pay for generation.
+        """
+        split = is_split_recording(part)
+        speech = speech_rendition(part, split=split, trim=trim_silence)
+        # A rendition is keyed by its own content, so one rebuilt with other settings is uploaded again
+        key = (audio_sha256(speech), "speech") if speech else (audio_sha256(part), "mono" if split else "original")
+        audio_file = self._cached_file(key)
+        if audio_file is not None:
+            logger.info(f"Reusing uploaded audio for {part}")
+            return audio_file
         
+        path, temp_files = self._upload_audio(part, split, speech)
+        try:
+            return self._upload(path, key)
+        finally:
+            _remove(temp_files)
+    
+    def _upload_audio(self, part: str, split: bool, speech: Optional[str]):
+        """The audio to upload for a part, and temporary files to delete afterwards."""
+        # 16kHz mono Opus without dead air, a fraction of the original's size (see app/transcode.py)
+        if speech:
+            return speech, []
+        temp_files = []
+        path = trim_silence(part) or part
+        if path != part:
+            temp_files.append(path)
+        # Split-channel recordings are uploaded as a mono mix (half the size, one voice track)
+        if split:
+            path = downmix_to_mono(path)
+            temp_files.append(path)
+        return path, temp_files
+    
+    def _cached_file(self, key):
+        now = time.time()
+        with self._files_lock:
+            for stale in [k for k, (_, expires_at) in self._files.items() if expires_at <= now]:
+                del self._files[stale]
+            return self._files[key][0] if key in self._files else None
+    
+    def _upload(self, path: str, key):
+        now = time.time()
+        logger.info(f"Uploading {path} to Gemini ({os.path.getsize(path) / 1024 / 1024:.1f}MB)...")
+        audio_file = genai.upload_file(path=path)
+        expiration = getattr(audio_file, "expiration_time", None)
+        expires_at = (expiration.timestamp() if expiration else now + FILE_TTL_SECONDS) - FILE_EXPIRY_MARGIN
+        with self._files_lock:
+            self._files[key] = (audio_file, expires_at)
+        return audio_file
+    
+    def _forget_files(self, audio_files):
+        """Drops handles Gemini no longer accepts, so the next attempt uploads again."""
+        names = {getattr(f, "name", None) for f in audio_files}
+        with self._files_lock:
+            for key in [k for k, (f, _) in self._files.items() if getattr(f, "name", None) in names]:
+                del self._files[key]
+        
+    def _generate(self, description: str, prompt: str, upload=lambda: []) -> str:
+        """
+        One generate_content request with retry logic. `upload()` returns the
+        audio files to send and is called on every attempt, so files Gemini
+        has dropped are uploaded again. Failures are returned as "Error..." text.
+        """
         for attempt in range(self.max_retries):
+            audio_files = []
             try:
-                logger.info(f"Uploading {audio_path} to Gemini (attempt {attempt + 1}/{self.max_retries})...")
-                
-                # Upload the audio file
-                audio_file = genai.upload_file(path=audio_path)
-                
-                model = genai.GenerativeModel(self.model_name)
-                
+                logger.info(f"Sending {description} to Gemini (attempt {attempt + 1}/{self.max_retries})...")
+            
+                # Upload the audio file(s), unless an earlier request already did
+                audio_files = upload()
+            
                 logger.info("Generating summary...")
-                response = model.generate_content(
-                    [self.system_prompt, audio_file],
+                response = self._get_model().generate_content(
+                    [prompt] + audio_files,
                     request_options={"timeout": Config.LLM_TIMEOUT}
                 )
-                
+            
                 logger.info("Summary generated successfully")
                 return response.text
-                
+            
             except Exception as e:
                 logger.error(f"Gemini API error (attempt {attempt + 1}/{self.max_retries}): {e}")
-                
+                if isinstance(e, (google_exceptions.NotFound, google_exceptions.PermissionDenied)):
+                    self._forget_files(audio_files) # Deleted or expired on Gemini's side
+            
                 if attempt < self.max_retries - 1:
                     # Exponential backoff
                     wait_time = self.retry_delay * (2 ** attempt)
@@ -104,3 +227,154 @@ class GeminiProvider(LLMProvider):
                     # Final attempt failed
                     logger.error(f"All {self.max_retries} attempts failed")
                     return f"Error processing meeting after {self.max_retries} attempts: {e}"
+    
+    def _part_windows(self, part: str, index: int, offset: float, folder: str):
+        """
+        Windows of one part of a recording as (index, offset, length, path),
+        numbered from `index` and placed `offset` seconds into the timeline the
+        model sees (the uploaded parts end to end). Also returns the part's
+        length on that timeline and temporary files to delete afterwards.
+        """
+        split = is_split_recording(part)
+        path, temp_files = self._upload_audio(part, split, speech_rendition(part, split=split, trim=trim_silence))
+        try:
+            duration = get_audio_duration(path)
+            if duration <= 0:
+                raise ValueError(f"could not measure {path}")
+            spans = plan_windows(duration)
+            if len(spans) == 1:
+                return [(index, offset, duration, path)], duration, temp_files # A short part is its own window
+            windows = []
+            for start, end in spans:
+                output = os.path.join(folder, f"window_{index + len(windows):03d}{window_extension(path)}")
+                windows.append((index + len(windows), offset + start, end - start, cut_window(path, start, end, output)))
+            return windows, duration, temp_files
+        except Exception:
+            _remove(temp_files)
+            raise
+    
+    def _window_key(self, window):
+        """Prompt of a window, and its (audio hash, prompt version) in llm_cache."""
+        index, offset, length, path = window
+        prompt = self.window_prompt.format(index=index + 1, start=format_timestamp(offset),
+                                           end=format_timestamp(offset + length))
+        return prompt, audio_sha256(path), hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+    
+    def _cached_notes(self, window) -> Optional[str]:
+        _, audio_hash, prompt_version = self._window_key(window)
+        return get_cached_response(audio_hash, self.model_name, prompt_version)
+    
+    def _summarize_window(self, window) -> str:
+        """
+        Notes on one window of a long meeting, with timestamps moved to the
+        meeting's timeline. Notes are cached by the window's audio, so a job
+        that is retried after a failed window only sends the windows that
+        failed, and notes taken live are not taken again.
+        """
+        index, offset, length, path = window
+        prompt, audio_hash, prompt_version = self._window_key(window)
+        notes = get_cached_response(audio_hash, self.model_name, prompt_version)
+        if notes is None:
+            key = (audio_hash, "window")
+            notes = self._generate(f"part {index + 1} ({format_timestamp(offset)}-{format_timestamp(offset + length)})", prompt,
+                                   lambda: [self._cached_file(key) or self._upload(path, key)])
+            if notes.startswith("Error"):
+                return notes
+            store_cached_response(audio_hash, self.model_name, prompt_version, notes)
+        return shift_timestamps(notes, offset, length)
+    
+    def summarize_part(self, part: str, index: int = 0, offset: float = 0.0):
+        """
+        Notes on one closed part of a recording that is still going on (see
+        app/live.py), with windows numbered from `index` and placed `offset`
+        seconds in, as the summary of the finished recording will place them.
+        Returns the notes of each window (failures as "Error..." text) and the
+        part's length on the model's timeline; raises if it cannot be cut.
+        """
+        if not self.api_key:
+            raise RuntimeError("API Key missing")
+        folder = tempfile.mkdtemp(prefix="nabu_windows_")
+        temp_files = []
+        try:
+            windows, duration, temp_files = self._part_windows(part, index, offset, folder)
+            return [self._summarize_window(window) for window in windows], duration
+        finally:
+            _remove(temp_files)
+            shutil.rmtree(folder, ignore_errors=True)
+    
+    def _summarize_windows(self, audio_path: str, parts) -> Optional[str]:
+        """
+        Map-reduce summary of a long meeting (see app/chunks.py): the audio that
+        would be uploaded is cut into overlapping windows, up to CHUNK_WORKERS
+        windows are summarized at a time, and a text-only request merges the
+        notes into the usual JSON. Recordings whose parts were summarized live
+        take this path too, whatever their length. Returns None if the audio is
+        better sent in one request.
+        """
+        long = len(plan_windows(get_audio_duration(audio_path))) > 1
+        if not long and len(parts) == 1:
+            return None
+        
+        folder = tempfile.mkdtemp(prefix="nabu_windows_")
+        temp_files = []
+        try:
+            windows, offset = [], 0.0
+            try:
+                for part in parts:
+                    part_windows, duration, temps = self._part_windows(part, len(windows), offset, folder)
+                    windows += part_windows
+                    temp_files += temps
+                    offset += duration
+            except Exception as e:
+                logger.warning(f"Could not cut {audio_path} into windows ({e}). Sending it in one request.")
+                return None
+            if len(windows) == 1:
+                return None # Trimmed short enough after all
+            if not long and sum(self._cached_notes(window) is None for window in windows) > 1:
+                return None # Segments of a short meeting without live notes
+            
+            logger.info(f"Summarizing {audio_path} in {len(windows)} windows ({Config.CHUNK_WORKERS} at a time)...")
+            with ThreadPoolExecutor(max_workers=max(1, Config.CHUNK_WORKERS)) as pool:
+                notes = list(pool.map(self._summarize_window, windows))
+        finally:
+            _remove(temp_files)
+            shutil.rmtree(folder, ignore_errors=True)
+        
+        for window_notes in notes:
+            if window_notes.startswith("Error"):
+                return window_notes # processing raises on it; the retry reuses the windows that succeeded
+        
+        prompt = self.system_prompt
+        prompt += (f"\nInstead of audio, you are given notes on {len(windows)} consecutive parts of one long meeting, in order. "
+                   "Consecutive parts may overlap slightly. Timestamps are counted from the start of the meeting. "
+                   "Write one summary of the whole meeting: treat speakers described alike as the same person, "
+                   "mention points repeated in the overlaps once, and keep the bracketed timestamps as given.\n")
+        prompt += talk_time_note(audio_path)
+        for (index, offset, length, _), window_notes in zip(windows, notes):
+            prompt += f"\n\n# Part {index + 1} ({format_timestamp(offset)} - {format_timestamp(offset + length)})\n{window_notes}"
+        return self._generate(f"notes on {len(windows)} parts of {audio_path}", prompt)
+    
+    def process_audio(self, audio_path: str, prompt: Optional[str] = None) -> str:
+        """
+        Process audio with retry logic. `prompt` replaces the summary prompt, e.g.
+        to summarize again differently or to ask a follow-up question. Summaries
+        of meetings longer than CHUNK_MINUTES are built from windows (map-reduce).
+        """
+        if not self.api_key:
+            return "Error: API Key missing."
+            
+        if not os.path.exists(audio_path):
+            return "Error: Audio file not found."
+        
+        # Segmented recordings are sent as their consecutive parts in one request
+        parts = [p for p in segment_paths(audio_path) if os.path.exists(p)]
+        if not parts:
+            return "Error: Audio file not found."
+        
+        if prompt is None:
+            summary = self._summarize_windows(audio_path, parts)
+            if summary is not None:
+                return summary
+            prompt = self._build_prompt(audio_path, parts)
+        
+        return self._generate(audio_path, prompt, lambda: [self._uploaded_file(part) for part in parts])
@@ -0,0 +1,53 @@
+"""
+Capture pipeline health in the Prometheus text exposition format, served at
+/metrics. Everything comes from AudioRecorder.get_capture_stats().
+"""
+
+SOURCES = ("mic", "sys")
+
+# Stats that only ever grow; everything else is reported as a gauge
+COUNTERS = {
+    "overflows", "dropped_frames", "callbacks", "xruns", "input_overflows",
+    "input_underflows", "stalls", "restarts", "resyncs",
+}
+
+
+class _Exposition:
+    def __init__(self):
+        self.lines = []
+        self._typed = set()
+
+    def add(self, section, key, value, labels=None):
+        """Adds nabu_<section>_<key>; strings and missing values are skipped."""
+        if value is None or isinstance(value, str):
+            return
+        name = f"nabu_{section}_{key}"
+        if name not in self._typed:
+            self._typed.add(name)
+            self.lines.append(f"# TYPE {name} {'counter' if key in COUNTERS else 'gauge'}")
+        label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+        self.lines.append(f"{name}{label_text} {int(value) if isinstance(value, bool) else value}")
+
+
+def render_metrics(stats: dict) -> str:
+    """Formats capture stats; per-stream values get a source="mic"|"sys" label."""
+    out = _Exposition()
+
+    stream = stats.get("stream", {})
+    out.add("capture", "info", 1, {
+        "latency_profile": stream.get("latency_profile"),
+        "latency": stream.get("latency"),
+    })
+    out.add("capture", "blocksize_frames", stream.get("blocksize"))
+
+    # Samples of one metric have to be adjacent, so iterate keys first
+    keys = list(dict.fromkeys(key for source in SOURCES for key in stats.get(source, {})))
+    for key in keys:
+        for source in SOURCES:
+            out.add("capture", key, stats.get(source, {}).get(key), {"source": source})
+
+    for section in ("writer", "alignment"):
+        for key, value in stats.get(section, {}).items():
+            out.add(section, key, value)
+
+    return "\n".join(out.lines) + "\n"
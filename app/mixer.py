@@ -0,0 +1,125 @@
+"""
+Timestamp-aligned mixing of the microphone and loopback streams.
+The master stream defines the timeline; the other stream is resampled onto it
+using the capture timestamps PortAudio passes to the stream callbacks.
+"""
+
+import numpy as np
+
+
+class TimelineMixer:
+    """
+    Produces fixed-size frames of the master stream with the slave stream aligned to it.
+
+    Both rings keep a log of (frame index, capture time) pairs. From those the mixer
+    estimates where the slave stream is on the master's timeline and how fast its clock
+    runs relative to the master, then reads the slave with linear fractional
+    resampling so that long sessions do not slowly slip out of sync.
+    """
+
+    def __init__(self, samplerate, channels=1, frame_duration=0.1, max_latency=0.3,
+                 max_slew=0.005, resync_threshold=0.05):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.frame = max(1, int(samplerate * frame_duration))
+        self.max_wait = int(samplerate * max_latency)       # Frames we wait for a late slave
+        self.max_slew = max_slew                            # Max rate correction per frame
+        self.resync_frames = int(samplerate * resync_threshold)
+
+        # Output frames, overwritten by every successful next_frame()
+        self.master = np.zeros((self.frame, channels), dtype=np.float32)
+        self.slave = np.zeros((self.frame, channels), dtype=np.float32)
+
+        # Source window for interpolation, large enough for any ratio we accept
+        self._src = np.zeros((2 * self.frame + 4, channels), dtype=np.float32)
+        self._xp = np.arange(len(self._src), dtype=np.float64)
+        self._grid = np.arange(self.frame, dtype=np.float64) / self.frame
+
+        self.resyncs = 0
+        self.drift_ppm = 0.0
+        self.reset()
+
+    def reset(self):
+        """Forget the slave position, e.g. after a stream was reopened."""
+        self._pos = None
+        self._locked = False # True once _pos was derived from timestamps
+
+    def _estimate(self, master, slave, master_frame):
+        """Returns (slave frames per master frame, slave position of master_frame or None)."""
+        fit_m = master.clock_fit(self.samplerate)
+        fit_s = slave.clock_fit(self.samplerate)
+        if fit_m is None or fit_s is None:
+            return 1.0, None
+
+        m_ref, m_time, m_period = fit_m
+        s_ref, s_time, s_period = fit_s
+        ratio = m_period / s_period
+        self.drift_ppm = (ratio - 1.0) * 1e6
+
+        when = m_time + (master_frame - m_ref) * m_period
+        target = s_ref + (when - s_time) / s_period
+
+        # Streams whose timestamps are not on a common clock cannot be aligned by time
+        if not (slave.read_position - slave.capacity <= target <= slave.write_position + slave.capacity):
+            return ratio, None
+        return ratio, target
+
+    def slave_position(self, master, slave):
+        """Frame of `slave` captured with the next master frame, or None without usable timestamps."""
+        return self._estimate(master, slave, master.read_position)[1]
+
+    def next_frame(self, master, slave=None) -> bool:
+        """
+        Fills self.master and self.slave with the next aligned frame.
+
+        Returns False if the master does not have a full frame yet, or if the slave
+        is late and we have not yet waited max_latency for it.
+        """
+        frame = self.frame
+        if master.available < frame:
+            return False
+
+        if slave is None:
+            master.read_into(self.master)
+            self.slave.fill(0)
+            return True
+
+        ratio, target = self._estimate(master, slave, master.read_position)
+
+        correction = 0.0
+        if self._pos is None or (target is not None and (not self._locked or abs(target - self._pos) > self.resync_frames)):
+            if self._locked:
+                self.resyncs += 1
+            self._pos = target if target is not None else float(slave.read_position)
+            self._locked = target is not None
+        elif target is not None:
+            # Steer gently toward the timestamp estimate instead of jumping
+            limit = frame * self.max_slew
+            correction = min(max((target - self._pos) * 0.1, -limit), limit)
+        else:
+            # No usable timestamps: fall back to keeping the slave backlog bounded
+            self._locked = False
+            if slave.write_position - self._pos > frame + self.max_wait:
+                self.resyncs += 1
+                self._pos = float(slave.write_position - frame)
+            elif self._pos > slave.write_position + self.max_wait:
+                self._pos = float(slave.write_position)
+
+        step = frame * ratio + correction
+        start = int(np.floor(self._pos))
+        end = int(np.floor(self._pos + step)) + 2
+        if end > slave.write_position and master.available < frame + self.max_wait:
+            return False
+
+        src = self._src[:end - start]
+        src.fill(0)
+        slave.peek_into(src, start)
+        x = (self._pos - start) + self._grid * step
+        xp = self._xp[:len(src)]
+        for c in range(self.channels):
+            self.slave[:, c] = np.interp(x, xp, src[:, c])
+
+        master.read_into(self.master)
+        self._pos += step
+        slave.discard_until(int(np.floor(self._pos)))
+        return True
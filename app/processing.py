@@ -0,0 +1,285 @@
+"""
+Post-processing of a finished recording: duration, LLM summary, JSON repair and
+database writes.
+
+Runs on the job workers of the server process, or in separate worker processes
+started with `python main.py worker` (see app/worker.py). Either way the work
+comes from the job queue in app/jobs.py.
+"""
+
+import json
+import os
+from datetime import datetime
+from app.database import (
+    add_meeting, add_tag, set_talk_time, update_meeting, get_meeting, set_audio_hash,
+    get_cached_response, store_cached_response
+)
+from app.attribution import talk_time
+from app.audio_utils import get_audio_duration, audio_sha256
+from app.trim import remap_timestamps
+from app.config import Config
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ProviderError(Exception):
+    """The LLM provider reported a failure. Raised so that the job is retried."""
+
+
+def _audio_hash(filename):
+    """Hash stored with the meeting (uploads are hashed at ingest), else computed; None if unreadable."""
+    meeting = get_meeting(os.path.basename(filename))
+    if meeting and meeting.get("audio_hash"):
+        return meeting["audio_hash"]
+    try:
+        return audio_sha256(filename)
+    except OSError as e:
+        logger.warning(f"Could not hash {filename}: {e}")
+        return None
+
+
+def _llm_response(filename, llm_provider, audio_hash):
+    """
+    The LLM's response for a recording. Audio that was summarized before with
+    the same model and prompt is answered from llm_cache without calling the API.
+    Timestamps are mapped from the trimmed upload to the original before caching.
+    Raises ProviderError if the provider failed.
+    """
+    cache_key = getattr(llm_provider, "cache_key", None)
+    model = prompt_version = None
+    if audio_hash is not None and cache_key is not None:
+        model, prompt_version = cache_key(filename)
+        cached = get_cached_response(audio_hash, model, prompt_version)
+        if cached is not None:
+            logger.info(f"Reusing the cached response for identical audio ({audio_hash[:12]})")
+            return cached
+    response_text = llm_provider.process_audio(filename)
+    if response_text.startswith("Error"): # The provider reports failures as text
+        raise ProviderError(response_text)
+    response_text = remap_timestamps(response_text, filename)
+    if model is not None:
+        store_cached_response(audio_hash, model, prompt_version, response_text)
+    return response_text
+
+
+def process_meeting(filename, llm_provider, min_recording_duration=None):
+    """
+    Summarizes a recording and saves it as a meeting. Returns a dict with the
+    title, tags, duration and whether the recording was too short to summarize.
+    Raises on errors, so that the job is retried.
+    """
+    if min_recording_duration is None:
+        min_recording_duration = Config.MIN_RECORDING_DURATION
+    
+    logger.info(f"Processing meeting: {filename}")
+    try:
+        # Get duration using robust audio_utils
+        duration = get_audio_duration(filename)
+        audio_hash = _audio_hash(filename)
+
+        # Check if recording is too short - skip LLM processing to save API costs
+        if duration > 0 and duration < min_recording_duration:
+            logger.info(f"Recording too short ({duration:.1f}s). Skipping LLM processing.")
+            summary = "Recording too short to summarize."
+            title = "Short Recording"
+            tags = ["Short"]
+            short = True
+        else:
+            logger.info(f"Processing with LLM (duration: {duration:.1f}s)...")
+            response_text = _llm_response(filename, llm_provider, audio_hash)
+            short = False
+
+            # Parse JSON
+            title = None
+            tags = []
+            summary = ""  # Initialize to empty, not response_text
+
+            try:
+                import re
+
+                # Debug logging
+                try:
+                    with open("debug_log.txt", "w", encoding="utf-8") as log:
+                        log.write(f"Raw Response:\n{response_text}\n\n")
+                except Exception as e:
+                    print(f"Failed to write log: {e}")
+
+                cleaned_text = response_text.strip()
+
+                # Strategy 1: Remove Markdown Code Blocks
+                if "```" in cleaned_text:
+                    # Simple split to get content between first and last ```
+                    parts = cleaned_text.split("```")
+                    if len(parts) >= 3:
+                        # parts[0] is before, parts[1] is content (maybe with 'json' prefix), parts[2] is after
+                        candidate = parts[1]
+                        if candidate.startswith("json"):
+                            candidate = candidate[4:]
+                        cleaned_text = candidate.strip()
+
+                # Strategy 2: Regex for JSON object (fallback or refinement)
+                # We look for the outermost {}
+                json_match = re.search(r'\{.*\}', cleaned_text, re.DOTALL)
+                if json_match:
+                    cleaned_text = json_match.group(0)
+
+                try:
+                    with open("debug_log.txt", "a", encoding="utf-8") as log:
+                        log.write(f"Extracted Text:\n{cleaned_text}\n\n")
+                except: pass
+
+                # Strategy 3: Fix common JSON errors
+                # We used to replace \n with \\n here, but that breaks pretty-printed JSON.
+                # Only do it if strictly necessary or use a better regex.
+                # For now, let's trust the LLM or use the fallbacks.
+
+                try:
+                    data = json.loads(cleaned_text)
+                except json.JSONDecodeError:
+                    # Try one more time with strict=False if available
+                    # Sometimes trailing commas are the issue
+                    cleaned_text_fixed = re.sub(r',\s*\}', '}', cleaned_text)
+                    cleaned_text_fixed = re.sub(r',\s*\]', ']', cleaned_text_fixed)
+                    try:
+                        data = json.loads(cleaned_text_fixed)
+                    except:
+                        # Fallback: Try ast.literal_eval for Python-style dicts (single quotes)
+                        try:
+                            import ast
+                            # We need to be careful with ast.literal_eval on arbitrary strings, but for this it's okay
+                            # It expects python syntax, so true/false must be True/False, null is None
+                            # We can try to replace them
+                            py_text = cleaned_text.replace("true", "True").replace("false", "False").replace("null", "None")
+                            data = ast.literal_eval(py_text)
+                            if not isinstance(data, dict):
+                                raise ValueError("Not a dict")
+                        except:
+                            raise # Re-raise original error if this fails too
+
+                title = data.get("title")
+                tags = data.get("tags", [])
+                summary = data.get("summary", "")
+
+                # If summary is empty, use the full response as fallback
+                if not summary:
+                    summary = response_text
+
+                logger.info(f"[OK] JSON parsed successfully")
+                logger.info(f"  Title: {title}")
+                logger.info(f"  Tags ({len(tags)}): {tags}")
+
+            except Exception as e:
+                logger.warning(f"[ERROR] JSON parsing failed: {e}")
+                try:
+                    with open("debug_log.txt", "a", encoding="utf-8") as log:
+                        log.write(f"JSON Error: {e}\n")
+                except: pass
+
+                # Even if JSON fails, try to extract title and tags manually using regex
+                import re as regex_module
+                try:
+                    # Try to find title
+                    title_match = regex_module.search(r'"title"\s*:\s*"([^"]+)"', response_text)
+                    if title_match:
+                        title = title_match.group(1)
+                        logger.info(f"  [OK] Extracted title via regex: {title}")
+
+                    # Try to find tags array
+                    tags_match = regex_module.search(r'"tags"\s*:\s*\[([^\]]+)\]', response_text)
+                    if tags_match:
+                        tags_str = tags_match.group(1)
+                        # Extract individual tags
+                        tag_items = regex_module.findall(r'"([^"]+)"', tags_str)
+                        if tag_items:
+                            tags = tag_items
+                            logger.info(f"  [OK] Extracted {len(tags)} tags via regex: {tags}")
+
+                    # Try to find summary (careful with nested quotes, usually it's the last field)
+                    # We look for "summary": "..." and try to capture everything until the end of the string or closing brace
+                    summary_match = regex_module.search(r'"summary"\s*:\s*"(.*)"\s*\}', response_text, regex_module.DOTALL)
+                    if summary_match:
+                        summary_candidate = summary_match.group(1)
+                        # Unescape newlines and quotes if possible
+                        summary = summary_candidate.replace('\\n', '\n').replace('\\"', '"')
+                        logger.info(f"  [OK] Extracted summary via regex")
+                except Exception as regex_e:
+                    logger.error(f"  [ERROR] Regex extraction also failed: {regex_e}")
+
+                # Fallback summary
+                if not summary:
+                    summary = response_text
+                # Only use fallback title if we couldn't extract one
+                if not title:
+                    title = "Meeting " + datetime.now().strftime("%Y-%m-%d %H:%M") # Fallback title
+
+
+        # Save to DB with robust timestamp parsing
+        base_name = os.path.basename(filename)
+        name_without_ext = os.path.splitext(base_name)[0]
+        # Expected format: meeting_YYYYMMDD_HHMMSS
+        if name_without_ext.startswith("meeting_"):
+            timestamp_str = name_without_ext.replace("meeting_", "")
+        else:
+            timestamp_str = name_without_ext
+
+        try:
+            dt = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+            created_at_fmt = dt.strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            # Fallback to file modification time or current time
+            try:
+                mtime = os.path.getmtime(filename)
+                created_at_fmt = datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+            except:
+                created_at_fmt = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        result = add_meeting(
+            filename=os.path.basename(filename),
+            created_at=created_at_fmt,
+            duration=duration,
+            summary_text=summary,
+            title=title
+        )
+
+        if result is None:
+            # Meeting already exists (e.g. from upload), so update it
+            logger.info(f"Meeting exists, updating: {title}")
+            update_meeting(
+                filename=os.path.basename(filename),
+                title=title,
+                summary_text=summary,
+                duration=duration
+            )
+
+        if audio_hash:
+            set_audio_hash(os.path.basename(filename), audio_hash)
+
+        # Talk time measured at capture (recordings made before it have no timeline)
+        ratios = talk_time(filename)
+        if ratios:
+            set_talk_time(os.path.basename(filename), ratios)
+
+        # Add tags to database
+        if tags:
+            logger.info(f"Saving {len(tags)} tags to database...")
+            for tag in tags:
+                success = add_tag(os.path.basename(filename), tag)
+                if success:
+                    logger.info(f"  [OK] Tag saved: {tag}")
+                else:
+                    logger.warning(f"  ✗ Failed to save tag: {tag}")
+        else:
+            logger.debug("No tags to save")
+
+        logger.info(f"Meeting processed and saved: {title}")
+        return {"title": title, "tags": tags, "duration": duration, "short": short}
+
+    except Exception as e:
+        logger.error(f"Error processing meeting: {e}", exc_info=True)
+        raise # Fails the job attempt, which is retried
+
+
+def processing_failed(filename, error):
+    """Marks a meeting that ran out of processing attempts."""
+    update_meeting(filename=os.path.basename(filename), summary_text=f"Processing failed: {error}")
@@ -0,0 +1,215 @@
+"""
+Lock-free ring buffers for real-time audio capture.
+Single producer (PortAudio callback) / single consumer (writer thread).
+"""
+
+import numpy as np
+
+# Indices into the shared counter array
+WRITTEN = 0    # Total frames ever written (producer only)
+READ = 1       # Total frames ever read (consumer only)
+OVERFLOWS = 2  # Number of writes that did not fit (producer only)
+DROPPED = 3    # Number of frames discarded by those writes (producer only)
+CLOCK = 4      # Number of timestamps recorded in the clock log (producer only)
+
+CLOCK_LOG_SIZE = 1024  # Timestamps kept for clock estimation (~10s of 10ms blocks)
+GAP_THRESHOLD = 0.02   # Seconds of timeline jump treated as a stream discontinuity
+
+
+class RingBuffer:
+    """
+    Fixed-capacity ring of audio frames backed by a preallocated NumPy array.
+
+    The producer only ever advances WRITTEN and the consumer only ever advances
+    READ, so no lock is needed between the two threads. A write that does not
+    fit is truncated and counted instead of growing the buffer.
+    """
+
+    def __init__(self, capacity: int, channels: int = 1, dtype=np.float32):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self._data = np.zeros((self.capacity, channels), dtype=dtype)
+        self._state = np.zeros(5, dtype=np.int64)
+        # (first frame index, capture time) of recent writes, for clock_fit()
+        self._clock_frames = np.zeros(CLOCK_LOG_SIZE, dtype=np.int64)
+        self._clock_times = np.zeros(CLOCK_LOG_SIZE, dtype=np.float64)
+
+    @property
+    def available(self) -> int:
+        """Frames ready to be read."""
+        return int(self._state[WRITTEN] - self._state[READ])
+
+    @property
+    def read_position(self) -> int:
+        """Absolute index of the next frame to be read."""
+        return int(self._state[READ])
+
+    @property
+    def write_position(self) -> int:
+        """Absolute index one past the last frame written."""
+        return int(self._state[WRITTEN])
+
+    @property
+    def overflows(self) -> int:
+        return int(self._state[OVERFLOWS])
+
+    @property
+    def dropped_frames(self) -> int:
+        return int(self._state[DROPPED])
+
+    def write(self, data, timestamp: float = None) -> int:
+        """
+        Copy frames into the ring (producer side). Never allocates.
+
+        `timestamp` is the capture time of the first frame (PortAudio's
+        inputBufferAdcTime); it feeds the clock log used for stream alignment.
+        """
+        frames = len(data)
+        state = self._state
+        written = int(state[WRITTEN])
+        if timestamp:
+            slot = int(state[CLOCK]) % CLOCK_LOG_SIZE
+            self._clock_frames[slot] = written
+            self._clock_times[slot] = timestamp
+            state[CLOCK] += 1
+        free = self.capacity - (written - int(state[READ]))
+        if frames > free:
+            state[OVERFLOWS] += 1
+            state[DROPPED] += frames - free
+            frames = free
+            if frames <= 0:
+                return 0
+
+        start = written % self.capacity
+        first = min(frames, self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        if first < frames:
+            self._data[:frames - first] = data[first:frames]
+
+        # Publish only after the samples are in place
+        state[WRITTEN] = written + frames
+        return frames
+
+    def write_latest(self, data) -> int:
+        """
+        Write frames, discarding the oldest buffered frames to make room.
+        Only valid when the same thread both writes and reads the ring.
+        """
+        frames = min(len(data), self.capacity)
+        excess = self.available + frames - self.capacity
+        if excess > 0:
+            self._state[READ] += excess
+        return self.write(data[len(data) - frames:])
+
+    def read_into(self, out) -> int:
+        """Copy up to len(out) frames into `out` (consumer side). Returns frames copied."""
+        read = int(self._state[READ])
+        frames = min(len(out), int(self._state[WRITTEN]) - read)
+        if frames <= 0:
+            return 0
+
+        start = read % self.capacity
+        first = min(frames, self.capacity - start)
+        out[:first] = self._data[start:start + first]
+        if first < frames:
+            out[first:frames] = self._data[:frames - first]
+
+        self._state[READ] = read + frames
+        return frames
+
+    def peek_into(self, out, start: int) -> int:
+        """
+        Copy frames beginning at absolute index `start` into `out` without consuming them.
+        Frames that are not buffered (already read, or not yet written) are left untouched.
+        Returns the offset into `out` of the first frame copied; frames copied end at
+        min(len(out), write_position - start).
+        """
+        read = int(self._state[READ])
+        end = min(start + len(out), int(self._state[WRITTEN]))
+        begin = max(start, read)
+        if end <= begin:
+            return len(out)
+
+        offset = begin - start
+        frames = end - begin
+        pos = begin % self.capacity
+        first = min(frames, self.capacity - pos)
+        out[offset:offset + first] = self._data[pos:pos + first]
+        if first < frames:
+            out[offset + first:offset + frames] = self._data[:frames - first]
+        return offset
+
+    def discard_until(self, position: int):
+        """Consume frames up to (not including) absolute index `position`."""
+        position = min(int(position), int(self._state[WRITTEN]))
+        if position > self._state[READ]:
+            self._state[READ] = position
+
+    def rewind(self, frames: int) -> int:
+        """
+        Makes up to `frames` frames before the read position readable again
+        (consumer side), e.g. to replay recent audio. Frames the producer may
+        already be overwriting are not given back: a quarter of the ring stays
+        free for it. Returns the number of frames rewound.
+        """
+        read = int(self._state[READ])
+        oldest = int(self._state[WRITTEN]) - (self.capacity - self.capacity // 4)
+        position = max(read - int(frames), oldest, 0)
+        if position >= read:
+            return 0
+        self._state[READ] = position
+        return read - position
+
+    def clock_fit(self, samplerate: float):
+        """
+        Estimates this stream's clock from the recorded timestamps.
+
+        Only the timestamps since the last discontinuity (e.g. a loopback stream
+        that paused because nothing was playing) are used.
+
+        Returns (frame_ref, time_ref, period) such that frame f was captured at
+        time_ref + (f - frame_ref) * period, or None if no timestamps exist.
+        """
+        count = int(self._state[CLOCK])
+        if count == 0:
+            return None
+
+        n = min(count, CLOCK_LOG_SIZE)
+        order = np.arange(count - n, count) % CLOCK_LOG_SIZE
+        frames = self._clock_frames[order].astype(np.float64)
+        times = self._clock_times[order].copy()
+
+        # The producer may have overwritten the oldest slots while we copied
+        overwritten = int(self._state[CLOCK]) - count
+        if overwritten > 0:
+            frames = frames[overwritten:]
+            times = times[overwritten:]
+        if len(frames) == 0:
+            return None
+
+        nominal = 1.0 / samplerate
+        offsets = times - frames * nominal
+        gaps = np.flatnonzero(np.abs(np.diff(offsets)) > GAP_THRESHOLD)
+        if len(gaps):
+            frames = frames[gaps[-1] + 1:]
+            times = times[gaps[-1] + 1:]
+
+        frame_ref = frames[-1]
+        time_ref = times[-1]
+        if len(frames) < 8:
+            return frame_ref, time_ref, nominal
+
+        df = frames - frames.mean()
+        denom = np.dot(df, df)
+        if denom <= 0:
+            return frame_ref, time_ref, nominal
+        period = np.dot(df, times - times.mean()) / denom
+        # Reject nonsense fits (e.g. timestamps from a broken host API)
+        if not (0.9 * nominal < period < 1.1 * nominal):
+            period = nominal
+        time_ref = times.mean() + (frame_ref - frames.mean()) * period
+        return frame_ref, time_ref, period
+
+    def clear(self):
+        """Discard everything currently buffered (consumer side)."""
+        self._state[READ] = self._state[WRITTEN]
@@ -0,0 +1,82 @@
+"""
+Manifest handling for segmented recordings.
+
+A segmented meeting is stored as several consecutive audio files plus a JSON
+manifest (meeting_<timestamp>.json) that ties them together. The manifest path
+is what the rest of the application treats as "the recording".
+"""
+
+import json
+import os
+import re
+from typing import Dict, List
+from app.attribution import timeline_path
+from app.transcode import rendition_path, settings_path
+from app.trim import offset_map_path
+
+MANIFEST_EXT = ".json"
+
+
+def is_manifest(path: str) -> bool:
+    """True if `path` refers to a segment manifest rather than an audio file."""
+    return path.lower().endswith(MANIFEST_EXT)
+
+
+def new_manifest(meeting: str, samplerate: int, channels: int, file_format: str, segment_seconds: float,
+                 layout: str = "mixed") -> Dict:
+    return {
+        "meeting": meeting,
+        "samplerate": samplerate,
+        "channels": channels,
+        "layout": layout,
+        "format": file_format,
+        "segment_seconds": segment_seconds,
+        "segments": [],
+        "complete": False,
+    }
+
+
+def write_manifest(path: str, manifest: Dict):
+    """Atomically replace the manifest on disk so a crash never leaves it half-written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def manifest_for_segment(segment_path: str) -> str:
+    """Manifest of the recording a segment (<meeting>_partNNN.<ext>) belongs to."""
+    stem = os.path.splitext(segment_path)[0]
+    return re.sub(r"_part\d+$", "", stem) + MANIFEST_EXT
+
+
+def segment_paths(path: str) -> List[str]:
+    """
+    Audio files that make up a recording, in playback order.
+    For a plain audio file this is just [path].
+    """
+    if not is_manifest(path):
+        return [path]
+    manifest = load_manifest(path)
+    folder = os.path.dirname(path)
+    return [os.path.join(folder, seg["file"]) for seg in manifest.get("segments", [])]
+
+
+def recording_files(path: str) -> List[str]:
+    """Every file on disk that belongs to a recording (segments, the manifest itself and sidecars)."""
+    sidecars = [p for p in (timeline_path(path),) if os.path.exists(p)]
+    if not is_manifest(path):
+        audio, manifest = [path], []
+    else:
+        try:
+            audio, manifest = segment_paths(path), [path]
+        except (OSError, ValueError):
+            audio, manifest = [], [path]
+    # Speech renditions, their settings and trim offset maps made for upload
+    renditions = [r for p in audio for r in (rendition_path(p), settings_path(p), offset_map_path(p)) if os.path.exists(r)]
+    return audio + manifest + sidecars + renditions
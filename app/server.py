@@ -1,20 +1,24 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
 import shutil
+import hashlib
 from typing import List, Optional
 from datetime import datetime
 from app.service import MeetingService
+from app.metrics import render_metrics
 from app.database import (
     get_all_meetings, get_meeting, delete_meeting, clear_all_meetings,
-    add_tag, get_tags, search_meetings, add_meeting
+    add_tag, get_tags, search_meetings, add_meeting, set_audio_hash, get_cached_response
 )
 from app.config import Config
 from app.logger import get_logger
 from app.settings import get_settings_manager
+from app.jobs import enqueue_job, job_counts
+from app.segments import is_manifest, segment_paths, recording_files
 
 logger = get_logger(__name__)
 
@@ -48,6 +52,17 @@ def set_service(s: MeetingService):
     global service
     service = s
 
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MIME_SNIFF_BYTES = 8192 # Enough of the file for libmagic to identify audio containers
+
+AUDIO_MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+}
+
 class DeviceConfig(BaseModel):
     device_index: int
 
@@ -72,16 +87,34 @@ async def get_status():
         "status": status_str,
         "is_recording": is_recording,
         "rms": float(service.recorder.get_rms()),
-        "notification": service.last_notification
+        "notification": service.last_notification,
+        "jobs": job_counts(),
+        "partial_summary": service.partial_summary()
     }
 
 @app.get("/devices")
-async def get_devices():
-    """List available input devices."""
+async def get_devices(refresh: bool = False):
+    """List available input devices. refresh=true rescans for attached/removed devices."""
     if not service:
         return {"devices": []}
+    if refresh:
+        return {"devices": service.recorder.refresh_devices()}
     return {"devices": service.recorder.list_input_devices()}
 
+@app.get("/capture/stats")
+async def get_capture_stats():
+    """Capture stream settings, xrun and buffer overflow counters."""
+    if not service:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    return service.recorder.get_capture_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Capture pipeline health (overflows, xruns, stalls, writer lag, bytes written) for Prometheus."""
+    if not service:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    return render_metrics(service.recorder.get_capture_stats())
+
 @app.post("/config/device")
 async def set_device(config: DeviceConfig):
     """Set the active microphone device."""
@@ -160,14 +193,14 @@ async def delete_single_meeting(filename: str):
     # Delete from DB
     delete_meeting(filename)
     
-    # Delete file
-    file_path = os.path.join("recordings", filename)
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception as e:
-        print(f"Failed to delete {file_path}: {e}")
-        # We still return success if DB delete worked, or maybe warn?
+    # Delete file (all segments for a segmented recording)
+    for file_path in recording_files(os.path.join("recordings", filename)):
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception as e:
+            print(f"Failed to delete {file_path}: {e}")
+            # We still return success if DB delete worked, or maybe warn?
         
     return {"status": "deleted", "filename": filename}
 
@@ -176,18 +209,33 @@ async def get_meeting_details(filename: str):
     """Get details for a specific meeting."""
     meeting = get_meeting(filename)
     if not meeting:
+        # Still recording or processing: the notes taken so far, if any
+        partial = service.partial_summary(filename) if service else None
+        if partial:
+            return {"filename": filename, "partial_summary": partial}
         raise HTTPException(status_code=404, detail="Meeting not found")
     
     meeting['tags'] = get_tags(filename)
+    
+    # Segmented recordings are played back part by part
+    file_path = os.path.join("recordings", filename)
+    if is_manifest(filename) and os.path.exists(file_path):
+        meeting['segments'] = [os.path.basename(p) for p in segment_paths(file_path)]
     return meeting
 
 @app.get("/audio/{filename}")
-async def get_audio(filename: str):
+async def get_audio(filename: str, part: int = Query(0, ge=0, description="Segment index for segmented recordings")):
     """Serve audio file for playback."""
     file_path = os.path.join("recordings", filename)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Audio file not found")
-    return FileResponse(file_path, media_type="audio/wav")
+    if is_manifest(filename):
+        parts = segment_paths(file_path)
+        if part >= len(parts) or not os.path.exists(parts[part]):
+            raise HTTPException(status_code=404, detail="Audio segment not found")
+        file_path = parts[part]
+        filename = os.path.basename(file_path)
+    return FileResponse(file_path, media_type=AUDIO_MEDIA_TYPES.get(os.path.splitext(filename)[1].lower(), "audio/wav"))
 
 @app.get("/tags/{filename}")
 async def get_meeting_tags(filename: str):
@@ -212,7 +260,7 @@ async def search(q: str):
     return {"results": results}
 
 @app.post("/upload")
-async def upload_recording(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+async def upload_recording(file: UploadFile = File(...)):
     """Upload a recording file manually with validation."""
     try:
         # Validate file extension
@@ -223,24 +271,50 @@ async def upload_recording(file: UploadFile = File(...), background_tasks: Backg
                 detail=f"File type {ext} not allowed. Allowed types: {', '.join(Config.ALLOWED_EXTENSIONS)}"
             )
         
-        # Read file content
-        content = await file.read()
-        file_size = len(content)
-        
-        # Validate file size
-        if file_size > Config.MAX_FILE_SIZE_BYTES:
-            raise HTTPException(
-                status_code=413,
-                detail=f"File too large. Maximum size: {Config.MAX_FILE_SIZE_MB}MB"
-            )
+        # Save file
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"meeting_{timestamp}{ext}"
+        file_path = os.path.join(Config.RECORDINGS_DIR, filename)
+        n = 1
+        while os.path.exists(file_path): # Several files uploaded within a second
+            n += 1
+            filename = f"meeting_{timestamp}_{n}{ext}"
+            file_path = os.path.join(Config.RECORDINGS_DIR, filename)
         
-        if file_size == 0:
-            raise HTTPException(status_code=400, detail="Empty file")
+        # Stream to disk, hashing on the way (the hash keys the LLM response cache)
+        digest = hashlib.sha256()
+        file_size = 0
+        head = b""
+        try:
+            with open(file_path, "wb") as buffer:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    file_size += len(chunk)
+                    # Validate file size
+                    if file_size > Config.MAX_FILE_SIZE_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File too large. Maximum size: {Config.MAX_FILE_SIZE_MB}MB"
+                        )
+                    if len(head) < MIME_SNIFF_BYTES:
+                        head += chunk[:MIME_SNIFF_BYTES - len(head)]
+                    digest.update(chunk)
+                    buffer.write(chunk)
+            
+            if file_size == 0:
+                raise HTTPException(status_code=400, detail="Empty file")
+        except BaseException:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        audio_hash = digest.hexdigest()
         
         # Validate MIME type using python-magic (if available)
         if MAGIC_AVAILABLE:
             try:
-                mime = magic.from_buffer(content, mime=True)
+                mime = magic.from_buffer(head, mime=True)
                 allowed_mimes = ['audio/mpeg', 'audio/mp4', 'audio/x-m4a', 'audio/wav', 
                                'audio/x-wav', 'audio/flac', 'audio/ogg']
                 if mime not in allowed_mimes:
@@ -250,25 +324,23 @@ async def upload_recording(file: UploadFile = File(...), background_tasks: Backg
         else:
             logger.debug("MIME validation skipped (python-magic not available)")
         
-        # Save file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"meeting_{timestamp}{ext}"
-        file_path = os.path.join(Config.RECORDINGS_DIR, filename)
-        
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
-        
         logger.info(f"File uploaded: {filename} ({file_size / 1024 / 1024:.2f}MB)")
         
         # Add to DB immediately so it shows up
         created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         add_meeting(filename, created_at, 0, summary_text="Processing...", title=file.filename)
+        set_audio_hash(filename, audio_hash)
         
-        # Trigger processing in background
-        if service:
-             background_tasks.add_task(service._process_meeting, file_path)
+        # Identical audio summarized before is answered from the cache, without an API call
+        cached = False
+        cache_key = getattr(service.llm_provider, "cache_key", None) if service else None
+        if cache_key:
+            cached = get_cached_response(audio_hash, *cache_key(file_path)) is not None
+        
+        # Queue for processing; workers take a limited number of uploads at a time
+        job_id = service.queue_meeting(file_path) if service else enqueue_job(file_path)
               
-        return {"status": "uploaded", "filename": filename}
+        return {"status": "uploaded", "filename": filename, "job_id": job_id, "cached": cached}
         
     except HTTPException:
         raise
@@ -311,6 +383,8 @@ async def update_settings(settings: dict):
             settings_manager.set(key, str(value))
         
         logger.info(f"Settings updated: {list(settings.keys())}")
+        if service:
+            service._apply_capture_settings() # Echo cancellation and latency profile apply live
         return {"status": "success", "message": "Settings updated"}
     except Exception as e:
         logger.error(f"Error updating settings: {e}")
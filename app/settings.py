@@ -46,6 +46,11 @@ class SettingsManager:
             "auto_detection": str(Config.AUTO_DETECTION).lower(),
             "vad_threshold": str(Config.VAD_THRESHOLD),
             "silence_duration": str(Config.SILENCE_DURATION),
+            "segment_minutes": str(Config.SEGMENT_MINUTES),
+            "preroll_seconds": str(Config.PREROLL_SECONDS),
+            "channel_layout": Config.CHANNEL_LAYOUT,
+            "echo_cancellation": str(Config.ECHO_CANCELLATION).lower(),
+            "latency_profile": Config.LATENCY_PROFILE,
         }
         
         for key, value in defaults.items():
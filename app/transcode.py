@@ -0,0 +1,120 @@
+"""
+Compact speech renditions of recordings for upload to the LLM.
+
+Recordings are kept at the device rate (often 48kHz, stereo for the split
+layout), which is far more than a model needs to follow speech. Before upload,
+ffmpeg turns each audio file into 16kHz mono Opus at SPEECH_BITRATE, about
+180KB per minute against 5.6MB for 48kHz stereo WAV. ffmpeg streams from the
+original to the rendition, so nothing is decoded in Python.
+
+The rendition is cached next to the original as <name>.speech.ogg, with the
+settings it was made with in <name>.speech.json. It is reused while it is newer
+than the original, those settings still apply and, if it was trimmed, the trim
+offset map is still there. Without ffmpeg the original is uploaded.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import threading
+from typing import Callable, Optional
+from app.config import Config
+from app.logger import get_logger
+from app.trim import offset_map_path
+
+logger = get_logger(__name__)
+
+RENDITION_SUFFIX = ".speech.ogg"
+SETTINGS_SUFFIX = ".speech.json"
+SAMPLERATE = 16000 # Opus' wideband rate, which covers speech
+TIMEOUT_SECONDS = 1800
+
+
+def rendition_path(path: str) -> str:
+    return os.path.splitext(path)[0] + RENDITION_SUFFIX
+
+
+def settings_path(path: str) -> str:
+    return os.path.splitext(path)[0] + SETTINGS_SUFFIX
+
+
+def rendition_settings(split: bool = False, trim: bool = False) -> dict:
+    """Settings a rendition is encoded with; a cached one made with others is rebuilt."""
+    settings = {"samplerate": SAMPLERATE, "bitrate": Config.SPEECH_BITRATE, "split": bool(split)}
+    if trim and Config.TRIM_SILENCE:
+        settings["trim_min_silence"] = Config.TRIM_MIN_SILENCE
+    return settings
+
+
+def _cached_rendition(path: str, settings: dict) -> Optional[str]:
+    """The cached rendition of `path` if it is current and was made with `settings`."""
+    output = rendition_path(path)
+    try:
+        if os.path.getmtime(output) < os.path.getmtime(path):
+            return None
+        with open(settings_path(path), encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    trimmed = cached.pop("trimmed", False)
+    # The offset map maps the model's timestamps back; without it (or with a
+    # stray one) they would point at the wrong place in the recording
+    if cached != settings or trimmed != os.path.exists(offset_map_path(path)):
+        return None
+    return output
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def speech_rendition(path: str, split: bool = False,
+                     trim: Optional[Callable[[str], Optional[str]]] = None) -> Optional[str]:
+    """
+    Path of the speech rendition of an audio file, encoded on first use.
+    `split` sums mic and loopback channels (the stereo layout) instead of
+    averaging them. `trim(path)` may return a shortened temporary copy to
+    encode instead (see app/trim.py); it is deleted afterwards. Returns None
+    if renditions are off or ffmpeg fails.
+    """
+    if not Config.SPEECH_RENDITION or not ffmpeg_available():
+        return None
+    settings = rendition_settings(split, trim is not None)
+    cached = _cached_rendition(path, settings)
+    if cached:
+        return cached
+
+    output = rendition_path(path)
+    source = trim(path) if trim else None
+    # Encode to a temporary name, so an interrupted run never leaves a truncated rendition
+    temp = f"{output}.{os.getpid()}-{threading.get_ident()}.tmp"
+    command = ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", source or path, "-map", "0:a:0"]
+    if split:
+        command += ["-af", "pan=mono|c0=c0+c1"] # Like the live "mixed" layout
+    command += [
+        "-ac", "1", "-ar", str(SAMPLERATE),
+        "-c:a", "libopus", "-b:a", Config.SPEECH_BITRATE, "-application", "voip",
+        "-f", "ogg", temp,
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=TIMEOUT_SECONDS)
+        if result.returncode != 0:
+            logger.warning(f"Could not transcode {path}: {result.stderr.strip()}")
+            return None
+        os.replace(temp, output)
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(dict(settings, trimmed=source is not None), f)
+        os.replace(temp, settings_path(path))
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"Could not transcode {path}: {e}")
+        return None
+    finally:
+        for leftover in (temp, source):
+            if leftover and os.path.exists(leftover):
+                os.remove(leftover)
+
+    original, compact = os.path.getsize(path), os.path.getsize(output)
+    logger.info(f"Speech rendition of {os.path.basename(path)}: "
+                f"{original / 1024 / 1024:.1f}MB → {compact / 1024 / 1024:.1f}MB ({original / max(compact, 1):.0f}x smaller)")
+    return output
@@ -0,0 +1,213 @@
+"""
+Dead-air removal before upload to the LLM.
+
+Auto-stopped recordings end with up to SILENCE_DURATION seconds of silence, and
+meetings have long pauses; the model is billed for all of it. trim_silence()
+measures frame energy exactly like the VAD (vad._frames / vad._rms, 20ms
+frames), vectorized over large blocks of the file, against the file's own noise
+floor, and cuts every silent stretch longer than TRIM_MIN_SILENCE, keeping a
+little padding around speech. Energy alone cannot tell music from speech, so
+hold music is kept.
+
+Each trimmed file gets an offset map, <name>.trim.json, listing the spans of
+the original that were kept ({"kept": [[start, end], ...]} in seconds).
+to_original() and remap_timestamps() use it to point timestamps the model
+gives for the trimmed audio back to the original recording. The prompts ask
+for timestamps as bracketed [MM:SS] / [H:MM:SS] markers, and only those are
+rewritten, so times of day in the text ("meet at 14:00") are left alone.
+"""
+
+import json
+import os
+import re
+import tempfile
+from typing import List, Optional, Tuple
+import numpy as np
+import soundfile as sf
+from app.config import Config
+from app.logger import get_logger
+from app.vad import VoiceActivityDetector, _frames, _rms
+
+logger = get_logger(__name__)
+
+OFFSET_MAP_EXT = ".trim.json"
+PADDING = 0.25          # Seconds kept on each side of speech
+NOISE_PERCENTILE = 10   # Frame energy percentile taken as the file's noise floor
+SNR = 1.5               # Lower than the VAD's: a frame of missed speech costs more than one of kept noise
+MIN_SAVING = 1.0        # Seconds a trim must remove to be worth a new file
+BLOCK_FRAMES = 1 << 16  # Frames read at a time
+
+TIMESTAMP = re.compile(r"\[(?:(\d{1,2}):)?(\d{1,2}):(\d{2})\]") # [MM:SS] or [H:MM:SS] markers
+
+
+def offset_map_path(path: str) -> str:
+    return os.path.splitext(path)[0] + OFFSET_MAP_EXT
+
+
+def speech_spans(path: str, min_silence: Optional[float] = None) -> Tuple[List[Tuple[float, float]], float]:
+    """
+    Spans of `path` to keep, as (start, end) seconds, and the file's duration.
+    Silent stretches shorter than `min_silence` (TRIM_MIN_SILENCE) are kept.
+    """
+    min_silence = Config.TRIM_MIN_SILENCE if min_silence is None else min_silence
+    with sf.SoundFile(path) as f:
+        samplerate, total = f.samplerate, f.frames
+        frame_len = VoiceActivityDetector(samplerate, threshold=0.0).frame_len
+        blocksize = max(1, BLOCK_FRAMES // frame_len) * frame_len
+        # Energy per VAD frame; the last partial frame is folded into its neighbour below
+        rms = np.concatenate([_rms(_frames(block, frame_len))
+                              for block in f.blocks(blocksize=blocksize, dtype='float32', always_2d=True)]
+                             or [np.zeros(0)])
+    duration = total / samplerate
+    if len(rms) == 0:
+        return [(0.0, duration)], duration
+
+    floor = np.percentile(rms, NOISE_PERCENTILE)
+    speech = rms > max(floor * SNR, 1e-4) # Digital silence has a floor of ~0
+
+    # Grow speech by the padding on both sides (a running maximum via cumulative sums)
+    frame_duration = frame_len / samplerate
+    pad = int(round(PADDING / frame_duration))
+    counts = np.concatenate(([0], np.cumsum(speech)))
+    index = np.arange(len(speech))
+    keep = counts[np.minimum(index + pad + 1, len(speech))] - counts[np.maximum(index - pad, 0)] > 0
+
+    # Silent runs shorter than min_silence (after padding) are kept too
+    edges = np.flatnonzero(np.diff(np.concatenate(([1], keep.astype(np.int8), [1]))))
+    starts, ends = edges[0::2], edges[1::2]
+    short = (ends - starts) * frame_duration < max(0.0, min_silence - 2 * PADDING)
+    for start, end in zip(starts[short], ends[short]):
+        keep[start:end] = True
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.astype(np.int8), [0]))))
+    spans = [(start * frame_duration, min(end * frame_duration, duration)) for start, end in zip(edges[0::2], edges[1::2])]
+    if spans and spans[-1][1] >= len(rms) * frame_duration - 1e-9:
+        spans[-1] = (spans[-1][0], duration) # Include the partial frame at the end
+    return spans, duration
+
+
+def trim_silence(path: str, output_path: Optional[str] = None) -> Optional[str]:
+    """
+    Writes a copy of `path` without its dead air (FLAC, same channels and
+    comment) and saves the offset map next to `path`. Returns the copy's path,
+    which the caller deletes, or None if there is nothing worth cutting.
+    """
+    map_path = offset_map_path(path)
+    if not Config.TRIM_SILENCE:
+        return None
+    try:
+        spans, duration = speech_spans(path)
+    except Exception as e:
+        logger.warning(f"Could not analyse {path} for silence: {e}")
+        return None
+    kept = sum(end - start for start, end in spans)
+    if duration - kept < MIN_SAVING or not spans: # No speech found: let the model hear it all
+        if os.path.exists(map_path):
+            os.remove(map_path) # Left over from an earlier trim with other settings
+        return None
+
+    if output_path is None:
+        fd, output_path = tempfile.mkstemp(suffix="_trimmed.flac")
+        os.close(fd)
+    with sf.SoundFile(path) as src, \
+            sf.SoundFile(output_path, mode='w', samplerate=src.samplerate, channels=src.channels,
+                         format='FLAC', subtype='PCM_16') as dst:
+        if src.comment:
+            dst.comment = src.comment # Keeps split-channel recordings recognizable
+        for start, end in spans:
+            src.seek(int(round(start * src.samplerate)))
+            remaining = int(round(end * src.samplerate)) - src.tell()
+            while remaining > 0:
+                block = src.read(min(remaining, BLOCK_FRAMES), dtype='float32', always_2d=True)
+                if len(block) == 0:
+                    break
+                dst.write(block)
+                remaining -= len(block)
+
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump({"duration": round(duration, 3),
+                   "kept": [[round(start, 3), round(end, 3)] for start, end in spans]}, f)
+    logger.info(f"Trimmed {duration - kept:.1f}s of silence from {os.path.basename(path)} "
+                f"({duration:.1f}s → {kept:.1f}s)")
+    return output_path
+
+
+def load_offset_map(recording_path: str) -> Optional[np.ndarray]:
+    """
+    Kept spans of a recording as an (n, 2) array of original seconds, or None
+    if nothing was trimmed. Parts of a segmented recording are laid end to end,
+    as they are sent to the model.
+    """
+    from app.segments import segment_paths
+
+    spans, offset, trimmed = [], 0.0, False
+    for part in segment_paths(recording_path):
+        map_path = offset_map_path(part)
+        if os.path.exists(map_path):
+            with open(map_path, encoding="utf-8") as f:
+                offsets = json.load(f)
+            spans += [(offset + start, offset + end) for start, end in offsets["kept"]]
+            duration = offsets["duration"]
+            trimmed = True
+        else:
+            try:
+                duration = sf.info(part).duration
+            except Exception:
+                return None # Positions after an unreadable part cannot be mapped
+            spans.append((offset, offset + duration))
+        offset += duration
+    return np.array(spans, dtype=np.float64) if trimmed else None
+
+
+def to_original(seconds, kept: np.ndarray):
+    """Maps position(s) in the trimmed audio to the original recording."""
+    lengths = kept[:, 1] - kept[:, 0]
+    trimmed_starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+    t = np.asarray(seconds, dtype=np.float64)
+    span = np.clip(np.searchsorted(trimmed_starts, t, side="right") - 1, 0, len(kept) - 1)
+    return kept[span, 0] + np.minimum(t - trimmed_starts[span], lengths[span])
+
+
+def format_timestamp(seconds: float) -> str:
+    """MM:SS, or H:MM:SS from an hour on."""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def _rewrite_timestamps(text: str, mapping, limit: float) -> str:
+    """Replaces timestamp markers up to `limit` seconds with mapping(seconds), keeping their style."""
+    def replace(match):
+        hours, minutes, seconds = match.groups()
+        t = int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+        if int(seconds) >= 60 or t > limit + 1:
+            return match.group(0) # Not a position in this audio
+        t = int(round(float(mapping(t))))
+        if hours or t >= 3600:
+            return f"[{t // 3600}:{t // 60 % 60:02d}:{t % 60:02d}]"
+        return f"[{t // 60:02d}:{t % 60:02d}]" if len(minutes) == 2 else f"[{t // 60}:{t % 60:02d}]"
+
+    return TIMESTAMP.sub(replace, text)
+
+
+def remap_timestamps(text: str, recording_path: str) -> str:
+    """
+    Rewrites the timestamp markers the model gave for the trimmed audio as
+    positions in the original recording. Text is unchanged if nothing was trimmed.
+    """
+    kept = load_offset_map(recording_path)
+    if kept is None or not text:
+        return text
+    trimmed_length = float(np.sum(kept[:, 1] - kept[:, 0]))
+    return _rewrite_timestamps(text, lambda t: to_original(t, kept), trimmed_length)
+
+
+def shift_timestamps(text: str, offset: float, length: float) -> str:
+    """
+    Moves timestamp markers given for a `length`-second excerpt to positions in the
+    whole audio, `offset` seconds later (see app/chunks.py).
+    """
+    if not text:
+        return text
+    return _rewrite_timestamps(text, lambda t: t + offset, length)
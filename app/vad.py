@@ -0,0 +1,193 @@
+"""
+Voice activity detection for the capture pipeline.
+
+Frame-level features (energy, zero-crossing rate, spectral flatness) are computed
+vectorized over each block the writer thread produces, against an adaptive noise
+floor. VADEngine turns the per-frame decisions into start/stop events that
+MeetingService waits on instead of polling levels.
+"""
+
+import collections
+import threading
+import time
+import numpy as np
+from app.config import Config
+
+EPS = 1e-10
+
+
+def _frames(block: np.ndarray, frame_len: int) -> np.ndarray:
+    """Splits a block into (n, frame_len) frames, averaging multi-channel input to mono."""
+    x = block.mean(axis=1) if block.ndim > 1 else block
+    n = len(x) // frame_len
+    return x[:n * frame_len].reshape(n, frame_len).astype(np.float64)
+
+
+def _rms(frames: np.ndarray) -> np.ndarray:
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def _voicing(frames: np.ndarray):
+    """Per-frame (zcr, flatness)."""
+    frame_len = frames.shape[1]
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1)
+
+    # Spectral flatness: geometric / arithmetic mean of the power spectrum.
+    # Close to 1 for noise, close to 0 for voiced (harmonic) sound.
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame_len), axis=1)) ** 2 + EPS
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return zcr, flatness
+
+
+def frame_features(block: np.ndarray, frame_len: int):
+    """
+    Splits a block into frames of `frame_len` samples (multi-channel input is
+    averaged to mono) and returns per-frame (rms, zcr, flatness) arrays.
+    """
+    frames = _frames(block, frame_len)
+    if len(frames) == 0:
+        empty = np.zeros(0)
+        return empty, empty, empty
+    zcr, flatness = _voicing(frames)
+    return _rms(frames), zcr, flatness
+
+
+class VoiceActivityDetector:
+    """Per-frame speech/non-speech classifier with an adaptive noise floor."""
+
+    def __init__(self, samplerate=16000, threshold=None, frame_duration=0.02,
+                 snr=3.0, max_flatness=0.4, max_zcr=0.45):
+        self.threshold = Config.VAD_THRESHOLD if threshold is None else threshold
+        self.frame_duration = frame_duration
+        self.snr = snr                    # Required ratio of frame RMS to the noise floor
+        self.max_flatness = max_flatness  # Frames flatter than this look like noise
+        self.max_zcr = max_zcr            # Frames crossing zero more often look like hiss
+        self.noise_floor = None
+        self.configure(samplerate)
+
+    def configure(self, samplerate):
+        self.samplerate = samplerate
+        self.frame_len = max(32, int(samplerate * self.frame_duration))
+
+    @property
+    def effective_threshold(self) -> float:
+        """The RMS a frame must exceed right now: the configured minimum or snr x noise floor."""
+        return max(self.threshold, (self.noise_floor or 0.0) * self.snr)
+
+    def _update_floor(self, rms):
+        """Follows quieter frames quickly and louder ones slowly (~10s time constant)."""
+        if len(rms) == 0:
+            return
+        quietest = max(float(rms.min()), EPS)
+        if self.noise_floor is None:
+            self.noise_floor = quietest
+        elif quietest < self.noise_floor:
+            self.noise_floor += 0.2 * (quietest - self.noise_floor)
+        else:
+            self.noise_floor += (len(rms) * self.frame_duration / 10.0) * (quietest - self.noise_floor)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Returns a boolean speech decision per frame of `block`."""
+        frames = _frames(block, self.frame_len)
+        rms = _rms(frames)
+        self._update_floor(rms)
+        speech = rms > self.effective_threshold
+        # Only loud frames can be speech, so the spectrum is computed for those alone.
+        # Most of an idle day is quiet, which leaves just the RMS.
+        if speech.any():
+            zcr, flatness = _voicing(frames[speech])
+            speech[speech] = (flatness < self.max_flatness) & (zcr < self.max_zcr)
+        return speech
+
+
+class VADEngine:
+    """
+    Runs a detector per source (mic and loopback, each with its own noise floor)
+    on every block and publishes start/stop events.
+
+    process() is called from the recorder's writer thread; wait_event() blocks
+    the consumer on a condition variable until an event arrives.
+    """
+
+    START = "start"
+    STOP = "stop"
+    SOURCES = ("mic", "sys")
+
+    def __init__(self, samplerate=16000, threshold=None, start_duration=0.3, window=1.0, silence_duration=None):
+        self.detectors = {source: VoiceActivityDetector(samplerate, threshold) for source in self.SOURCES}
+        self.frame_duration = self.detectors["mic"].frame_duration
+        self.start_duration = start_duration  # Seconds of speech within `window` needed to declare a start
+        self.silence_duration = Config.SILENCE_DURATION if silence_duration is None else silence_duration
+        self.speaking = False
+        self.last_voice_time = 0.0
+        self.activity = {source: 0.0 for source in self.SOURCES} # Speech fraction of the last block, per source
+        # Sliding window of recent per-frame decisions, preallocated
+        self._window = np.zeros(max(1, int(round(window / self.frame_duration))), dtype=bool)
+        self._window_pos = 0
+        self._events = collections.deque(maxlen=16)
+        self._cond = threading.Condition()
+
+    def configure(self, samplerate):
+        for detector in self.detectors.values():
+            detector.configure(samplerate)
+
+    def set_threshold(self, threshold):
+        """Sets the minimum RMS for speech; the noise floors can only raise it."""
+        for detector in self.detectors.values():
+            detector.threshold = threshold
+
+    def noise_floors(self):
+        """Learned noise floor per source (sources never heard are omitted)."""
+        return {source: d.noise_floor for source, d in self.detectors.items() if d.noise_floor}
+
+    def set_noise_floors(self, floors):
+        """Seeds the detectors, e.g. with floors persisted from a previous run."""
+        for source, floor in floors.items():
+            if source in self.detectors and floor and floor > 0:
+                self.detectors[source].noise_floor = floor
+
+    def _publish(self, kind, now):
+        with self._cond:
+            self._events.append((kind, now))
+            self._cond.notify_all()
+
+    def process(self, mic: np.ndarray = None, sys: np.ndarray = None, now: float = None):
+        """
+        Feeds one aligned block per source (None for a source that is not captured).
+        `now` is the wall-clock time of the block's end.
+        """
+        now = time.time() if now is None else now
+        decisions = None
+        for source, block in (("mic", mic), ("sys", sys)):
+            if block is None:
+                self.activity[source] = 0.0
+                continue
+            d = self.detectors[source].process(block)
+            self.activity[source] = float(np.count_nonzero(d)) / len(d) if len(d) else 0.0
+            decisions = d if decisions is None else decisions | d
+        if decisions is None or len(decisions) == 0:
+            return
+
+        if decisions.any():
+            self.last_voice_time = now
+        idx = (self._window_pos + np.arange(len(decisions))) % len(self._window)
+        self._window[idx] = decisions
+        self._window_pos = (self._window_pos + len(decisions)) % len(self._window)
+
+        # Speech has pauses between syllables; brief clicks never add up to start_duration
+        speech_time = np.count_nonzero(self._window) * self.frame_duration
+        if not self.speaking and speech_time >= self.start_duration:
+            self.speaking = True
+            self._publish(self.START, now)
+        elif self.speaking and now - self.last_voice_time > self.silence_duration:
+            self.speaking = False
+            self._window.fill(False)
+            self._publish(self.STOP, now)
+
+    def wait_event(self, timeout=None):
+        """Returns the next (kind, timestamp) event, or None on timeout."""
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            return self._events.popleft() if self._events else None
@@ -0,0 +1,187 @@
+"""
+Crash-safe WAV recording and O(1) header repair.
+
+libsndfile writes a WAV header with zero sizes and only fills them in on close,
+and a RIFF file cannot describe more than 4GB. WavWriter writes 16-bit PCM
+behind a header it controls: a 28-byte JUNK chunk is reserved after the RIFF
+header (as EBU Tech 3306 recommends), sizes are rewritten on every flush(), and
+a file that outgrows 4GB turns into RF64 in place by converting the JUNK chunk
+into its ds64 chunk. Small files stay ordinary WAVs that every player opens.
+
+repair_wav() fixes the header of a file whose writer died, from the file size
+alone: it reads the first few KB and patches a few bytes. Audio is never decoded.
+"""
+
+import os
+import struct
+from typing import Optional
+import numpy as np
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+RIFF_LIMIT = 0xFFFFFFFF  # Largest size a 32-bit RIFF field can hold
+SIZE_MARKER = 0xFFFFFFFF # 32-bit size fields of RF64 ("see ds64")
+DS64_SIZE = 28          # riffSize, dataSize, sampleCount (64-bit) and tableLength (32-bit)
+HEADER_SCAN_BYTES = 65536
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\0" if len(data) % 2 else data
+
+
+class WavWriter:
+    """
+    Writes float audio as 16-bit PCM WAV, RF64 once it passes 4GB.
+    Has the parts of the soundfile.SoundFile interface the recorder uses.
+    """
+
+    def __init__(self, path: str, samplerate: int, channels: int, comment: Optional[str] = None):
+        self.name = path
+        self.samplerate = samplerate
+        self.channels = channels
+        self.frames = 0
+        self._block_align = 2 * channels
+        self._buf = np.zeros(0, dtype=np.int16)
+
+        fmt = struct.pack("<HHIIHH", 1, channels, samplerate, samplerate * self._block_align, self._block_align, 16)
+        header = b"WAVE" + b"JUNK" + struct.pack("<I", DS64_SIZE) + bytes(DS64_SIZE)
+        header += b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        if comment:
+            # LIST/INFO/ICMT, which libsndfile reads back as the file comment
+            text = _pad(comment.encode("utf-8") + b"\0")
+            info = b"INFO" + b"ICMT" + struct.pack("<I", len(comment.encode("utf-8")) + 1) + text
+            header += b"LIST" + struct.pack("<I", len(info)) + info
+        self._data_offset = 8 + len(header) + 8
+        self._file = open(path, "wb")
+        self._file.write(b"RIFF" + struct.pack("<I", 0) + header + b"data" + struct.pack("<I", 0))
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def write(self, data: np.ndarray):
+        """Appends (frames, channels) float samples in [-1, 1]."""
+        n = data.size
+        if len(self._buf) < n:
+            self._buf = np.zeros(n, dtype=np.int16)
+        # Same scaling and clipping as libsndfile, so files match what SoundFile wrote
+        scaled = np.rint(data.reshape(-1) * 32768.0)
+        np.clip(scaled, -32768, 32767, out=scaled)
+        out = self._buf[:n]
+        out[:] = scaled
+        self._file.write(out.tobytes())
+        self.frames += len(data)
+
+    def _update_header(self):
+        data_bytes = self.frames * self._block_align
+        riff_size = self._data_offset - 8 + data_bytes
+        end = self._file.tell()
+        if riff_size <= RIFF_LIMIT:
+            self._file.seek(4)
+            self._file.write(struct.pack("<I", riff_size))
+            self._file.seek(self._data_offset - 4)
+            self._file.write(struct.pack("<I", data_bytes))
+        else:
+            _write_rf64(self._file, riff_size, data_bytes, self.frames, self._data_offset)
+        self._file.seek(end)
+
+    def flush(self):
+        """Makes everything written so far readable after a crash: sizes in the header, data on disk."""
+        self._update_header()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._update_header()
+        self._file.close()
+
+
+def _write_rf64(file, riff_size, data_bytes, frames, data_offset):
+    """Turns the RIFF header with its reserved JUNK chunk at offset 12 into RF64 + ds64."""
+    file.seek(0)
+    file.write(b"RF64" + struct.pack("<I", SIZE_MARKER))
+    file.seek(12)
+    file.write(b"ds64" + struct.pack("<IQQQI", DS64_SIZE, riff_size, data_bytes, frames, 0))
+    file.seek(data_offset - 4)
+    file.write(struct.pack("<I", SIZE_MARKER))
+
+
+def repair_wav(path: str) -> bool:
+    """
+    Rewrites the sizes in the header of a WAV/RF64 file that was not closed, so
+    that they match the file size. Returns True if the header was patched, False
+    if it was already consistent or the file is not a WAV this can fix.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SCAN_BYTES)
+    if len(head) < 12 or head[8:12] != b"WAVE" or head[:4] not in (b"RIFF", b"RF64"):
+        return False
+
+    # Walk the chunks in front of the audio
+    chunks = {}
+    pos = 12
+    while pos + 8 <= len(head):
+        chunk_id = head[pos:pos + 4]
+        chunk_size = struct.unpack("<I", head[pos + 4:pos + 8])[0]
+        chunks.setdefault(chunk_id, (pos, chunk_size))
+        if chunk_id == b"data":
+            break
+        pos += 8 + chunk_size + (chunk_size & 1)
+    if b"data" not in chunks or b"fmt " not in chunks:
+        return False
+
+    fmt_pos = chunks[b"fmt "][0]
+    block_align = struct.unpack("<H", head[fmt_pos + 20:fmt_pos + 22])[0] or 1
+    data_offset = chunks[b"data"][0] + 8
+    # A partial frame at the end was cut off mid-write
+    data_bytes = (size - data_offset) // block_align * block_align
+    riff_size = data_offset - 8 + data_bytes
+
+    if head[:4] == b"RF64":
+        if b"ds64" not in chunks:
+            return False
+        ds64_pos = chunks[b"ds64"][0]
+        recorded_riff, recorded_data = struct.unpack("<QQ", head[ds64_pos + 8:ds64_pos + 24])
+        if recorded_riff + 8 in (size, size - 1) and data_offset + recorded_data <= size:
+            return False
+    else:
+        recorded_riff = struct.unpack("<I", head[4:8])[0]
+        recorded_data = chunks[b"data"][1]
+        if recorded_riff + 8 in (size, size - 1) and data_offset + recorded_data <= size:
+            return False # Consistent (chunks after the audio are included in the RIFF size)
+
+    with open(path, "r+b") as f:
+        if riff_size <= RIFF_LIMIT and head[:4] == b"RIFF":
+            f.seek(4)
+            f.write(struct.pack("<I", riff_size))
+            f.seek(data_offset - 4)
+            f.write(struct.pack("<I", data_bytes))
+            if b"fact" in chunks: # Sample count of non-PCM and extensible formats
+                f.seek(chunks[b"fact"][0] + 8)
+                f.write(struct.pack("<I", data_bytes // block_align))
+        elif head[:4] == b"RF64" or chunks.get(b"JUNK", (0, 0)) == (12, DS64_SIZE):
+            _write_rf64(f, riff_size, data_bytes, data_bytes // block_align, data_offset)
+        else:
+            return False # Over 4GB with no room for a ds64 chunk
+    return True
+
+
+def repair_recordings(directory: str):
+    """Repairs every WAV in `directory`; returns the paths that were patched."""
+    repaired = []
+    if not os.path.isdir(directory):
+        return repaired
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(".wav"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if repair_wav(path):
+                repaired.append(path)
+        except OSError as e:
+            logger.warning(f"Could not check {path}: {e}")
+    return repaired
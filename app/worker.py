@@ -0,0 +1,80 @@
+"""
+Meeting processing in separate worker processes: python main.py worker -n 4.
+
+Each process claims jobs from the shared SQLite queue (app/jobs.py) and runs
+the processing pipeline (app/processing.py) on the shared recordings directory,
+so duration probing, LLM calls and database writes scale with cores and never
+compete with capture or the API server. Run the server with JOB_WORKERS=0 to
+leave all processing to these processes, or keep both; leases make sure every
+job is processed once.
+"""
+
+import multiprocessing
+import time
+from app.config import Config
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+RESTART_DELAY = 5.0 # Seconds before a crashed worker process is started again
+
+
+def _worker_main(index):
+    """Entry point of one worker process."""
+    from app.jobs import JobWorkerPool
+    from app.llm_provider import GeminiProvider
+    from app.logger import setup_logging
+    from app.processing import process_meeting, processing_failed
+
+    setup_logging(log_file=f"worker_{index}.log") # A rotating log per process
+    provider = GeminiProvider()
+    pool = JobWorkerPool(lambda path: process_meeting(path, provider), workers=1, on_failed=processing_failed)
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+
+def run_workers(processes=None):
+    """Runs `processes` worker processes until interrupted, restarting any that crash."""
+    from app.database import init_db
+
+    processes = max(1, processes or Config.WORKER_PROCESSES)
+    init_db()
+    # spawn everywhere, like the capture process
+    ctx = multiprocessing.get_context("spawn")
+
+    def start(index):
+        process = ctx.Process(target=_worker_main, args=(index,), name=f"nabu-worker-{index}")
+        process.start()
+        logger.info(f"Worker {index} started (pid {process.pid})")
+        return process
+
+    workers = [start(i) for i in range(processes)]
+    died = {}
+    try:
+        while True:
+            time.sleep(1)
+            for i, process in enumerate(workers):
+                if process.is_alive():
+                    continue
+                if i not in died:
+                    logger.error(f"Worker {i} exited with code {process.exitcode}. Restarting in {RESTART_DELAY:.0f}s.")
+                    died[i] = time.monotonic()
+                elif time.monotonic() - died[i] >= RESTART_DELAY:
+                    del died[i]
+                    workers[i] = start(i)
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+    finally:
+        for process in workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not exit. Terminating it.")
+                process.terminate()
+                process.join(timeout=5)
+        logger.info("Workers stopped")
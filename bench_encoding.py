@@ -0,0 +1,70 @@
+"""
+Benchmark of the writer-thread encoding cost for each recording format.
+
+Writes synthetic speech-like audio in the same 100ms frames the recorder's
+writer uses, through the same writers (app.wavfile.WavWriter for WAV,
+soundfile for the rest), and reports CPU time per second of audio and output
+size.
+"""
+
+import os
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+from app.audio_recorder import AudioRecorder
+from app.wavfile import WavWriter
+
+SECONDS = 120
+FRAME_DURATION = 0.1
+
+
+def synthetic_speech(samplerate, seconds):
+    """Harmonic 'voice' with syllable-rate amplitude modulation, pauses and a noise floor."""
+    t = np.arange(int(samplerate * seconds)) / samplerate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / samplerate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    pauses = (np.sin(2 * np.pi * 0.2 * t) > -0.3).astype(np.float64)
+    noise = np.random.default_rng(0).normal(0, 0.003, len(t))
+    return (0.2 * voice * syllables * pauses + noise).astype(np.float32).reshape(-1, 1)
+
+
+def open_writer(path, samplerate, fmt, subtype):
+    """The writer AudioRecorder opens for this format."""
+    if fmt == "WAV":
+        return WavWriter(path, samplerate, 1)
+    return sf.SoundFile(path, mode='w', samplerate=samplerate, channels=1, format=fmt, subtype=subtype)
+
+
+def bench(name, samplerate, audio):
+    fmt, subtype, ext = AudioRecorder.FORMATS[name]
+    if not sf.check_format(fmt, subtype):
+        print(f"{name:<6} {samplerate:>6}Hz  not supported by this libsndfile")
+        return
+
+    frame = int(samplerate * FRAME_DURATION)
+    path = os.path.join(tempfile.mkdtemp(), f"bench{ext}")
+    cpu_start = time.process_time()
+    f = open_writer(path, samplerate, fmt, subtype)
+    try:
+        for start in range(0, len(audio), frame):
+            f.write(audio[start:start + frame])
+    finally:
+        f.close()
+    cpu = time.process_time() - cpu_start
+
+    size = os.path.getsize(path)
+    os.remove(path)
+    print(f"{name:<6} {samplerate:>6}Hz  {cpu / SECONDS * 1000:7.2f} ms CPU per audio-second "
+          f"({cpu / SECONDS * 100:5.2f}% of one core)   {size / SECONDS / 1024:7.1f} KiB/s")
+
+
+if __name__ == "__main__":
+    print(f"Encoding {SECONDS}s of mono audio in {int(FRAME_DURATION * 1000)}ms frames")
+    print("-" * 90)
+    for samplerate in (16000, 48000):
+        audio = synthetic_speech(samplerate, SECONDS)
+        for name in ("wav", "flac", "opus"):
+            bench(name, samplerate, audio)
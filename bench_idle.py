@@ -0,0 +1,107 @@
+"""
+Benchmark of idle monitoring CPU: listening for speech with no meeting recorded.
+
+Runs the real AudioRecorder against a fake sounddevice backend that delivers
+quiet room noise on a mic and a loopback stream the way PortAudio does (a block
+per callback, after its capture time). Callbacks with PortAudio's default
+blocksize are emulated as 10ms blocks. Reports process CPU time as a percentage
+of one core, with low-power idle mode off and on.
+
+Usage: python bench_idle.py [seconds]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import numpy as np
+
+SAMPLERATE = 48000
+DEFAULT_BLOCK = 480 # 10ms, typical of WASAPI shared mode
+
+
+def _fake_sounddevice():
+    sd = types.ModuleType("sounddevice")
+    sd.default = types.SimpleNamespace(device=[0, 1])
+    devices = [
+        {'name': 'Mic', 'hostapi': 0, 'max_input_channels': 1, 'max_output_channels': 0, 'default_samplerate': 48000.0},
+        {'name': 'Speakers', 'hostapi': 0, 'max_input_channels': 0, 'max_output_channels': 2, 'default_samplerate': 48000.0},
+    ]
+    noise = (np.random.default_rng(0).normal(0, 0.002, (SAMPLERATE, 1))).astype(np.float32)
+
+    class StreamTime:
+        def __init__(self, t):
+            self.inputBufferAdcTime = t
+            self.currentTime = t
+
+    class InputStream:
+        def __init__(self, device=None, callback=None, channels=1, samplerate=SAMPLERATE, blocksize=0, **kwargs):
+            self.device, self.callback, self.channels, self.samplerate = device, callback, channels, samplerate
+            self.blocksize = blocksize or DEFAULT_BLOCK
+            self.active = False
+
+        def start(self):
+            self.active = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        def _run(self):
+            t0 = time.monotonic()
+            n = 0
+            while self.active:
+                t = t0 + n / self.samplerate
+                # A block is delivered once it has been captured
+                delay = t + self.blocksize / self.samplerate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                start = n % (len(noise) - self.blocksize)
+                self.callback(noise[start:start + self.blocksize], self.blocksize, StreamTime(t), None)
+                n += self.blocksize
+
+        def stop(self):
+            self.active = False
+
+        def close(self):
+            self.active = False
+
+    sd.InputStream = InputStream
+    sd.WasapiSettings = lambda loopback=False: None
+    sd.query_devices = lambda index=None, kind=None: devices if index is None else devices[index]
+    sd.query_hostapis = lambda: [{'name': 'Windows WASAPI'}]
+    sd.check_input_settings = lambda **kwargs: None
+    return sd
+
+
+sys.modules["sounddevice"] = _fake_sounddevice()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.audio_recorder import AudioRecorder
+
+
+def bench(low_power, seconds):
+    recorder = AudioRecorder(output_dir=tempfile.mkdtemp(), samplerate=SAMPLERATE)
+    recorder._get_wasapi_loopback_device = lambda: 1
+    recorder.low_power_idle = low_power
+    recorder.set_device(0)
+    recorder.start_listening()
+    try:
+        time.sleep(1.0) # Let the VAD noise floors settle
+        wall, cpu = time.perf_counter(), time.process_time()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+    finally:
+        recorder.stop_listening()
+        recorder.writer_thread.join(timeout=5)
+    return 100.0 * cpu / wall
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+    results = [(label, bench(low_power, seconds)) for label, low_power in (("default", False), ("low-power idle", True))]
+    print("-" * 60)
+    print(f"Idle monitoring at {SAMPLERATE}Hz, mic + loopback, {seconds:.0f}s each")
+    for label, percent in results:
+        print(f"  {label:<16} {percent:5.1f}% of one core")
@@ -0,0 +1,101 @@
+"""
+Benchmark of dead-air trimming before LLM upload.
+
+Generates synthetic meetings: speech-like turns separated by natural pauses,
+long silences, and up to SILENCE_DURATION seconds of trailing silence from
+auto-stop, over quiet, fan or hiss backgrounds. Trims each one with
+app.trim.trim_silence and reports audio seconds before and after, how much
+speech was cut, and how far speech onsets mapped back through the offset map
+land from their true position. Pass a directory to measure real recordings
+instead (no speech check).
+
+Usage: python bench_trim.py [recordings_dir]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.config import Config
+from app.trim import trim_silence, load_offset_map, to_original, offset_map_path
+from bench_vad import _speech, _background
+
+SAMPLERATE = 16000
+MEETINGS = 12
+
+
+def make_meeting(path, rng, background):
+    """Writes a synthetic meeting and returns its speech turns as (start, end) seconds."""
+    pieces, turns, t = [], [], 0.0
+    for _ in range(rng.integers(15, 30)):
+        pause = rng.choice([rng.uniform(0.2, 1.2), rng.uniform(3, 20)], p=[0.7, 0.3])
+        turn = rng.uniform(2, 15)
+        pieces.append(np.zeros(int(pause * SAMPLERATE)))
+        t += len(pieces[-1]) / SAMPLERATE
+        pieces.append(_speech(int(turn * SAMPLERATE), rng, level=rng.uniform(0.03, 0.15)))
+        turns.append((t, t + len(pieces[-1]) / SAMPLERATE))
+        t = turns[-1][1]
+    pieces.append(np.zeros(int(rng.uniform(0, Config.SILENCE_DURATION) * SAMPLERATE))) # Auto-stop tail
+    audio = np.concatenate(pieces)
+    audio += _background(background, len(audio), rng)
+    sf.write(path, np.clip(audio, -1, 1).astype(np.float32), SAMPLERATE, subtype="PCM_16")
+    return turns
+
+
+def measure(path, turns=None):
+    duration = sf.info(path).duration
+    start = time.perf_counter()
+    trimmed = trim_silence(path)
+    elapsed = time.perf_counter() - start
+    kept, lost, error = duration, None, None
+    if trimmed:
+        kept = sf.info(trimmed).duration
+        os.remove(trimmed)
+        if turns:
+            kept_spans = load_offset_map(path)
+            # Speech that was cut, and how far turn onsets found in the trimmed audio map back
+            lost = sum(end - start - np.clip(np.minimum(kept_spans[:, 1], end) - np.maximum(kept_spans[:, 0], start), 0, None).sum()
+                       for start, end in turns)
+            lengths = kept_spans[:, 1] - kept_spans[:, 0]
+            trimmed_starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+            error = 0.0
+            for start, _ in turns:
+                span = np.searchsorted(kept_spans[:, 0], start, side="right") - 1
+                if span >= 0 and start < kept_spans[span, 1]:
+                    position = trimmed_starts[span] + start - kept_spans[span, 0]
+                    error = max(error, abs(float(to_original(position, kept_spans)) - start))
+        os.remove(offset_map_path(path))
+    return duration, kept, elapsed, lost, error
+
+
+if __name__ == "__main__":
+    rows = []
+    if len(sys.argv) > 1:
+        folder = sys.argv[1]
+        for name in sorted(os.listdir(folder)):
+            if os.path.splitext(name)[1].lower() in (".wav", ".flac", ".ogg") and not name.endswith(".speech.ogg"):
+                rows.append((name,) + measure(os.path.join(folder, name)))
+    else:
+        rng = np.random.default_rng(0)
+        folder = tempfile.mkdtemp()
+        for i in range(MEETINGS):
+            background = ("quiet", "fan", "hiss")[i % 3]
+            path = os.path.join(folder, f"meeting_{i:02d}_{background}.wav")
+            turns = make_meeting(path, rng, background)
+            rows.append((os.path.basename(path),) + measure(path, turns))
+
+    print("-" * 78)
+    print(f"{'file':<26} {'original':>9} {'trimmed':>9} {'saved':>6} {'time':>7} {'speech cut':>10} {'map err':>8}")
+    for name, duration, kept, elapsed, lost, error in rows:
+        lost = f"{lost:.2f}s" if lost is not None else "-"
+        error = f"{error * 1000:.0f}ms" if error is not None else "-"
+        print(f"{name:<26} {duration:8.1f}s {kept:8.1f}s {1 - kept / duration:6.1%} {elapsed * 1000:5.0f}ms {lost:>10} {error:>8}")
+    if rows:
+        saved = np.mean([1 - row[2] / row[1] for row in rows])
+        seconds = np.mean([row[1] - row[2] for row in rows])
+        print(f"Average reduction: {saved:.1%} ({seconds:.1f} audio seconds per file)")
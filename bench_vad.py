@@ -0,0 +1,130 @@
+"""
+Benchmark of meeting start detection on synthetic speech/noise recordings.
+
+Generates WAV files with a known speech onset over different backgrounds, plus
+noise-only files, then replays them in 100ms blocks through:
+  - the old detector: block RMS > VAD_THRESHOLD on 5 consecutive 100ms polls
+  - VADEngine
+Reports detection latency on speech files and false triggers on noise files.
+"""
+
+import os
+import tempfile
+import numpy as np
+import soundfile as sf
+from app.config import Config
+from app.vad import VADEngine
+
+SAMPLERATE = 16000
+BLOCK = 0.1
+ONSET = 4.0
+LENGTH = 12.0
+
+
+def _speech(n, rng, level=0.12):
+    t = np.arange(n) / SAMPLERATE
+    pitch = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * 0.8 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLERATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 10))
+    syllables = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t), 0, None) ** 0.5
+    voice *= syllables
+    return level * voice / (np.sqrt(np.mean(voice ** 2)) + 1e-9)
+
+
+def _background(kind, n, rng):
+    t = np.arange(n) / SAMPLERATE
+    if kind == "quiet":
+        return rng.normal(0, 0.002, n)
+    if kind == "fan":
+        hum = sum(np.sin(2 * np.pi * f * t + rng.uniform(0, 6)) / i for i, f in enumerate((120, 240, 360), 1))
+        return 0.03 * hum + rng.normal(0, 0.03, n)
+    if kind == "hiss":
+        return rng.normal(0, 0.05, n)
+    if kind == "keyboard":
+        out = rng.normal(0, 0.002, n)
+        for start in rng.integers(0, n - 400, int(n / SAMPLERATE * 8)):
+            out[start:start + 400] += rng.normal(0, 0.3, 400) * np.exp(-np.arange(400) / 60)
+        return out
+    if kind == "notification":
+        out = rng.normal(0, 0.002, n)
+        for start in rng.integers(0, n - 4000, 3):
+            seg = np.arange(4000) / SAMPLERATE
+            out[start:start + 4000] += 0.2 * np.sin(2 * np.pi * 880 * seg) * np.exp(-seg * 8)
+        return out
+    raise ValueError(kind)
+
+
+def make_corpus(folder, rng):
+    """Returns [(path, onset_seconds or None)]."""
+    corpus = []
+    n = int(LENGTH * SAMPLERATE)
+    for kind in ("quiet", "fan", "hiss", "keyboard", "notification"):
+        for i in range(4):
+            noise = _background(kind, n, rng)
+            path = os.path.join(folder, f"noise_{kind}_{i}.wav")
+            sf.write(path, np.clip(noise, -1, 1).astype(np.float32), SAMPLERATE)
+            corpus.append((path, None))
+
+            speech = noise.copy()
+            start = int(ONSET * SAMPLERATE)
+            speech[start:] += _speech(n - start, rng)
+            path = os.path.join(folder, f"speech_{kind}_{i}.wav")
+            sf.write(path, np.clip(speech, -1, 1).astype(np.float32), SAMPLERATE)
+            corpus.append((path, ONSET))
+    return corpus
+
+
+def run_old(audio):
+    block = int(SAMPLERATE * BLOCK)
+    count = 0
+    for i in range(0, len(audio) - block + 1, block):
+        rms = np.sqrt(np.mean(audio[i:i + block] ** 2))
+        count = count + 1 if rms > Config.VAD_THRESHOLD else 0
+        if count >= 5:
+            return (i + block) / SAMPLERATE
+    return None
+
+
+def run_engine(audio):
+    block = int(SAMPLERATE * BLOCK)
+    engine = VADEngine(SAMPLERATE)
+    for i in range(0, len(audio) - block + 1, block):
+        now = (i + block) / SAMPLERATE
+        engine.process(mic=audio[i:i + block].reshape(-1, 1), now=now)
+        event = engine.wait_event(timeout=0)
+        if event and event[0] == VADEngine.START:
+            return now
+    return None
+
+
+def evaluate(name, detector, corpus):
+    latencies, misses, early, noise_triggers = [], 0, 0, 0
+    speech_files = sum(1 for _, onset in corpus if onset is not None)
+    noise_files = len(corpus) - speech_files
+    for path, onset in corpus:
+        audio, _ = sf.read(path, dtype="float32")
+        when = detector(audio)
+        if onset is None:
+            noise_triggers += when is not None
+        elif when is None:
+            misses += 1
+        elif when < onset:
+            early += 1 # Triggered on the background before speech began
+        else:
+            latencies.append(when - onset)
+
+    latency = f"{np.mean(latencies) * 1000:5.0f}ms mean / {np.max(latencies) * 1000:5.0f}ms max" if latencies else "n/a"
+    false_rate = (noise_triggers + early) / (noise_files + speech_files)
+    print(f"{name:<12} latency {latency}   missed {misses}/{speech_files}   "
+          f"false triggers: noise-only {noise_triggers}/{noise_files}, before onset {early}/{speech_files} "
+          f"({false_rate:.0%} of files)")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(7)
+    folder = tempfile.mkdtemp()
+    corpus = make_corpus(folder, rng)
+    print(f"{len(corpus)} synthetic files in {folder} (speech onset at {ONSET:.0f}s)")
+    print("-" * 100)
+    evaluate("RMS polling", run_old, corpus)
+    evaluate("VADEngine", run_engine, corpus)
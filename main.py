@@ -1,11 +1,9 @@
-import uvicorn
+import argparse
 import logging
 import os
-from app.server import app, set_service
-from app.audio_recorder import AudioRecorder
-from app.service import MeetingService
-from app.llm_provider import GeminiProvider
 from app.config import Config
+from app.database import init_db
+from app.wavfile import repair_recordings
 from app.logger import setup_logging, get_logger
 # from app.llm_dummy import DummyProvider # For testing without API key
 
@@ -17,7 +15,15 @@ class EndpointFilter(logging.Filter):
 # Filter out /status logs
 logging.getLogger("uvicorn.access").addFilter(EndpointFilter())
 
-def main():
+def run_server():
+    # Server-only imports: worker processes re-import this module and need none of them
+    import uvicorn
+    from app.server import app, set_service
+    from app.audio_recorder import AudioRecorder
+    from app.capture_process import RemoteRecorder
+    from app.service import MeetingService
+    from app.llm_provider import GeminiProvider
+    
     # Setup logging first
     setup_logging()
     logger = get_logger(__name__)
@@ -31,8 +37,18 @@ def main():
     # Ensure directories exist
     os.makedirs(Config.RECORDINGS_DIR, exist_ok=True)
     
+    # Create or migrate the database schema
+    init_db()
+    
+    # Fix the headers of recordings a crash left unfinished
+    for path in repair_recordings(Config.RECORDINGS_DIR):
+        logger.warning(f"Repaired unfinished recording: {path}")
+    
     # Initialize components
-    recorder = AudioRecorder(output_dir=Config.RECORDINGS_DIR)
+    if Config.CAPTURE_PROCESS:
+        recorder = RemoteRecorder(output_dir=Config.RECORDINGS_DIR)
+    else:
+        recorder = AudioRecorder(output_dir=Config.RECORDINGS_DIR)
     
     provider = GeminiProvider() 
     # provider = DummyProvider() # Use dummy for now
@@ -58,6 +74,36 @@ def main():
         logger.info("\nShutting down...")
     finally:
         service.stop_service()
+        if Config.CAPTURE_PROCESS:
+            recorder.close()
+
+def run_worker(processes):
+    from app.worker import run_workers
+    
+    setup_logging(log_file="worker.log")
+    logger = get_logger(__name__)
+    logger.info("="*60)
+    logger.info(f"Starting Nabu processing workers ({processes or Config.WORKER_PROCESSES} processes)...")
+    logger.info("="*60)
+    run_workers(processes)
+
+def main():
+    parser = argparse.ArgumentParser(description="Nabu Meeting Summarizer")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("server", help="Run the API server and audio capture (default)")
+    worker = commands.add_parser("worker", help="Process queued meetings in separate processes")
+    worker.add_argument(
+        "-n", "--processes",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: WORKER_PROCESSES)"
+    )
+    args = parser.parse_args()
+    
+    if args.command == "worker":
+        run_worker(args.processes)
+    else:
+        run_server()
 
 if __name__ == "__main__":
     main()
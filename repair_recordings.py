@@ -0,0 +1,73 @@
+"""
+Repair script for recordings left unfinished by a crash or power loss.
+Rewrites the header sizes of every WAV in the recordings directory from the
+file size, the same repair the server runs at startup. Audio is not touched.
+"""
+
+import os
+import sys
+
+# Add app directory to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.config import Config
+from app.wavfile import repair_wav
+
+
+def repair_recordings(directory):
+    """
+    Check every WAV in `directory` and fix the ones with a stale header.
+
+    Args:
+        directory: Folder with the recordings
+    """
+    if not os.path.isdir(directory):
+        print(f"✗ Directory not found: {directory}")
+        return
+
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(".wav"))
+    print(f"Checking {len(names)} recording(s) in {directory}\n")
+
+    repaired_count = 0
+    failed_count = 0
+
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if repair_wav(path):
+                print(f"✓ {name}")
+                print(f"  Header repaired ({os.path.getsize(path) / 1e6:.1f} MB)")
+                repaired_count += 1
+        except OSError as e:
+            print(f"✗ {name}")
+            print(f"  {e}")
+            failed_count += 1
+
+    if repaired_count == 0 and failed_count == 0:
+        print("✓ All recordings are intact.")
+    else:
+        print(f"\n✓ Repaired {repaired_count} recording(s)")
+
+    if failed_count > 0:
+        print(f"✗ Failed to check {failed_count} recording(s)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Repair WAV headers left unfinished by a crash")
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=Config.RECORDINGS_DIR,
+        help="Recordings directory (default: RECORDINGS_DIR)"
+    )
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Recording Repair Script")
+    print("=" * 60)
+    print()
+
+    repair_recordings(args.directory)
@@ -4,6 +4,8 @@ let startTime = null;
 let currentMeetingFilename = null;
 let currentTags = [];
 let lastNotificationId = null;
+let lastDeviceRefresh = 0;
+const DEVICE_REFRESH_INTERVAL = 10000; // Rescans restart monitoring, so at most one per 10 seconds
 
 // --- Initialization ---
 document.addEventListener('DOMContentLoaded', () => {
@@ -15,11 +17,13 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 // --- Device Management ---
-async function fetchDevices() {
+async function fetchDevices(refresh = false) {
     try {
-        const response = await fetch('/devices');
+        const response = await fetch(refresh ? '/devices?refresh=true' : '/devices');
         const data = await response.json();
         const select = document.getElementById('micSelect');
+        const previousIndex = select.value;
+        const previousName = select.selectedIndex >= 0 ? select.options[select.selectedIndex].text : null;
 
         select.innerHTML = '';
         if (data.devices.length === 0) {
@@ -29,16 +33,18 @@ async function fetchDevices() {
             return;
         }
 
+        // Keep the selected device (indices change after a rescan, names do not)
+        const keep = data.devices.some(device => device.name === previousName);
         data.devices.forEach((device, idx) => {
             const option = document.createElement('option');
             option.value = device.index;
             option.text = device.name;
-            if (idx === 0) option.selected = true;
+            option.selected = keep ? device.name === previousName : idx === 0;
             select.appendChild(option);
         });
 
-        // Set initial device if available
-        if (data.devices.length > 0) {
+        // Set the initial device, or a replacement if the selected one was unplugged or renumbered
+        if (data.devices.length > 0 && select.value !== previousIndex) {
             changeDevice();
         }
     } catch (error) {
@@ -47,6 +53,13 @@ async function fetchDevices() {
     }
 }
 
+// PortAudio only sees plugged or unplugged devices after a rescan, done when the list is opened
+function refreshDevices() {
+    if (Date.now() - lastDeviceRefresh < DEVICE_REFRESH_INTERVAL) return;
+    lastDeviceRefresh = Date.now();
+    fetchDevices(true);
+}
+
 async function changeDevice() {
     const select = document.getElementById('micSelect');
     if (!select.value) return;
@@ -370,6 +383,10 @@ async function uploadFile(input) {
         });
 
         if (response.ok) {
+            const data = await response.json();
+            if (data.cached) {
+                showToast("Identical audio was summarized before. Reusing its summary.", 'info');
+            }
             // Give it a moment to register in DB then fetch
             setTimeout(fetchHistory, 1000);
         } else {
@@ -424,9 +441,20 @@ async function loadMeeting(filename) {
         document.getElementById("meeting-title").innerText = data.title || "Meeting Summary";
         document.getElementById("meeting-content").innerHTML = marked.parse(summaryText);
 
-        // Setup audio
+        // Setup audio (segmented recordings play their parts back to back)
         const audio = document.getElementById("audio-player");
+        const partCount = (data.segments || []).length;
+        let part = 0;
         audio.src = `${API_URL}/audio/${filename}`;
+        audio.onended = () => {
+            if (part + 1 < partCount) {
+                part += 1;
+                audio.src = `${API_URL}/audio/${filename}?part=${part}`;
+                audio.play();
+            }
+        };
+
+        renderTalkTime(data);
 
         // Setup tags
         currentMeetingFilename = filename;
@@ -438,6 +466,26 @@ async function loadMeeting(filename) {
     }
 }
 
+function renderTalkTime(data) {
+    const container = document.getElementById("talk-time");
+    const local = data.local_talk_ratio || 0;
+    const remote = data.remote_talk_ratio || 0;
+    const overlap = data.overlap_talk_ratio || 0;
+    const speech = local + remote + overlap;
+    if (speech <= 0) {
+        container.classList.add("hidden");
+        return;
+    }
+    // Shares of the speaking time, not of the whole recording
+    const pct = (value) => Math.round((value / speech) * 100);
+    document.getElementById("talk-time-local").style.width = `${pct(local)}%`;
+    document.getElementById("talk-time-overlap").style.width = `${pct(overlap)}%`;
+    document.getElementById("talk-time-remote").style.width = `${pct(remote)}%`;
+    document.getElementById("talk-time-label").innerText =
+        `You ${pct(local)}% · Remote ${pct(remote)}% · Overlap ${pct(overlap)}% of speaking time`;
+    container.classList.remove("hidden");
+}
+
 function closeMeeting() {
     document.getElementById("meeting-view").classList.add("hidden");
     document.getElementById("empty-state").classList.remove("hidden");
@@ -555,10 +603,14 @@ async function openSettings() {
         // Populate form
         document.getElementById('min_recording_duration').value = settings.min_recording_duration || 3;
         document.getElementById('delete_short_recordings').checked = settings.delete_short_recordings === 'true';
-        document.getElementById('compress_recordings').checked = settings.compress_recordings === 'true';
+        document.getElementById('compress_recordings').value = settings.compress_recordings === 'true' ? 'flac' : (settings.compress_recordings || 'flac');
         document.getElementById('auto_detection').checked = settings.auto_detection === 'true';
+        document.getElementById('echo_cancellation').checked = settings.echo_cancellation !== 'false';
         document.getElementById('vad_threshold').value = settings.vad_threshold || 0.03;
         document.getElementById('silence_duration').value = settings.silence_duration || 10;
+        document.getElementById('segment_minutes').value = settings.segment_minutes || 0;
+        document.getElementById('channel_layout').value = settings.channel_layout || 'mixed';
+        document.getElementById('latency_profile').value = settings.latency_profile || 'balanced';
 
         // Show modal
         document.getElementById('settings-modal').classList.remove('hidden');
@@ -577,10 +629,14 @@ async function saveSettings() {
         const settings = {
             min_recording_duration: document.getElementById('min_recording_duration').value,
             delete_short_recordings: document.getElementById('delete_short_recordings').checked.toString(),
-            compress_recordings: document.getElementById('compress_recordings').checked.toString(),
+            compress_recordings: document.getElementById('compress_recordings').value,
             auto_detection: document.getElementById('auto_detection').checked.toString(),
+            echo_cancellation: document.getElementById('echo_cancellation').checked.toString(),
             vad_threshold: document.getElementById('vad_threshold').value,
             silence_duration: document.getElementById('silence_duration').value,
+            segment_minutes: document.getElementById('segment_minutes').value,
+            channel_layout: document.getElementById('channel_layout').value,
+            latency_profile: document.getElementById('latency_profile').value,
         };
 
         const response = await fetch(`${API_URL}/settings`, {
@@ -0,0 +1,248 @@
+"""
+Test live stream replacement against a fake sounddevice backend.
+
+The fake streams generate sines of absolute (monotonic) time, so correctly aligned
+audio from two devices lines up sample for sample. The tests record, then switch
+the mic or let a stream stall mid-recording, and check that the writer thread and
+file survive, that audio keeps flowing and that the splice does not click. Streams
+must not be reopened when a recording starts or stops, only when the capture
+settings change, and the pre-roll of an auto-started recording must be replayed
+aligned and unbroken.
+
+Runs without audio hardware: python test_device_switch.py (or under pytest).
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import numpy as np
+import soundfile as sf
+
+SAMPLERATE = 16000
+
+
+def _fake_sounddevice():
+    """Minimal stand-in for the parts of sounddevice the recorder uses."""
+    sd = types.ModuleType("sounddevice")
+    sd.default = types.SimpleNamespace(device=[0, 1])
+    devices = [
+        {'name': 'Mic A', 'hostapi': 0, 'max_input_channels': 1, 'max_output_channels': 0, 'default_samplerate': 16000.0},
+        {'name': 'Speakers', 'hostapi': 0, 'max_input_channels': 0, 'max_output_channels': 2, 'default_samplerate': 16000.0},
+        {'name': 'Mic B', 'hostapi': 0, 'max_input_channels': 1, 'max_output_channels': 0, 'default_samplerate': 16000.0},
+    ]
+    # device index -> (frequency, amplitude)
+    signals = {0: (440.0, 0.2), 1: (220.0, 0.1), 2: (440.0, 0.3)}
+
+    class StreamTime:
+        def __init__(self, t):
+            self.inputBufferAdcTime = t
+            self.currentTime = t
+
+    class InputStream:
+        def __init__(self, device=None, callback=None, channels=1, samplerate=16000, blocksize=0, **kwargs):
+            self.device, self.callback, self.channels, self.samplerate = device, callback, channels, samplerate
+            self.blocksize = blocksize or 160
+            self.active = False
+            self.stalled = False # Keeps running but stops delivering audio, like a wedged driver
+
+        def start(self):
+            self.active = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        def _run(self):
+            freq, amp = signals[self.device]
+            t0 = time.monotonic()
+            n = 0
+            while self.active:
+                t = t0 + n / self.samplerate
+                # Like PortAudio, a block is delivered once it has been captured
+                delay = t + self.blocksize / self.samplerate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if self.stalled:
+                    n += self.blocksize
+                    continue
+                ts = t + np.arange(self.blocksize) / self.samplerate
+                data = (amp * np.sin(2 * np.pi * freq * ts)).astype(np.float32).reshape(-1, 1)
+                self.callback(np.repeat(data, self.channels, axis=1), self.blocksize, StreamTime(t), None)
+                n += self.blocksize
+
+        def stop(self):
+            self.active = False
+
+        def close(self):
+            self.active = False
+
+    sd.InputStream = InputStream
+    sd.WasapiSettings = lambda loopback=False: None
+    sd.query_devices = lambda index=None, kind=None: devices if index is None else devices[index]
+    sd.query_hostapis = lambda: [{'name': 'Windows WASAPI'}]
+    sd.check_input_settings = lambda **kwargs: None
+    return sd
+
+
+sys.modules["sounddevice"] = _fake_sounddevice()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.audio_recorder import AudioRecorder
+
+
+def test_switch_mic_mid_recording():
+    recorder = AudioRecorder(output_dir=tempfile.mkdtemp(), samplerate=SAMPLERATE)
+    recorder._get_wasapi_loopback_device = lambda: 1
+    recorder.preroll_seconds = 0
+    recorder.set_device(0)
+    assert recorder.start_listening()
+    try:
+        time.sleep(0.3)
+        recorder.start_recording()
+        time.sleep(1.0)
+
+        writer = recorder.writer_thread
+        started = time.monotonic()
+        assert recorder.set_device(2)
+        switch_time = time.monotonic() - started
+        assert recorder.mic_stream.device == 2
+        assert recorder.writer_thread is writer and writer.is_alive()
+        assert recorder._out_file is not None, "recording file was closed by the switch"
+
+        time.sleep(1.0)
+        filename = recorder.stop_recording()
+    finally:
+        recorder.stop_listening()
+
+    audio, rate = sf.read(filename, dtype="float32")
+    assert rate == SAMPLERATE
+    print(f"Switch took {switch_time * 1000:.0f}ms; recorded {len(audio) / rate:.2f}s")
+
+    # Mic A + loopback before the switch, mic B + loopback after it
+    assert np.abs(audio[:rate // 2]).max() < 0.35
+    assert np.abs(audio[-rate // 2:]).max() > 0.35
+
+    # A gap or misaligned splice shows up as a jump far larger than the signal's slope
+    slope = 2 * np.pi * (0.3 * 440 + 0.1 * 220) / SAMPLERATE
+    worst = np.abs(np.diff(audio)).max()
+    print(f"Largest sample-to-sample step {worst:.4f} (signal slope {slope:.4f})")
+    assert worst < 1.5 * slope
+
+
+def test_streams_are_only_reopened_when_settings_change():
+    recorder = AudioRecorder(output_dir=tempfile.mkdtemp(), samplerate=SAMPLERATE)
+    recorder._get_wasapi_loopback_device = lambda: 1
+    recorder.low_power_idle = True
+    recorder.preroll_seconds = 0
+    recorder.set_device(0)
+    assert recorder.start_listening()
+    try:
+        time.sleep(0.3)
+        streams = (recorder.mic_stream, recorder.sys_stream)
+        recorder.start_recording()
+        time.sleep(0.5)
+        # Starting a recording keeps the streams: no second open, no splice
+        assert (recorder.mic_stream, recorder.sys_stream) == streams
+
+        recorder.low_power_idle = False
+        recorder.latency_profile = "power-saver"
+        recorder.apply_stream_settings()
+        time.sleep(1.0)
+        assert recorder.mic_stream is not streams[0] and recorder.sys_stream is not streams[1]
+        assert recorder.mic_stream.blocksize == int(SAMPLERATE * AudioRecorder.LATENCY_PROFILES["power-saver"][0])
+        time.sleep(0.5)
+        streams = (recorder.mic_stream, recorder.sys_stream)
+        filename = recorder.stop_recording()
+        time.sleep(0.5)
+        assert (recorder.mic_stream, recorder.sys_stream) == streams
+    finally:
+        recorder.stop_listening()
+
+    # The swap of both streams for the new settings leaves no gap in the recording
+    audio, rate = sf.read(filename, dtype="float32")
+    print(f"Recorded {len(audio) / rate:.2f}s across a profile change")
+    slope = 2 * np.pi * (0.2 * 440 + 0.1 * 220) / SAMPLERATE
+    assert np.abs(np.diff(audio)).max() < 1.5 * slope
+
+
+def test_preroll_is_replayed_from_the_rings():
+    recorder = AudioRecorder(output_dir=tempfile.mkdtemp(), samplerate=SAMPLERATE)
+    recorder._get_wasapi_loopback_device = lambda: 1
+    recorder.low_power_idle = True
+    recorder.echo_cancellation = False
+    recorder.preroll_seconds = 1.0
+    recorder.set_device(0)
+    assert recorder.start_listening()
+    try:
+        time.sleep(2.0) # Monitoring only: frames are consumed for the VAD, nothing is kept aside
+        assert recorder.current_mic_rms > 0.1 and recorder.current_sys_rms > 0.05
+        recorder.start_recording(include_preroll=True)
+        time.sleep(1.0)
+        filename = recorder.stop_recording()
+    finally:
+        recorder.stop_listening()
+
+    audio, rate = sf.read(filename, dtype="float32")
+    print(f"Recorded {len(audio) / rate:.2f}s with pre-roll")
+    assert len(audio) > 1.8 * rate
+    # Mic and loopback are both in the pre-roll, and it joins the live audio without a gap
+    assert np.abs(audio[:rate]).max() > 0.25
+    slope = 2 * np.pi * (0.2 * 440 + 0.1 * 220) / SAMPLERATE
+    assert np.abs(np.diff(audio)).max() < 1.5 * slope
+
+
+def test_watchdog_restarts_stalled_streams():
+    recorder = AudioRecorder(output_dir=tempfile.mkdtemp(), samplerate=SAMPLERATE)
+    recorder._get_wasapi_loopback_device = lambda: 1
+    recorder.preroll_seconds = 0
+    recorder.stall_seconds = 0.5
+    recorder.set_device(0)
+    assert recorder.start_listening()
+    try:
+        recorder.start_recording()
+        time.sleep(1.0)
+        writer = recorder.writer_thread
+
+        # A loopback with nothing playing delivers no audio but is not stalled
+        dead_sys = recorder.sys_stream
+        dead_sys.stalled = True
+        time.sleep(1.5)
+        stats = recorder.get_capture_stats()
+        assert stats["sys"]["stalls"] == 0, stats["sys"]
+        assert recorder.sys_stream is dead_sys
+
+        dead_sys.active = False # Stopped by PortAudio, e.g. the device went away
+        time.sleep(2.0)
+        stats = recorder.get_capture_stats()
+        assert stats["sys"]["restarts"] == 1, stats["sys"]
+        assert recorder.sys_stream is not dead_sys
+
+        dead_mic = recorder.mic_stream
+        dead_mic.stalled = True
+        time.sleep(2.0)
+        stats = recorder.get_capture_stats()
+        assert stats["mic"]["restarts"] == 1, stats["mic"]
+        assert recorder.mic_stream is not dead_mic
+        assert recorder.writer_thread is writer and writer.is_alive()
+        assert stats["writer"]["lag_seconds"] < 0.5
+        assert stats["writer"]["bytes_written"] > 0
+
+        time.sleep(0.5)
+        filename = recorder.stop_recording()
+    finally:
+        recorder.stop_listening()
+
+    audio, rate = sf.read(filename, dtype="float32")
+    # Mic and loopback are both back in the mix at the end of the recording
+    tail = audio[-rate // 4:]
+    print(f"Recorded {len(audio) / rate:.2f}s; tail peak {np.abs(tail).max():.3f}")
+    assert np.abs(tail).max() > 0.25
+
+
+if __name__ == "__main__":
+    test_switch_mic_mid_recording()
+    test_streams_are_only_reopened_when_settings_change()
+    test_preroll_is_replayed_from_the_rings()
+    test_watchdog_restarts_stalled_streams()
+    print("OK")
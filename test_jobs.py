@@ -0,0 +1,174 @@
+"""
+Test the processing queue against a throwaway database.
+
+Checks that workers never run more than JOB_WORKERS jobs at once, that a
+failing job is retried until it runs out of attempts, that a job left
+"running" by a killed process is picked up again once its lease expires (or
+reported failed if that was its last attempt), and
+that a failure the LLM provider reports as text fails the attempt instead of
+being saved as the summary.
+
+Runs without the server: python test_jobs.py (or under pytest).
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app.database as database
+from app import jobs
+from app.processing import process_meeting, processing_failed
+
+
+def _fresh_db():
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(), "meetings.db")
+    database.init_db()
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_concurrency_is_limited():
+    _fresh_db()
+    running, peak, done = [0], [0], []
+    lock = threading.Lock()
+
+    def handler(path):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+            done.append(path)
+
+    pool = jobs.JobWorkerPool(handler, workers=3, lease_seconds=5)
+    for i in range(20):
+        pool.submit(f"recordings/upload_{i}.wav")
+    pool.start()
+    try:
+        _wait_for(lambda: len(done) == 20)
+    finally:
+        pool.stop()
+    assert peak[0] == 3
+    assert sorted(done) == sorted(f"recordings/upload_{i}.wav" for i in range(20))
+    assert jobs.job_counts()[jobs.DONE] == 20
+
+
+def test_failed_jobs_are_retried_then_given_up():
+    _fresh_db()
+    calls, failed = [], []
+
+    def handler(path):
+        calls.append(path)
+        raise RuntimeError("LLM unavailable")
+
+    pool = jobs.JobWorkerPool(handler, workers=1, lease_seconds=5,
+                              on_failed=lambda path, error: failed.append((path, error)))
+    job_id = pool.submit("recordings/meeting.wav")
+    pool.start()
+    try:
+        _wait_for(lambda: failed)
+    finally:
+        pool.stop()
+    job = jobs.get_job(job_id)
+    assert len(calls) == job["max_attempts"] == job["attempts"]
+    assert job["state"] == jobs.FAILED
+    assert failed == [("recordings/meeting.wav", "RuntimeError: LLM unavailable")]
+
+
+def test_job_interrupted_on_last_attempt_is_reported():
+    _fresh_db()
+    database.add_meeting(filename="meeting.wav", created_at="2024-01-01 10:00:00", duration=60,
+                         summary_text="Processing...", title="Meeting")
+    job_id = jobs.enqueue_job("recordings/meeting.wav", max_attempts=1)
+    assert jobs.claim_job("dead-host:1:0", lease_seconds=0.3)["id"] == job_id
+    time.sleep(0.4)
+
+    calls = []
+    pool = jobs.JobWorkerPool(calls.append, workers=1, lease_seconds=5, on_failed=processing_failed)
+    pool.start()
+    try:
+        _wait_for(lambda: jobs.get_job(job_id)["state"] == jobs.FAILED)
+        _wait_for(lambda: database.get_meeting("meeting.wav")["summary_text"] != "Processing...")
+    finally:
+        pool.stop()
+    assert calls == [] # Not run again
+    assert database.get_meeting("meeting.wav")["summary_text"] == "Processing failed: Interrupted"
+
+
+def test_interrupted_job_resumes_after_lease_expires():
+    _fresh_db()
+    job_id = jobs.enqueue_job("recordings/meeting.wav")
+    # A worker of a process that then died
+    assert jobs.claim_job("dead-host:1:0", lease_seconds=0.3)["id"] == job_id
+    assert jobs.claim_job("other:2:0", lease_seconds=5) is None # Still leased
+
+    done = []
+    pool = jobs.JobWorkerPool(done.append, workers=1, lease_seconds=5)
+    pool.start()
+    try:
+        _wait_for(lambda: done)
+    finally:
+        pool.stop()
+    job = jobs.get_job(job_id)
+    assert done == ["recordings/meeting.wav"]
+    assert job["state"] == jobs.DONE and job["attempts"] == 2
+
+
+class FlakyProvider:
+    """Fails like GeminiProvider does when a window of a long meeting runs out of retries, then succeeds."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def process_audio(self, audio_path, prompt=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return "Error processing meeting after 3 attempts: Deadline Exceeded"
+        return '{"title": "Budget Review", "tags": ["budget"], "summary": "# Meeting Summary"}'
+
+
+def test_provider_error_is_retried():
+    _fresh_db()
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "meeting_20240101_100000.wav")
+    sf.write(path, np.zeros(16000 * 5, dtype=np.float32), 16000)
+    provider = FlakyProvider(failures=1)
+
+    cwd = os.getcwd()
+    os.chdir(folder) # process_meeting writes debug_log.txt to the working directory
+    pool = jobs.JobWorkerPool(lambda p: process_meeting(p, provider), workers=1, lease_seconds=5,
+                              on_failed=processing_failed)
+    job_id = pool.submit(path)
+    pool.start()
+    try:
+        _wait_for(lambda: jobs.get_job(job_id)["state"] in (jobs.DONE, jobs.FAILED))
+    finally:
+        pool.stop()
+        os.chdir(cwd)
+    job = jobs.get_job(job_id)
+    assert provider.calls == 2
+    assert job["state"] == jobs.DONE and job["attempts"] == 2
+    meeting = database.get_meeting(os.path.basename(path))
+    assert meeting["title"] == "Budget Review" and meeting["summary_text"] == "# Meeting Summary"
+
+
+if __name__ == "__main__":
+    test_concurrency_is_limited()
+    test_failed_jobs_are_retried_then_given_up()
+    test_interrupted_job_resumes_after_lease_expires()
+    test_job_interrupted_on_last_attempt_is_reported()
+    test_provider_error_is_retried()
+    print("OK")
@@ -0,0 +1,41 @@
+"""
+Test the timestamp rewriting that points the model's timestamps back at the
+original recording after dead air was trimmed or the audio was cut into
+windows (app/trim.py).
+
+Runs without the server: python test_trim.py (or under pytest).
+"""
+
+import json
+import os
+import sys
+import tempfile
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.trim import shift_timestamps, remap_timestamps, offset_map_path
+
+
+def test_shift_rewrites_markers_only():
+    text = "Budget approved [02:30]. Follow-up meeting at 14:00, call at 9:15."
+    assert shift_timestamps(text, 600, 1200) == "Budget approved [12:30]. Follow-up meeting at 14:00, call at 9:15."
+    assert shift_timestamps("[59:50] wrap-up", 30, 3600) == "[1:00:20] wrap-up"
+
+
+def test_remap_to_original_recording():
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "meeting.wav")
+    sf.write(path, np.zeros(16000 * 120, dtype=np.float32), 16000)
+    # 30s of dead air were cut after the first minute
+    with open(offset_map_path(path), "w", encoding="utf-8") as f:
+        json.dump({"duration": 120.0, "kept": [[0.0, 60.0], [90.0, 120.0]]}, f)
+    text = "Intro [00:30], decision [01:10] (standup at 10:30)."
+    assert remap_timestamps(text, path) == "Intro [00:30], decision [01:40] (standup at 10:30)."
+
+
+if __name__ == "__main__":
+    test_shift_rewrites_markers_only()
+    test_remap_to_original_recording()
+    print("OK")